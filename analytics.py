@@ -0,0 +1,531 @@
+import json
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+from contextlib import closing
+
+import numpy as np
+
+from model_router import MODEL_PRICES
+from tenants import DEFAULT_TENANT_ID, default_tenant, load_tenants
+
+# Source files in the data directory, as boj2 names them
+ARCHIVE_NAME = "archive.jsonl"
+TRACE_NAME = "traces.jsonl"
+LEDGER_NAME = "usage.sqlite"
+
+# Columnar copy of the sources, rebuilt whenever one of them is newer
+CACHE_NAME = "analytics.npz"
+
+# Latency percentile the style report ranks by
+LATENCY_PCT = 95
+
+# Rows shown at each end of the representation reports
+REPORT_ROWS = 5
+
+EXPORT_FORMATS = ("parquet", "arrow", "npz")
+
+
+def _column(values, dtype):
+    return np.array(values, dtype=dtype) if values else np.zeros(0, dtype=dtype)
+
+
+def edition_table(editions):
+    """
+    Returns:
+        dict: Column name -> array, one row per archived edition.
+    """
+    return {
+        "edition_id": _column([e.get("edition_id") or "" for e in editions], str),
+        "created": _column([e.get("created") or 0.0 for e in editions], np.float64),
+        "tenant": _column([e.get("tenant", DEFAULT_TENANT_ID) for e in editions], str),
+        "theme": _column([e.get("theme") or "" for e in editions], str),
+        "chapter_number": _column([e.get("chapter_number") or 0 for e in editions], np.int32),
+        "chapter_title": _column([e.get("chapter_title") or "" for e in editions], str),
+        "content_style": _column([e.get("content_style") or 0 for e in editions], np.int32),
+        "bro": _column([e.get("bro") or "" for e in editions], str),
+        "image_refused": _column([bool(e.get("image_refused")) for e in editions], bool),
+    }
+
+
+def trace_tables(traces):
+    """
+    Returns:
+        tuple: (runs table, spans table), each a dict of column name -> array.
+    """
+    runs = {
+        "run_id": _column([t["run_id"] for t in traces], str),
+        "started": _column([t["started"] for t in traces], np.float64),
+        "seconds": _column([t["seconds"] for t in traces], np.float64),
+    }
+    spans = [(t["run_id"], s) for t in traces for s in t["spans"]]
+    spans = {
+        "run_id": _column([run_id for run_id, _ in spans], str),
+        "stage": _column([s["stage"] for _, s in spans], str),
+        "start": _column([s.get("start", 0.0) for _, s in spans], np.float64),
+        "seconds": _column([s["seconds"] for _, s in spans], np.float64),
+        "error": _column(["error" in s for _, s in spans], bool),
+    }
+    return runs, spans
+
+
+def call_table(ledger_path):
+    """
+    Returns:
+        dict: Column name -> array, one row per call in the usage ledger, priced like model_router.call_cost
+            (NaN for models without a price).
+    """
+    columns = ("time", "stage", "model", "prompt_tokens", "completion_tokens", "cached_tokens", "seconds")
+    rows = []
+    if os.path.exists(ledger_path):
+        with closing(sqlite3.connect(ledger_path, timeout=30)) as db:
+            rows = db.execute(f"SELECT {', '.join(columns)} FROM calls ORDER BY time").fetchall()
+    data = list(zip(*rows)) if rows else [()] * len(columns)
+    calls = {
+        "time": _column(list(data[0]), np.float64),
+        "stage": _column(list(data[1]), str),
+        "model": _column(list(data[2]), str),
+        "prompt_tokens": _column(list(data[3]), np.int64),
+        "completion_tokens": _column(list(data[4]), np.int64),
+        "cached_tokens": _column(list(data[5]), np.int64),
+        "seconds": _column(list(data[6]), np.float64),
+    }
+    models, model_codes = np.unique(calls["model"], return_inverse=True)
+    prices = np.array([MODEL_PRICES.get(m, (np.nan, np.nan)) for m in models], dtype=np.float64).reshape(-1, 2)
+    calls["cost"] = (calls["prompt_tokens"] * prices[model_codes, 0]
+                     + calls["completion_tokens"] * prices[model_codes, 1]) / 1e6
+    return calls
+
+
+def _read_jsonl(path):
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        continue
+    except OSError:
+        pass
+    return records
+
+
+def build_tables(data_dir):
+    """
+    Reads the archive, traces and usage ledger in a data directory into columns.
+
+    Returns:
+        dict: Table name ("editions", "runs", "spans", "calls") -> columns.
+    """
+    runs, spans = trace_tables(_read_jsonl(os.path.join(data_dir, TRACE_NAME)))
+    return {
+        "editions": edition_table(_read_jsonl(os.path.join(data_dir, ARCHIVE_NAME))),
+        "runs": runs,
+        "spans": spans,
+        "calls": call_table(os.path.join(data_dir, LEDGER_NAME)),
+    }
+
+
+def save_tables(tables, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    arrays = {f"{name}/{column}": values for name, table in tables.items() for column, values in table.items()}
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(path + ".tmp", path)
+
+
+def read_tables(path):
+    tables = {}
+    with np.load(path) as data:
+        for key in data.files:
+            name, column = key.split("/")
+            tables.setdefault(name, {})[column] = data[key]
+    return tables
+
+
+def load_tables(data_dir):
+    """
+    Loads the columnar cache, rebuilding it first if the archive, traces or
+    ledger have changed since.
+
+    Returns:
+        dict: Table name -> columns.
+    """
+    cache_path = os.path.join(data_dir, CACHE_NAME)
+    sources = [os.path.join(data_dir, name) for name in (ARCHIVE_NAME, TRACE_NAME, LEDGER_NAME, LEDGER_NAME + "-wal")]
+    newest = max((os.path.getmtime(p) for p in sources if os.path.exists(p)), default=0)
+    if os.path.exists(cache_path) and os.path.getmtime(cache_path) >= newest:
+        return read_tables(cache_path)
+    tables = build_tables(data_dir)
+    save_tables(tables, cache_path)
+    return tables
+
+
+def export_tables(tables, out_dir, fmt=None):
+    """
+    Writes each table to its own file for pandas, DuckDB, Spark and the like.
+
+    Args:
+        tables (dict): Table name -> columns.
+        out_dir (str): Where the files go.
+        fmt (str): "parquet", "arrow" (Feather v2) or "npz"; None for Parquet if pyarrow is installed, else npz.
+
+    Returns:
+        list: The files written.
+    """
+    if fmt is None:
+        try:
+            import pyarrow  # noqa: F401
+            fmt = "parquet"
+        except ImportError:
+            print("---- pyarrow is not installed, exporting npz ----")
+            fmt = "npz"
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Invalid format. Please use one of {', '.join(EXPORT_FORMATS)}.")
+
+    os.makedirs(out_dir, exist_ok=True)
+    written = []
+    for name, table in tables.items():
+        path = os.path.join(out_dir, f"{name}.{fmt}")
+        if fmt == "npz":
+            with open(path, "wb") as f:
+                np.savez_compressed(f, **table)
+        else:
+            import pyarrow as pa
+            arrow_table = pa.table({column: pa.array(values) for column, values in table.items()})
+            if fmt == "parquet":
+                import pyarrow.parquet as pq
+                pq.write_table(arrow_table, path)
+            else:
+                import pyarrow.feather as feather
+                feather.write_feather(arrow_table, path)
+        written.append(path)
+    return written
+
+
+def group_percentile(groups, values, pct, size):
+    """
+    Nearest-rank percentile of `values` within each group, as image_policy.percentile does for one list.
+
+    Args:
+        groups (np.ndarray): Group index (0..size-1) of each value.
+        values (np.ndarray): The values.
+        pct (float): The percentile.
+        size (int): Number of groups.
+
+    Returns:
+        tuple: (percentile per group, NaN where empty; count per group)
+    """
+    counts = np.bincount(groups, minlength=size)
+    ordered = values[np.lexsort((values, groups))]
+    starts = np.cumsum(counts) - counts
+    ranks = np.clip(np.round(pct / 100 * counts).astype(np.int64) - 1, 0, np.maximum(counts - 1, 0))
+    result = np.full(size, np.nan)
+    present = counts > 0
+    result[present] = ordered[starts[present] + ranks[present]]
+    return result, counts
+
+
+def representation(editions, column, labels):
+    """
+    How often each label came up next to a uniform draw from the book's list,
+    which is how plan_edition picks themes and chapters.
+
+    Args:
+        editions (dict): The editions table, already filtered to one book.
+        column (str): "theme" or "chapter_title".
+        labels (list): The book's list for that column.
+
+    Returns:
+        list: (label, observed, expected, observed / expected, z-score) by descending z-score.
+            Labels no longer in the book are included with an expected count of 0.
+    """
+    values = editions[column]
+    known = np.array(labels, dtype=str)
+    names, counts = np.unique(np.concatenate([known, values]), return_counts=True)
+    in_book = np.isin(names, known)
+    observed = counts - in_book
+    p = np.where(in_book, 1 / max(1, len(known)), 0.0)
+    expected = len(values) * p
+    with np.errstate(divide="ignore", invalid="ignore"):
+        unexpected = np.where(observed > 0, np.inf, np.nan)
+        ratio = np.where(expected > 0, observed / expected, unexpected)
+        z = np.where(expected > 0, (observed - expected) / np.sqrt(expected * (1 - p)), unexpected)
+    order = np.argsort(-z, kind="stable")
+    return [(str(names[i]), int(observed[i]), float(expected[i]), float(ratio[i]), float(z[i])) for i in order]
+
+
+def bro_rates(editions, tenant):
+    """
+    Each bro's appearances next to their eligibility: an edition is eligible
+    for a bro when its chapter's bro_list names them, and plan_edition then
+    picks each listed bro with equal chance.
+
+    Args:
+        editions (dict): The editions table, already filtered to the tenant.
+        tenant (dict): The book.
+
+    Returns:
+        list: (bro name, eligible editions, appearances, appearance rate when eligible, expected rate)
+    """
+    activities = tenant["activities_list"]
+    keys = list(tenant["bro_dict"])
+    names = np.array([tenant["bro_dict"][k].get("name", k) for k in keys], dtype=str)
+    eligible = np.zeros((len(activities), len(keys)), dtype=np.float64)
+    for row, activity in enumerate(activities):
+        for bro in activity.get("bro_list") or []:
+            eligible[row, keys.index(bro)] = 1.0
+    share = eligible / np.maximum(1.0, eligible.sum(axis=1, keepdims=True))
+
+    chapters = editions["chapter_number"] - 1
+    in_book = (chapters >= 0) & (chapters < len(activities))
+    chapter_counts = np.bincount(chapters[in_book], minlength=len(activities)).astype(np.float64)
+    eligible_editions = chapter_counts @ eligible
+    expected = chapter_counts @ share
+
+    order = np.argsort(names)
+    position = np.searchsorted(names[order], editions["bro"])
+    position = np.minimum(position, len(names) - 1)
+    matched = (names[order][position] == editions["bro"]) & in_book if len(names) else np.zeros(0, dtype=bool)
+    appearances = np.bincount(order[position[matched]], minlength=len(names)) if len(names) else np.zeros(0)
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rate = np.where(eligible_editions > 0, appearances / eligible_editions, np.nan)
+        expected_rate = np.where(eligible_editions > 0, expected / eligible_editions, np.nan)
+    return [(str(names[i]), int(eligible_editions[i]), int(appearances[i]), float(rate[i]), float(expected_rate[i]))
+            for i in range(len(names))]
+
+
+def style_latency(editions, runs, spans, pct=LATENCY_PCT):
+    """
+    Run and stage latency percentiles per content style. Traces are joined
+    to editions by run id; digest runs, which have no single style, are left out.
+
+    Returns:
+        list: (content style, runs, p50 run seconds, pct run seconds, slowest stage at pct, its seconds)
+            by descending pct run seconds.
+    """
+    ids = editions["edition_id"]
+    order = np.argsort(ids)
+    sorted_ids = ids[order]
+
+    def styles_of(run_ids):
+        if not len(sorted_ids):
+            return np.zeros(len(run_ids), dtype=np.int32)
+        position = np.minimum(np.searchsorted(sorted_ids, run_ids), len(sorted_ids) - 1)
+        found = sorted_ids[position] == run_ids
+        return np.where(found, editions["content_style"][order[position]], 0)
+
+    run_styles = styles_of(runs["run_id"])
+    span_styles = styles_of(spans["run_id"])
+    size = int(max(run_styles.max(initial=0), span_styles.max(initial=0))) + 1
+
+    p50, counts = group_percentile(run_styles, runs["seconds"], 50, size)
+    high, _ = group_percentile(run_styles, runs["seconds"], pct, size)
+
+    stages, stage_codes = np.unique(spans["stage"], return_inverse=True)
+    stage_high, stage_counts = group_percentile(span_styles * len(stages) + stage_codes, spans["seconds"], pct,
+                                                size * max(1, len(stages)))
+    stage_high = stage_high.reshape(size, -1)
+
+    rows = []
+    for style in np.flatnonzero(counts[1:]) + 1:
+        slowest = np.nanargmax(stage_high[style]) if np.isfinite(stage_high[style]).any() else None
+        rows.append((int(style), int(counts[style]), float(p50[style]), float(high[style]),
+                     str(stages[slowest]) if slowest is not None else "-",
+                     float(stage_high[style, slowest]) if slowest is not None else float("nan")))
+    return sorted(rows, key=lambda row: -row[3])
+
+
+def _months(timestamps):
+    return timestamps.astype("datetime64[s]").astype("datetime64[M]")
+
+
+def monthly_cost(calls, editions):
+    """
+    Spend per calendar month (UTC) from the usage ledger, per edition
+    published that month, and the change from the month before.
+
+    Returns:
+        list: (month, calls, cost, unpriced calls, editions, cost per edition, change from previous month)
+    """
+    call_months = _months(calls["time"])
+    edition_months = _months(editions["created"])
+    months, codes = np.unique(call_months, return_inverse=True)
+    priced = np.isfinite(calls["cost"])
+    cost = np.bincount(codes, weights=np.where(priced, calls["cost"], 0.0), minlength=len(months))
+    call_counts = np.bincount(codes, minlength=len(months))
+    unpriced = np.bincount(codes, weights=~priced, minlength=len(months))
+    edition_counts = np.searchsorted(np.sort(edition_months), months, side="right") \
+        - np.searchsorted(np.sort(edition_months), months, side="left")
+    with np.errstate(divide="ignore", invalid="ignore"):
+        per_edition = np.where(edition_counts > 0, cost / edition_counts, np.nan)
+        change = np.concatenate([[np.nan], np.where(cost[:-1] > 0, cost[1:] / cost[:-1] - 1, np.nan)])
+    return [(str(months[i]), int(call_counts[i]), float(cost[i]), int(unpriced[i]), int(edition_counts[i]),
+             float(per_edition[i]), float(change[i])) for i in range(len(months))]
+
+
+def book_editions(editions, tenant_id):
+    """
+    Returns:
+        dict: The editions table filtered to one book.
+    """
+    keep = editions["tenant"] == tenant_id
+    return {column: values[keep] for column, values in editions.items()}
+
+
+def print_report(tables, tenant):
+    """
+    Prints theme and chapter representation, bro rates and style latency
+    for a book, and month-over-month cost for the whole ledger.
+    """
+    editions = book_editions(tables["editions"], tenant["id"])
+    print(f"{tenant['book_title']}: {len(editions['edition_id'])} editions")
+
+    for column, labels, title in (("theme", tenant["emotions"], "theme"),
+                                  ("chapter_title", [a["chapter_title"] for a in tenant["activities_list"]], "chapter")):
+        rows = representation(editions, column, labels)
+        shown = rows if len(rows) <= 2 * REPORT_ROWS else rows[:REPORT_ROWS] + rows[-REPORT_ROWS:]
+        print()
+        print(f"{title:<22}  observed  expected  ratio      z")
+        for label, observed, expected, ratio, z in shown:
+            print(f"{label[:22]:<22}  {observed:8d}  {expected:8.1f}  {ratio:5.2f}  {z:5.1f}")
+
+    print()
+    print("bro         eligible  appeared  rate  expected")
+    for name, eligible, appeared, rate, expected in bro_rates(editions, tenant):
+        if not eligible:
+            print(f"{name[:10]:<10}  {eligible:8d}  {appeared:8d}  {'-':>4}  {'-':>8}")
+            continue
+        print(f"{name[:10]:<10}  {eligible:8d}  {appeared:8d}  {rate:4.2f}  {expected:8.2f}")
+
+    print()
+    print(f"style  runs  p50 s  p{LATENCY_PCT} s  slowest stage at p{LATENCY_PCT}")
+    for style, runs, p50, high, stage, stage_seconds in style_latency(tables["editions"], tables["runs"],
+                                                                      tables["spans"]):
+        print(f"{style:5d}  {runs:4d}  {p50:5.1f}  {high:5.1f}  {stage} ({stage_seconds:.1f}s)")
+
+    print()
+    print("month    calls    cost  unpriced  editions  $/edition  change")
+    for month, calls, cost, unpriced, count, per_edition, change in monthly_cost(tables["calls"], tables["editions"]):
+        change = f"{change:+6.1%}" if np.isfinite(change) else f"{'-':>6}"
+        print(f"{month}  {calls:5d}  {cost:6.2f}  {unpriced:8d}  {count:8d}  {per_edition:9.3f}  {change}")
+
+
+def configured_tenants():
+    """
+    Returns:
+        dict: Tenant id -> tenant, from keys.py if there is one.
+    """
+    try:
+        import keys
+    except ImportError:
+        return {DEFAULT_TENANT_ID: default_tenant()}
+    return load_tenants(getattr(keys, "tenants", []), default_tenant(getattr(keys, "img_path", None)))
+
+
+def write_synthetic_history(data_dir, years=10, tenants=3, seed=0):
+    """
+    Writes `years` of daily editions per book, their traces and ledger calls
+    into a data directory, shaped like the real files.
+    """
+    import catalog
+    rng = np.random.default_rng(seed)
+    stages = ["plan", "story", "validate", "image_prompt", "preflight", "image", "upload", "cocktail", "transcode",
+              "slack", "delivery"]
+    start = time.time() - years * 365 * 86400
+    editions, traces, calls = [], [], []
+    for day in range(years * 365):
+        for book in range(tenants):
+            created = start + day * 86400 + book * 60
+            edition_id = f"{time.strftime('%Y%m%d-%H%M%S', time.gmtime(created))}-{book:04x}"
+            activity_number = int(rng.integers(len(catalog.activities_list)))
+            activity = catalog.activities_list[activity_number]
+            bros = activity["bro_list"]
+            style = int(rng.integers(1, 7))
+            editions.append({
+                "edition_id": edition_id, "tenant": "john" if book == 0 else f"book{book}", "created": created,
+                "theme": catalog.emotions[int(rng.integers(len(catalog.emotions)))],
+                "chapter_number": activity_number + 1, "chapter_title": activity["chapter_title"],
+                "activity": activity["activity"], "content_style": style,
+                "bro": catalog.bro_dict[bros[int(rng.integers(len(bros)))]]["name"] if bros else None,
+                "story": "John did a thing. " * 20, "image_refused": bool(rng.random() < 0.05),
+            })
+            spans = [{"stage": stage, "start": float(i), "seconds": float(rng.gamma(2, 20 if stage == "image" else 2))
+                      * (1.5 if style == 1 and stage == "story" else 1)} for i, stage in enumerate(stages)]
+            traces.append({"run_id": edition_id, "started": created, "seconds": sum(s["seconds"] for s in spans),
+                           "spans": spans, "decisions": {}})
+            for stage in ("story", "image_prompt", "cocktail", "image"):
+                calls.append((created, stage, "gpt-4.1-mini", int(rng.integers(800, 2000)),
+                              int(rng.integers(100, 600)), 0, float(rng.gamma(2, 3))))
+
+    os.makedirs(data_dir, exist_ok=True)
+    for name, records in ((ARCHIVE_NAME, editions), (TRACE_NAME, traces)):
+        with open(os.path.join(data_dir, name), "w") as f:
+            f.writelines(json.dumps(r) + "\n" for r in records)
+    from usage_ledger import UsageLedger
+    ledger = UsageLedger(os.path.join(data_dir, LEDGER_NAME))
+    with closing(ledger._connect()) as db:
+        db.execute("BEGIN")
+        db.executemany(
+            "INSERT INTO calls (time, day, stage, model, prompt_tokens, completion_tokens, cached_tokens, seconds) "
+            "VALUES (?, date(?, 'unixepoch'), ?, ?, ?, ?, ?, ?)",
+            [(c[0], c[0]) + c[1:] for c in calls])
+        db.execute("COMMIT")
+        db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    return len(editions), sum(len(t["spans"]) for t in traces), len(calls)
+
+
+def run_benchmark(years=10):
+    """
+    Times building the columnar cache from synthetic history, then loading
+    it and computing every report, which is what an interactive run does.
+    """
+    tenant = default_tenant()
+    with tempfile.TemporaryDirectory() as data_dir:
+        editions, spans, calls = write_synthetic_history(data_dir, years)
+        print(f"{years} years: {editions} editions, {spans} spans, {calls} calls")
+
+        start = time.perf_counter()
+        load_tables(data_dir)
+        print(f"build cache: {time.perf_counter() - start:.2f}s")
+
+        start = time.perf_counter()
+        tables = load_tables(data_dir)
+        loaded = time.perf_counter() - start
+        book = book_editions(tables["editions"], tenant["id"])
+        representation(book, "theme", tenant["emotions"])
+        representation(book, "chapter_title", [a["chapter_title"] for a in tenant["activities_list"]])
+        bro_rates(book, tenant)
+        style_latency(tables["editions"], tables["runs"], tables["spans"])
+        monthly_cost(tables["calls"], tables["editions"])
+        print(f"load cache: {loaded * 1000:.0f} ms, load + all reports: {(time.perf_counter() - start) * 1000:.0f} ms")
+
+        start = time.perf_counter()
+        written = export_tables(tables, os.path.join(data_dir, "export"))
+        print(f"export: {time.perf_counter() - start:.2f}s, "
+              f"{sum(os.path.getsize(p) for p in written) / 1e6:.1f} MB in {len(written)} files")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        run_benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10)
+    elif len(sys.argv) > 3 and sys.argv[1] == "export":
+        for path in export_tables(load_tables(sys.argv[2]), sys.argv[3], sys.argv[4] if len(sys.argv) > 4 else None):
+            print(path)
+    elif len(sys.argv) > 1:
+        tenants = configured_tenants()
+        tenant_id = sys.argv[sys.argv.index("--tenant") + 1] if "--tenant" in sys.argv else DEFAULT_TENANT_ID
+        if tenant_id not in tenants:
+            print(f"Unknown tenant {tenant_id!r}. Configured: {', '.join(tenants)}")
+            sys.exit(1)
+        print_report(load_tables(sys.argv[1]), tenants[tenant_id])
+    else:
+        print("usage: python analytics.py <data dir> [--tenant <id>] | export <data dir> <out dir> "
+              "[parquet|arrow|npz] | bench [years]")
+        sys.exit(1)
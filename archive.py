@@ -0,0 +1,78 @@
+import json
+import os
+import random
+import time
+
+from tenants import DEFAULT_TENANT_ID
+
+
+def new_edition_id():
+    """
+    Returns:
+        str: A sortable, unique id for a new edition, e.g. "20250101-070000-3fa2".
+    """
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{random.getrandbits(16):04x}"
+
+
+def append_edition(path, edition):
+    """
+    Appends one edition to the JSON-lines archive.
+
+    Args:
+        path (str): The archive file.
+        edition (dict): The edition record.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "a") as f:
+        f.write(json.dumps(edition) + "\n")
+
+
+def load_editions(path, limit=None, tenant_id=None):
+    """
+    Loads archived editions, oldest first.
+
+    A line that isn't valid JSON (e.g. one cut short by a crash mid-append)
+    is skipped rather than losing the whole archive.
+
+    Args:
+        path (str): The archive file.
+        limit (int): Only return the most recent `limit` editions.
+        tenant_id (str): Only return this book's editions, or None for every book's.
+
+    Returns:
+        list: The edition dicts.
+    """
+    editions = []
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    edition = json.loads(line)
+                except ValueError:
+                    continue
+                if tenant_id is None or edition.get("tenant", DEFAULT_TENANT_ID) == tenant_id:
+                    editions.append(edition)
+    except OSError:
+        return []
+    if limit is not None:
+        return editions[-limit:]
+    return editions
+
+
+def recent_stories(path, limit=30, tenant_id=None):
+    """
+    Returns:
+        list: The story text of the most recent `limit` editions (of one book, if `tenant_id` is given).
+    """
+    return [e["story"] for e in load_editions(path, limit, tenant_id) if e.get("story")]
+
+
+def recent_image_hashes(path, limit=30, tenant_id=None):
+    """
+    Returns:
+        list: The perceptual image hash of the most recent `limit` editions (of one book, if `tenant_id` is given).
+    """
+    return [e["image_hash"] for e in load_editions(path, limit, tenant_id) if e.get("image_hash")]
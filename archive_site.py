@@ -0,0 +1,545 @@
+import hashlib
+import html
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+
+import catalog
+from tenants import DEFAULT_TENANT_ID
+
+# Bump when a template changes, so every page is rendered again
+SITE_VERSION = 1
+
+# Editions on the front page and on each book's page
+RECENT_EDITIONS = 30
+
+# Characters of story shown on an edition's card
+EXCERPT_CHARS = 160
+
+# Pages or images handed to a worker at a time; smaller builds are done in-process
+CHUNK_SIZE = 250
+
+# As boj2.CONTENT_STYLES, for records archived before the style name was
+STYLE_NAMES = {
+    1: "Verses",
+    2: "Psalm",
+    3: "Proverbial Selections",
+    4: "Parable",
+    5: "Poetic Addendum",
+    6: "John's Jests",
+}
+
+# Build state: a small header checked first, and the cards and page hashes
+STATE_NAME = ".build.json"
+INDEX_NAME = ".build-index.json"
+
+# mkstemp files are private to their owner; the site is served to everyone
+FILE_MODE = 0o644
+
+# Bytes before the last read offset that must be unchanged to only read what was appended since
+_TAIL_BYTES = 4096
+
+_SLUG_RE = re.compile(r"[^a-z0-9]+")
+
+CSS = """body{font-family:Georgia,serif;max-width:60rem;margin:2rem auto;padding:0 1rem;color:#222;background:#fdfbf6}
+a{color:#6b3d12}nav{font-size:.9rem;margin-bottom:1rem}h1{font-size:1.8rem}
+.cards{display:grid;grid-template-columns:repeat(auto-fill,minmax(14rem,1fr));gap:1rem;padding:0;list-style:none}
+.card{background:#fff;border:1px solid #e4dccb;border-radius:6px;padding:.6rem}
+.card img{width:100%;height:auto;border-radius:4px}.card p{font-size:.85rem;margin:.3rem 0}
+.meta{color:#776;font-size:.85rem}.story,.recipe{white-space:pre-wrap;line-height:1.5}
+.recipe{background:#fff;border-left:3px solid #c9a96e;padding:.6rem 1rem}
+.edition img{max-width:100%;height:auto}.counts li{display:inline-block;margin:0 1rem .3rem 0}
+"""
+
+
+def slug(text):
+    return _SLUG_RE.sub("-", str(text).lower()).strip("-") or "untitled"
+
+
+def record_hash(edition):
+    return hashlib.sha1(json.dumps(edition, sort_keys=True).encode()).hexdigest()
+
+
+def make_card(edition):
+    """
+    The part of an edition the listing pages show, kept in the build state
+    so listings can be rebuilt without re-reading the whole archive.
+
+    Returns:
+        dict: The card.
+    """
+    content_style = edition.get("content_style")
+    image_files = edition.get("image_files") or {}
+    story = edition.get("story") or ""
+    return {
+        "id": edition["edition_id"],
+        "hash": record_hash(edition),
+        "tenant": edition.get("tenant", DEFAULT_TENANT_ID),
+        "book_title": edition.get("book_title", catalog.book_title),
+        "chapter_number": edition.get("chapter_number"),
+        "chapter_title": edition.get("chapter_title"),
+        "theme": edition.get("theme"),
+        "content_style": content_style,
+        "style_name": edition.get("style_name", STYLE_NAMES.get(content_style, "Edition")),
+        "created": edition.get("created"),
+        "bro": edition.get("bro"),
+        "excerpt": story[:EXCERPT_CHARS] + ("…" if len(story) > EXCERPT_CHARS else ""),
+        "image": image_files.get("compact") or image_files.get("original"),
+        "thumbnail": image_files.get("thumbnail"),
+        "image_sha": edition.get("image_sha"),
+    }
+
+
+def read_archive(path, state):
+    """
+    Reads the archive, only from where the last build stopped if everything
+    before that is unchanged (the archive is append-only).
+
+    Returns:
+        tuple: (records read, whether that is the whole archive, new archive state)
+    """
+    previous = state.get("archive") or {}
+    offset = previous.get("offset", 0)
+    records = []
+    if not os.path.exists(path):
+        return records, True, {"offset": 0, "tail": ""}
+    with open(path, "rb") as f:
+        size = os.fstat(f.fileno()).st_size
+        incremental = 0 < offset <= size and _tail_hash(f, offset) == previous.get("tail")
+        start = offset if incremental else 0
+        f.seek(start)
+        # A line still being written is left for the next build
+        data = f.read()
+        data = data[:data.rfind(b"\n") + 1]
+        end = start + len(data)
+        tail = _tail_hash(f, end)
+    for line in data.splitlines():
+        line = line.strip()
+        if line:
+            records.append(json.loads(line))
+    return records, not incremental, {"offset": end, "tail": tail}
+
+
+def _tail_hash(f, offset):
+    start = max(0, offset - _TAIL_BYTES)
+    f.seek(start)
+    return hashlib.sha1(f.read(offset - start)).hexdigest()
+
+
+def group_cards(cards):
+    """
+    Returns:
+        dict: Book id -> {"title", "editions", "chapter", "theme", "style"}, each
+            grouping mapping a key to its cards, newest first.
+    """
+    books = {}
+    for card in sorted(cards.values(), key=lambda c: (c["created"] or 0, c["id"]), reverse=True):
+        book = books.setdefault(card["tenant"], {
+            "title": card["book_title"], "editions": [], "chapter": {}, "theme": {}, "style": {},
+        })
+        book["editions"].append(card)
+        book["chapter"].setdefault(card["chapter_number"], []).append(card)
+        book["theme"].setdefault(card["theme"], []).append(card)
+        book["style"].setdefault(card["content_style"], []).append(card)
+    return books
+
+
+def plan_site(cards, touched=None):
+    """
+    Every page and image of the site with the hash of its inputs.
+
+    Args:
+        cards (dict): Edition id -> card, for the whole archive.
+        touched (set): Only plan the pages and images these editions appear
+            on (plus the index pages), or None for all of them.
+
+    Returns:
+        tuple: (page path -> (input hash, render task), asset path -> (source key, copy task))
+    """
+    pages = {}
+    assets = {}
+
+    def wanted(group):
+        return touched is None or any(c["id"] in touched for c in group)
+
+    def add_page(path, kind, title, page_cards=(), **extra):
+        inputs = [str(SITE_VERSION), kind, title, json.dumps(extra, sort_keys=True) if extra else ""]
+        digest = hashlib.sha1("|".join(inputs + [c["hash"] for c in page_cards]).encode()).hexdigest()
+        pages[path] = (digest, {"path": path, "kind": kind, "title": title, "cards": list(page_cards), **extra})
+
+    books = group_cards(cards)
+    add_page("index.html", "index", "Archive", [c for b in books.values() for c in b["editions"][:RECENT_EDITIONS]],
+             books=[(book_id, book["title"], len(book["editions"])) for book_id, book in sorted(books.items())])
+    for book_id, book in books.items():
+        chapters = sorted((n, cs[0]["chapter_title"], len(cs)) for n, cs in book["chapter"].items() if n is not None)
+        themes = sorted((t, len(cs)) for t, cs in book["theme"].items() if t)
+        styles = sorted((s, cs[0]["style_name"], len(cs)) for s, cs in book["style"].items() if s is not None)
+        add_page(f"{book_id}/index.html", "book", book["title"], book["editions"][:RECENT_EDITIONS],
+                 chapters=chapters, themes=themes, styles=styles)
+        for number, title, _ in chapters:
+            if wanted(book["chapter"][number]):
+                add_page(f"{book_id}/chapter-{number}.html", "list", f"Chapter {number}: {title}",
+                         book["chapter"][number], book=book["title"])
+        for theme, _ in themes:
+            if wanted(book["theme"][theme]):
+                add_page(f"{book_id}/theme-{slug(theme)}.html", "list", f"Book of {theme.capitalize()}",
+                         book["theme"][theme], book=book["title"])
+        for content_style, name, _ in styles:
+            if wanted(book["style"][content_style]):
+                add_page(f"{book_id}/style-{content_style}.html", "list", name, book["style"][content_style],
+                         book=book["title"])
+        for card in book["editions"]:
+            if touched is None or card["id"] in touched:
+                add_page(f"{book_id}/editions/{card['id']}.html", "edition", card["id"], [card])
+
+    for card in cards.values() if touched is None else [cards[i] for i in touched]:
+        if card["image"]:
+            ext = os.path.splitext(card["image"])[1]
+            assets[f"images/{card['id']}{ext}"] = (_source_key(card["image"], card["image_sha"]),
+                                                   {"kind": "copy", "source": card["image"]})
+        source = card["thumbnail"] or card["image"]
+        if source:
+            kind = "copy" if card["thumbnail"] else "thumbnail"
+            assets[f"thumbs/{card['id']}.jpg"] = (_source_key(source, None if card["thumbnail"] else card["image_sha"]),
+                                                  {"kind": kind, "source": source})
+    return pages, assets
+
+
+def _source_key(path, sha=None):
+    if sha:
+        return sha
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+def _link(path, depth):
+    return "../" * depth + path
+
+
+def _card_html(card, depth):
+    link = _link(f"{card['tenant']}/editions/{card['id']}.html", depth)
+    thumb = ""
+    if card["thumbnail"] or card["image"]:
+        src = _link(f"thumbs/{card['id']}.jpg", depth)
+        thumb = f'<img src="{src}" alt="" loading="lazy" width="320" height="320">'
+
+    if thumb:
+        thumb = f'<a href="{link}">{thumb}</a>'
+    return (f'<li class="card">{thumb}'
+            f'<p><a href="{link}">{html.escape(card["style_name"])} · Chapter {card["chapter_number"]}: '
+            f'{html.escape(str(card["chapter_title"]))}</a></p>'
+            f'<p class="meta">{html.escape(str(card["theme"]))} · {_date(card["created"])}</p>'
+            f'<p>{html.escape(card["excerpt"])}</p></li>')
+
+
+def _date(created):
+    return time.strftime("%Y-%m-%d", time.localtime(created)) if created else ""
+
+
+def _page(title, body, depth, crumbs=()):
+    nav = " › ".join([f'<a href="{_link("index.html", depth)}">Archive</a>']
+                     + [f'<a href="{_link(href, depth)}">{html.escape(text)}</a>' for href, text in crumbs])
+    return (f'<!doctype html><html lang="en"><head><meta charset="utf-8">'
+            f'<meta name="viewport" content="width=device-width,initial-scale=1">'
+            f'<title>{html.escape(title)}</title><link rel="stylesheet" href="{_link("style.css", depth)}">'
+            f'</head><body><nav>{nav}</nav><h1>{html.escape(title)}</h1>{body}</body></html>\n')
+
+
+def render_page(task, record=None):
+    """
+    Returns:
+        str: The page's HTML.
+    """
+    depth = task["path"].count("/")
+    cards = task["cards"]
+    kind = task["kind"]
+    if kind == "index":
+        books = "".join(f'<li><a href="{book_id}/index.html">{html.escape(title)}</a> ({count} editions)</li>'
+                        for book_id, title, count in task["books"])
+        body = (f'<ul>{books}</ul><h2>Latest editions</h2>'
+                f'<ul class="cards">{"".join(_card_html(c, depth) for c in cards)}</ul>')
+        return _page("Archive", body, depth)
+
+    if kind == "book":
+        chapters = "".join(f'<li><a href="chapter-{n}.html">{n}. {html.escape(str(t))}</a> ({count})</li>'
+                           for n, t, count in task["chapters"])
+        themes = "".join(f'<li><a href="theme-{slug(t)}.html">{html.escape(t)}</a> ({count})</li>'
+                         for t, count in task["themes"])
+        styles = "".join(f'<li><a href="style-{s}.html">{html.escape(name)}</a> ({count})</li>'
+                         for s, name, count in task["styles"])
+        body = (f'<h2>Chapters</h2><ul class="counts">{chapters}</ul><h2>Themes</h2><ul class="counts">{themes}</ul>'
+                f'<h2>Styles</h2><ul class="counts">{styles}</ul><h2>Latest editions</h2>'
+                f'<ul class="cards">{"".join(_card_html(c, depth) for c in cards)}</ul>')
+        return _page(task["title"], body, depth)
+
+    book_id = task["path"].split("/")[0]
+    if kind == "list":
+        body = (f'<p class="meta">{len(cards)} editions</p>'
+                f'<ul class="cards">{"".join(_card_html(c, depth) for c in cards)}</ul>')
+        return _page(task["title"], body, depth, [(f"{book_id}/index.html", task["book"])])
+
+    card = cards[0]
+    image = ""
+    if card["image"]:
+        src = _link(f"images/{card['id']}{os.path.splitext(card['image'])[1]}", depth)
+        image = f'<p class="edition"><img src="{src}" alt="{html.escape(record.get("dalle_prompt") or "")}"></p>'
+    bro = f' · with {html.escape(card["bro"])}' if card["bro"] else ""
+    recipe = record.get("cocktail_recipe")
+    body = (f'<p class="meta">Book of {html.escape(str(card["theme"]).capitalize())} · '
+            f'<a href="../chapter-{card["chapter_number"]}.html">Chapter {card["chapter_number"]}: '
+            f'{html.escape(str(card["chapter_title"]))}</a> · <a href="../style-{card["content_style"]}.html">'
+            f'{html.escape(card["style_name"])} {html.escape(str(record.get("str_numbers", "")))}</a>{bro} · '
+            f'{_date(card["created"])}</p>'
+            f'<div class="story">{html.escape(record.get("story") or "")}</div>{image}'
+            + (f'<h2>Cocktail</h2><div class="recipe">{html.escape(recipe)}</div>' if recipe else ""))
+    title = f'{card["style_name"]}: {card["chapter_title"]}'
+    return _page(title, body, depth, [(f"{book_id}/index.html", card["book_title"]),
+                                      (f"{book_id}/theme-{slug(card['theme'])}.html", str(card["theme"]))])
+
+
+@contextmanager
+def _replacing(path):
+    """
+    Yields a temporary path next to `path`; what is written there replaces
+    `path` in one step on exit, so the site never serves half a file.
+    """
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".site-", suffix=".tmp")
+    os.close(fd)
+    os.chmod(tmp_path, FILE_MODE)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.lexists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _write_text(path, text):
+    with _replacing(path) as tmp_path:
+        with open(tmp_path, "w") as f:
+            f.write(text)
+
+
+def _render_chunk(out_dir, tasks):
+    for task, record in tasks:
+        path = os.path.join(out_dir, task["path"])
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _write_text(path, render_page(task, record))
+    return len(tasks)
+
+
+def _copy_chunk(out_dir, tasks):
+    from transcode import THUMBNAIL_SIZE
+
+    done = 0
+    for path, task in tasks:
+        dest = os.path.join(out_dir, path)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        try:
+            with _replacing(dest) as tmp_path:
+                if task["kind"] == "copy":
+                    os.remove(tmp_path)
+                    try:
+                        os.link(task["source"], tmp_path)
+                    except OSError:
+                        shutil.copyfile(task["source"], tmp_path)
+                else:
+                    from PIL import Image
+                    with Image.open(task["source"]) as image:
+                        image = image.convert("RGB")
+                        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+                        image.save(tmp_path, format="JPEG", quality=80, optimize=True)
+            done += 1
+        except OSError as e:
+            print(f"---- site: skipping {path}: {e} ----")
+    return done
+
+
+def _run_chunks(function, out_dir, tasks, workers):
+    chunks = [tasks[i:i + CHUNK_SIZE] for i in range(0, len(tasks), CHUNK_SIZE)]
+    if workers <= 1 or len(chunks) <= 1:
+        return sum(function(out_dir, chunk) for chunk in chunks)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return sum(pool.map(function, [out_dir] * len(chunks), chunks))
+
+
+def build_site(archive_path, out_dir, workers=None, full=False):
+    """
+    Renders the archive into a static site: an index, a page per book, per
+    chapter, theme and style within it, and per edition, with thumbnails.
+
+    Only pages and images whose inputs changed since the last build are
+    written: each page's inputs (its editions' record hashes and the
+    template version) and each image's source are hashed into a build
+    state file kept with the site. Only the archive lines appended since the
+    last build are read, as long as the rest is unchanged.
+
+    Args:
+        archive_path (str): The edition archive.
+        out_dir (str): Where the site is written.
+        workers (int): Processes for rendering and thumbnails, default one per core.
+        full (bool): Ignore the build state and render everything.
+
+    Returns:
+        dict: Counts of what was rendered, copied, skipped and removed, and the seconds taken.
+    """
+    start = time.perf_counter()
+    workers = workers or os.cpu_count() or 1
+    css_hash = hashlib.sha1(CSS.encode()).hexdigest()
+    header = {} if full else _load_json(os.path.join(out_dir, STATE_NAME))
+    if header.get("version") != SITE_VERSION:
+        header = {}
+
+    records, complete, archive_state = read_archive(archive_path, header)
+    if not records and not complete and header.get("css") == css_hash:
+        # Nothing appended since the last build
+        return {"editions": header["editions"], "pages_rendered": 0, "pages_skipped": header["pages"],
+                "images_written": 0, "pages_removed": 0, "seconds": time.perf_counter() - start}
+    state = _load_json(os.path.join(out_dir, INDEX_NAME)) if header else {}
+    if header and not state and not complete:
+        # The index is gone; start over from the whole archive
+        records, complete, archive_state = read_archive(archive_path, {})
+    cards = {} if complete else state.get("cards", {})
+    by_id = {}
+    for record in records:
+        if record.get("edition_id"):
+            cards[record["edition_id"]] = make_card(record)
+            by_id[record["edition_id"]] = record
+
+    # An append only touches the pages its new editions appear on
+    pages, assets = plan_site(cards, None if complete else set(by_id))
+    built_pages = state.get("pages", {})
+    built_assets = state.get("assets", {})
+    stale_pages = [path for path, (digest, _) in pages.items() if built_pages.get(path) != digest]
+    stale_assets = [path for path, (key, _) in assets.items() if key is None or built_assets.get(path) != key]
+
+    os.makedirs(out_dir, exist_ok=True)
+    css_path = os.path.join(out_dir, "style.css")
+    if not os.path.exists(css_path) or header.get("css") != css_hash:
+        _write_text(css_path, CSS)
+
+    page_tasks = []
+    for path in stale_pages:
+        task = pages[path][1]
+        record = by_id.get(task["cards"][0]["id"]) if task["kind"] == "edition" else None
+        page_tasks.append((task, record))
+    rendered = _run_chunks(_render_chunk, out_dir, page_tasks, workers)
+    copied = _run_chunks(_copy_chunk, out_dir, [(path, assets[path][1]) for path in stale_assets], workers)
+
+    removed = 0
+    for path in set(built_pages) - set(pages) if complete else ():
+        try:
+            os.remove(os.path.join(out_dir, path))
+            removed += 1
+        except OSError:
+            pass
+
+    state = {
+        "cards": cards,
+        "pages": {**({} if complete else built_pages), **{path: digest for path, (digest, _) in pages.items()}},
+        "assets": {**({} if complete else built_assets),
+                   **{path: key for path, (key, _) in assets.items() if key is not None}},
+    }
+    header = {"version": SITE_VERSION, "css": css_hash, "archive": archive_state, "editions": len(cards),
+              "pages": len(state["pages"])}
+    # The index goes first: a header only ever describes an index that is on disk
+    _save_json(os.path.join(out_dir, INDEX_NAME), state)
+    _save_json(os.path.join(out_dir, STATE_NAME), header)
+
+    return {
+        "editions": len(cards),
+        "pages_rendered": rendered,
+        "pages_skipped": len(state["pages"]) - len(stale_pages),
+        "images_written": copied,
+        "pages_removed": removed,
+        "seconds": time.perf_counter() - start,
+    }
+
+
+def _load_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_json(path, data):
+    _write_text(path, json.dumps(data))
+
+
+def run_benchmark(editions=10000, workers=None):
+    """
+    Builds a site from a synthetic archive: a full build, a no-op rebuild,
+    and an incremental build after one new edition, like a daily run.
+    """
+    from PIL import Image
+
+    rng = random.Random(0)
+    work = tempfile.mkdtemp(prefix="site-bench-")
+    images = []
+    for i in range(20):
+        original = os.path.join(work, f"src{i}.png")
+        thumbnail = os.path.join(work, f"src{i}-thumb.jpg")
+        image = Image.new("RGB", (1024, 1024), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+        image.save(original)
+        image.resize((320, 320)).save(thumbnail)
+        images.append({"original": original, "compact": original, "thumbnail": thumbnail})
+
+    def edition(n):
+        activity = rng.randrange(len(catalog.activities_list))
+        files = dict(rng.choice(images))
+        if n % 10 == 0:
+            files.pop("thumbnail")  # Archived before thumbnails were made
+        return {
+            "edition_id": f"{20200101 + n:08d}-070000-{n:04x}",
+            "tenant": "john" if n % 4 else "dave",
+            "book_title": catalog.book_title if n % 4 else "The Gospel of Dave",
+            "created": 1577865600 + n * 86400 / 4,
+            "theme": rng.choice(catalog.emotions),
+            "chapter_number": activity + 1,
+            "chapter_title": catalog.activities_list[activity]["chapter_title"],
+            "content_style": rng.randint(1, 6),
+            "bro": rng.choice([None, "JP", "Kris"]),
+            "str_numbers": str(rng.randint(1, 10000)),
+            "story": " ".join(rng.choice(catalog.emotions) for _ in range(rng.randint(60, 180))),
+            "dalle_prompt": "A man and his bro, cartoon style.",
+            "image_files": files,
+            "cocktail_recipe": "**The Bench**\n- 2 oz gin\n- 1 oz lime\n\nShake.",
+        }
+
+    archive_path = os.path.join(work, "archive.jsonl")
+    with open(archive_path, "w") as f:
+        for n in range(editions):
+            f.write(json.dumps(edition(n)) + "\n")
+    out_dir = os.path.join(work, "site")
+
+    print(f"{editions} editions, {workers or os.cpu_count()} workers, in {work}")
+    print(f"full build:        {build_site(archive_path, out_dir, workers)}")
+    print(f"nothing changed:   {build_site(archive_path, out_dir, workers)}")
+    with open(archive_path, "a") as f:
+        f.write(json.dumps(edition(editions)) + "\n")
+    print(f"one new edition:   {build_site(archive_path, out_dir, workers)}")
+    shutil.rmtree(work)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "bench":
+        run_benchmark(int(sys.argv[2]) if len(sys.argv) > 2 else 10000)
+    elif len(sys.argv) > 2:
+        stats = build_site(sys.argv[1], sys.argv[2], full="--full" in sys.argv)
+        print(stats)
+    else:
+        print("usage: python archive_site.py <archive.jsonl> <site dir> [--full] | bench [editions]")
+        sys.exit(1)
@@ -0,0 +1,158 @@
+import fcntl
+import json
+import os
+import sys
+import tempfile
+
+from PIL import Image, ImageDraw, ImageFont
+
+from portraits import file_sha256
+
+# Each portrait is fit into a PANEL_SIZE square, with a caption band below it.
+# A panel is as big as a high detail portrait, so the sheet loses nothing a
+# portrait sent on its own would keep (see portraits.DETAIL_SIZES).
+PANEL_SIZE = 1024
+CAPTION_HEIGHT = 128
+MANIFEST_NAME = "manifest.json"
+
+
+def _caption_font():
+    try:
+        return ImageFont.truetype("DejaVuSans-Bold.ttf", 80)
+    except OSError:
+        return ImageFont.load_default()
+
+
+def compose_pair_sheet(left_path, left_name, right_path, right_name, out_path):
+    """
+    Composites two portraits side by side with their names captioned below.
+
+    Args:
+        left_path (str): The protagonist's portrait.
+        left_name (str): The protagonist's name.
+        right_path (str): The bro's portrait.
+        right_name (str): The bro's name.
+        out_path (str): Where the sheet is written (PNG).
+    """
+    sheet = Image.new("RGB", (2 * PANEL_SIZE, PANEL_SIZE + CAPTION_HEIGHT), (255, 255, 255))
+    draw = ImageDraw.Draw(sheet)
+    font = _caption_font()
+
+    for i, (path, name) in enumerate([(left_path, left_name), (right_path, right_name)]):
+        with Image.open(path) as portrait:
+            portrait = portrait.convert("RGB")
+            portrait.thumbnail((PANEL_SIZE, PANEL_SIZE), Image.LANCZOS)
+            x = i * PANEL_SIZE + (PANEL_SIZE - portrait.width) // 2
+            y = (PANEL_SIZE - portrait.height) // 2
+            sheet.paste(portrait, (x, y))
+
+        text_width = draw.textlength(name, font=font)
+        draw.text(
+            (i * PANEL_SIZE + (PANEL_SIZE - text_width) / 2, PANEL_SIZE + 16),
+            name,
+            fill=(0, 0, 0),
+            font=font,
+        )
+
+    # Written aside and moved into place, so nobody reads a half-written sheet
+    directory = os.path.dirname(out_path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".sheet-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            sheet.save(f, format="PNG", optimize=True)
+        os.replace(tmp_path, out_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _load_manifest(atlas_dir):
+    try:
+        with open(os.path.join(atlas_dir, MANIFEST_NAME)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_manifest(atlas_dir, manifest):
+    fd, tmp_path = tempfile.mkstemp(dir=atlas_dir, prefix=".manifest-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, os.path.join(atlas_dir, MANIFEST_NAME))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def get_pair_sheet(portrait_dir, atlas_dir, bro_name, protagonist="John"):
+    """
+    Returns the labeled protagonist+bro reference sheet, recomposing it only
+    if either source portrait changed since it was built.
+
+    Args:
+        portrait_dir (str): Directory holding "<name>.png" portraits.
+        atlas_dir (str): Where sheets and their manifest are kept.
+        bro_name (str): The bro's name.
+        protagonist (str): The protagonist's name.
+
+    Returns:
+        str: The path of the sheet.
+    """
+    return build_atlas(portrait_dir, atlas_dir, [bro_name], protagonist)[bro_name]
+
+
+def build_atlas(portrait_dir, atlas_dir, bro_names, protagonist="John"):
+    """
+    Builds the reference sheet for every protagonist+bro pairing, incrementally.
+
+    Builds take turns on a lock file in the atlas directory, so backfill
+    workers and concurrent books never compose the same sheet at once or
+    overwrite each other's manifest entries.
+
+    Args:
+        portrait_dir (str): Directory holding "<name>.png" portraits.
+        atlas_dir (str): Where sheets and their manifest are kept.
+        bro_names (list): The bros to pair with the protagonist.
+        protagonist (str): The protagonist's name.
+
+    Returns:
+        dict: Bro name -> sheet path.
+    """
+    protagonist_path = os.path.join(portrait_dir, f"{protagonist}.png")
+    protagonist_hash = file_sha256(protagonist_path)
+
+    os.makedirs(atlas_dir, exist_ok=True)
+    with open(os.path.join(atlas_dir, "atlas.lock"), "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        manifest = _load_manifest(atlas_dir)
+        sheets = {}
+        changed = False
+        for name in bro_names:
+            bro_path = os.path.join(portrait_dir, f"{name}.png")
+            sources = {protagonist: protagonist_hash, name: file_sha256(bro_path)}
+            out_path = os.path.join(atlas_dir, f"{protagonist}+{name}.png")
+
+            entry = manifest.get(name)
+            if entry is None or entry["sources"] != sources or not os.path.exists(out_path):
+                print(f"composing {protagonist}+{name}")
+                compose_pair_sheet(protagonist_path, protagonist, bro_path, name, out_path)
+                manifest[name] = {"sources": sources, "path": out_path}
+                changed = True
+            sheets[name] = out_path
+
+        if changed:
+            _save_manifest(atlas_dir, manifest)
+    return sheets
+
+
+if __name__ == "__main__":
+    # Batch job: build every sheet for the cast in catalog.bro_dict
+    import keys
+    from catalog import bro_dict
+
+    atlas_dir = sys.argv[1] if len(sys.argv) > 1 else getattr(keys, "data_dir", keys.home_dir + "/.boj/") + "atlas/"
+    sheets = build_atlas(keys.img_path, atlas_dir, list(bro_dict))
+    for name, path in sheets.items():
+        print(f"{name}: {path}")
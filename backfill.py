@@ -0,0 +1,171 @@
+import json
+import multiprocessing
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from catalog import activities_list
+from run_trace import RunTrace
+from tenants import ALL_CONTENT_STYLES
+
+# How many editions may be in each stage at once, across all worker processes
+STAGE_LIMITS = {
+    "story": 6,
+    "image_prompt": 6,
+    "image": 3,
+    "cocktail": 6,
+    "upload": 2,
+}
+
+
+def plan_space():
+    """
+    Every (activity number, content style) pair in the Book.
+
+    Returns:
+        list: (activity_number, content_style) tuples.
+    """
+    return [
+        (activity_number, content_style)
+        for activity_number in range(len(activities_list))
+        for content_style in ALL_CONTENT_STYLES
+    ]
+
+
+def edition_dir(out_dir, activity_number, content_style):
+    """
+    Returns:
+        str: The output directory for one edition, e.g. out/chapter-03/style-2.
+    """
+    return os.path.join(out_dir, f"chapter-{activity_number + 1:02d}", f"style-{content_style}")
+
+
+def is_done(out_dir, activity_number, content_style):
+    """
+    An edition is checkpointed once its edition.json exists.
+    """
+    return os.path.exists(os.path.join(edition_dir(out_dir, activity_number, content_style), "edition.json"))
+
+
+def save_checkpoint(out_dir, activity_number, content_style, edition):
+    """
+    Writes an edition's edition.json, which marks it done. The file appears
+    whole or not at all, so a killed worker never leaves a half-done checkpoint.
+    """
+    work_dir = edition_dir(out_dir, activity_number, content_style)
+    fd, tmp_path = tempfile.mkstemp(dir=work_dir, prefix=".edition-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(edition, f, indent=2)
+        os.replace(tmp_path, os.path.join(work_dir, "edition.json"))
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+# This worker's share of the cross-process stage limits (see STAGE_LIMITS)
+_stage_semaphores = {}
+
+
+def _init_worker(semaphores):
+    _stage_semaphores.update(semaphores)
+
+
+def run_edition(out_dir, activity_number, content_style):
+    """
+    Generates one edition into the output tree (no Slack, no image hosting).
+
+    The theme and bro are seeded from the chapter and style, so a resumed
+    job plans the same editions it would have produced.
+
+    Returns:
+        float: Seconds the edition took.
+    """
+    # boj2 reads keys.py when imported, so only the workers import it;
+    # planning and checkpoints work without it
+    import boj2
+
+    boj2.stage_semaphores.update(_stage_semaphores)
+    rng = random.Random(f"{activity_number}-{content_style}")
+    plan = boj2.plan_edition(content_style, activity_number=activity_number, rng=rng)
+    trace = RunTrace(plan["edition_id"])
+    recipe_cache = boj2.get_recipe_cache()
+
+    work_dir = edition_dir(out_dir, activity_number, content_style)
+    os.makedirs(work_dir, exist_ok=True)
+
+    edition = boj2.produce_edition(plan, trace, recipe_cache, publisher_name=None,
+                                   image_base=os.path.join(work_dir, "raw"))
+    if edition["image_files"]:
+        compact = edition["image_files"].get("compact") or edition["image_files"]["original"]
+        shutil.copyfile(compact, os.path.join(work_dir, "image" + os.path.splitext(compact)[1]))
+    trace.save(boj2.TRACE_PATH)
+
+    # Writing edition.json last is the checkpoint
+    save_checkpoint(out_dir, activity_number, content_style, edition)
+
+    # After the checkpoint, so a failed save never costs a paid edition its place
+    recipe_cache.wait_for_refills()
+    try:
+        recipe_cache.save()
+    except OSError as e:
+        print(f"---- recipe cache save failed: {e} ----")
+    return trace.elapsed()
+
+
+def run_backfill(out_dir, workers=4, edition_runner=run_edition):
+    """
+    Runs every edition not yet in the output tree through a process pool,
+    printing throughput and ETA as editions finish.
+
+    Args:
+        out_dir (str): The output tree.
+        workers (int): Worker processes.
+        edition_runner (callable): edition_runner(out_dir, activity_number, content_style),
+            run in a worker; run_edition unless testing.
+
+    Returns:
+        dict: Editions "skipped" (already done), "done" and "failed" this run.
+    """
+    plans = [p for p in plan_space() if not is_done(out_dir, *p)]
+    total = len(plan_space())
+    print(f"{total - len(plans)} of {total} editions already done, {len(plans)} to go")
+    if not plans:
+        return {"skipped": total, "done": 0, "failed": 0}
+
+    semaphores = {stage: multiprocessing.BoundedSemaphore(limit) for stage, limit in STAGE_LIMITS.items()}
+    start = time.time()
+    done = 0
+    failed = 0
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(semaphores,)) as pool:
+        futures = {pool.submit(edition_runner, out_dir, *p): p for p in plans}
+        for future in as_completed(futures):
+            activity_number, content_style = futures[future]
+            try:
+                seconds = future.result()
+                done += 1
+            except Exception as e:
+                failed += 1
+                print(f"chapter {activity_number + 1} style {content_style} failed: {e}")
+                continue
+
+            elapsed = time.time() - start
+            rate = done / elapsed
+            remaining = len(plans) - done - failed
+            print(f"[{done + failed}/{len(plans)}] chapter {activity_number + 1} style {content_style} "
+                  f"in {seconds:.0f}s | {rate * 60:.1f} editions/min | ETA {remaining / rate / 60:.1f} min")
+
+    print(f"done: {done} editions, {failed} failed, {time.time() - start:.0f}s")
+    return {"skipped": total - len(plans), "done": done, "failed": failed}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python backfill.py <out dir> [workers]")
+        sys.exit(1)
+    run_backfill(sys.argv[1], int(sys.argv[2]) if len(sys.argv) > 2 else 4)
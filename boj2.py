@@ -1,14 +1,43 @@
+import os
 import sys
 import random
+import time
+_import_started = time.perf_counter()
+import openai
 from openai import OpenAI
-from slack_sdk.webhook import WebhookClient
-from slack_sdk.errors import SlackApiError
 import requests
-import subprocess
 import base64
-from urlextract import URLExtract
+from contextlib import contextmanager
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
 
 import keys
+from prompts import (cache_key, cast, cocktail_messages, image_prompt_messages, image_prompt_rewrite_messages,
+                     story_messages, story_plan)
+from recipe_cache import RecipeCache
+from verse_validator import target_words, validate_and_repair, validate_story
+from story_ranking import rank_candidates
+import archive
+from image_scoring import pick_best_image, image_hash
+from portraits import encode_portrait
+from atlas import get_pair_sheet
+from run_trace import RunTrace, load_traces
+from image_policy import choose_image_settings, image_latencies, image_tool
+from transcode import transcode_image
+from image_store import ImageStore, ImgurPublisher, LocalHTTPPublisher, PublishError, S3Publisher
+from outbox import Outbox, RateLimiter
+from rate_limit import SharedRateLimiter, limited_create
+from model_router import STAGE_BUDGETS, STAGE_CANDIDATES, ModelRouter, usage_dict
+from usage_ledger import UsageLedger, normalize_usage
+from metrics import CACHE_HITS, CACHE_MISSES, IN_FLIGHT, TOKENS, push_metrics, start_metrics_server
+from profiling import RunProfiler
+from offline_story import load_or_train
+import image_preflight
+from tenants import DEFAULT_TENANT_ID, FairScheduler, default_tenant, load_tenants, serve
+from archive_site import build_site
+
+# Module import time, reported by --profile
+_imports_seconds = time.perf_counter() - _import_started
 
 # Define constants for better readability
 HOME_DIR = keys.home_dir
@@ -19,6 +48,97 @@ OPENAI_API_KEY = keys.openai_api_key
 SLACK_AI_KEY = keys.slack_ai_key
 SLACK_DEV_KEY = keys.slack_dev_key
 
+# Local state (caches, archives) lives here
+DATA_DIR = getattr(keys, "data_dir", HOME_DIR + "/.boj/")
+
+# Cocktail recipe cache settings
+RECIPE_CACHE_PATH = DATA_DIR + "recipe_cache.json"
+RECIPE_REUSE_PROBABILITY = getattr(keys, "recipe_reuse_probability", 0.8)
+RECIPE_TTL_DAYS = getattr(keys, "recipe_ttl_days", 30)
+RECIPE_CACHE_MAX_KEYS = getattr(keys, "recipe_cache_max_keys", 1500)
+
+# Edition archive (one JSON line per posted edition)
+ARCHIVE_PATH = DATA_DIR + "archive.jsonl"
+
+# Story candidates requested per completion call (best one is kept)
+STORY_CANDIDATES = getattr(keys, "story_candidates", 1)
+
+# Images generated concurrently per run (best one is posted)
+IMAGE_CANDIDATES = getattr(keys, "image_candidates", 1)
+
+# Reference portraits are downscaled/re-encoded once and cached here
+PORTRAIT_CACHE_DIR = DATA_DIR + "portraits/"
+PORTRAIT_DETAIL = getattr(keys, "portrait_detail", "low")
+
+# Labeled John+bro reference sheets (built by `python atlas.py`)
+ATLAS_DIR = DATA_DIR + "atlas/"
+
+# Per-run timing traces (one JSON line per run)
+TRACE_PATH = DATA_DIR + "traces.jsonl"
+
+# Seconds a run should take end to end; the image settings adapt to what is left
+RUN_TIME_BUDGET = getattr(keys, "run_time_budget", 180)
+
+# Original images plus their compact copies and thumbnails, per edition
+IMAGE_ARCHIVE_DIR = DATA_DIR + "images/"
+
+# Content-addressed image store and where its images get hosted
+IMAGE_STORE_DIR = DATA_DIR + "store/"
+IMAGE_PUBLISHER = getattr(keys, "image_publisher", "imgur")
+
+# Durable queue of rendered Slack payloads, delivered by `python outbox.py deliver`
+OUTBOX_PATH = DATA_DIR + "outbox.sqlite"
+
+# OpenAI request/token buckets shared by every run on this machine
+RATE_LIMIT_PATH = DATA_DIR + "rate_limits.sqlite"
+
+# Per-stage model routing: candidates (default first), latency budgets and the decision/outcome log
+MODEL_CANDIDATES = dict(STAGE_CANDIDATES, **getattr(keys, "model_candidates", {}))
+MODEL_BUDGETS = dict(STAGE_BUDGETS, **getattr(keys, "model_budgets", {}))
+MODEL_LOG_PATH = DATA_DIR + "model_log.jsonl"
+
+# Pushgateway one-shot runs push their metrics to, e.g. "http://127.0.0.1:9091" (None to skip)
+METRICS_PUSHGATEWAY = getattr(keys, "metrics_pushgateway", None)
+
+# Local story generator used when the API is down, over budget or too slow
+FALLBACK_MODEL_PATH = DATA_DIR + "fallback_story.npz"
+FALLBACK_MAX_SECONDS = getattr(keys, "fallback_max_seconds", 60)
+# Seconds a cocktail call may take before the edition goes out without one
+COCKTAIL_TIMEOUT = getattr(keys, "cocktail_timeout", 30)
+
+# Local refusal model for image prompts, retrained from the archive's outcomes
+PREFLIGHT_MODEL_PATH = DATA_DIR + "image_preflight.npz"
+
+# Other books served from this process, each with its own catalog, cast portraits,
+# styles and destinations (see tenants.make_tenant); the default book is catalog.py
+TENANTS = getattr(keys, "tenants", [])
+
+# Editions generated at once by --all-tenants
+TENANT_WORKERS = getattr(keys, "tenant_workers", 4)
+
+# Static archive site rebuilt (incrementally) after every run, or None to skip
+SITE_DIR = getattr(keys, "site_dir", None)
+
+# Where --profile writes its reports
+PROFILE_DIR = DATA_DIR + "profiles/"
+
+# Token usage of every OpenAI call, for daily/per-stage rollups and drift reports
+USAGE_LEDGER_PATH = DATA_DIR + "usage.sqlite"
+
+# Output-token budgets. Stories get their style's word target in tokens plus headroom.
+TOKENS_PER_WORD = 1.4
+TOKEN_HEADROOM = 1.5
+STAGE_MAX_TOKENS = {
+    "image_prompt": 300,  # prompts are asked for in under 100 words
+    "cocktail": 500,
+}
+
+# Content style whose story the digest's shared image is drawn from
+DIGEST_IMAGE_STYLE = 4
+
+# Stage name -> semaphore limiting how many editions run that stage at once
+stage_semaphores = {}
+
 client = OpenAI(api_key=OPENAI_API_KEY)
 
 # Content Styles
@@ -31,24 +151,208 @@ CONTENT_STYLES = {
     6: "John's Jests"
 }
 
-def get_webhook_client(is_dev_mode):
+_rate_limiter = None
+_model_router = None
+_usage_ledger = None
+_tenants = None
+
+def get_rate_limiter():
     """
-    Returns the appropriate WebhookClient based on the development mode flag.
+    Returns the OpenAI rate limiter shared with every other process on this machine.
+    """
+    global _rate_limiter
+    if _rate_limiter is None:
+        _rate_limiter = SharedRateLimiter(RATE_LIMIT_PATH)
+    return _rate_limiter
+
+def get_model_router():
+    """
+    Returns the per-stage model router, shared by every call in this process.
+    """
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter(MODEL_LOG_PATH, MODEL_CANDIDATES, MODEL_BUDGETS)
+    return _model_router
+
+def get_usage_ledger():
+    """
+    Returns the token usage ledger.
+    """
+    global _usage_ledger
+    if _usage_ledger is None:
+        _usage_ledger = UsageLedger(USAGE_LEDGER_PATH)
+    return _usage_ledger
+
+def get_tenants():
+    """
+    Returns:
+        dict: Tenant id -> tenant, for every book this process serves.
+    """
+    global _tenants
+    if _tenants is None:
+        _tenants = load_tenants(TENANTS, default_tenant(IMG_PATH))
+    return _tenants
+
+def get_tenant(tenant_id=None):
+    """
+    Returns:
+        dict: The tenant, the default book if tenant_id is None.
+
+    Raises:
+        ValueError: If there is no such tenant.
+    """
+    tenants = get_tenants()
+    tenant_id = tenant_id or DEFAULT_TENANT_ID
+    if tenant_id not in tenants:
+        raise ValueError(f"Unknown tenant {tenant_id!r}. Configured: {', '.join(tenants)}.")
+    return tenants[tenant_id]
+
+def tenant_scope(tenant):
+    """
+    Returns:
+        str: The tenant id to keep a book's files and cache keys apart, or
+            None for the default book, whose paths and keys predate tenants.
+    """
+    return None if tenant["id"] == DEFAULT_TENANT_ID else tenant["id"]
+
+def fallback_model_path(tenant):
+    """
+    Returns:
+        str: Where a book's offline story model is kept.
+    """
+    scope = tenant_scope(tenant)
+    return FALLBACK_MODEL_PATH.replace(".npz", f"-{scope}.npz") if scope else FALLBACK_MODEL_PATH
+
+def style_name(content_style, tenant=None):
+    """
+    Returns:
+        str: The content style's display name in a book, e.g. "John's Jests".
+    """
+    return cast(CONTENT_STYLES[content_style], (tenant or get_tenant())["protagonist"])
+
+def story_max_tokens(content_style, number_verses=None):
+    """
+    Returns:
+        int: The output-token budget for one story in the given style.
+    """
+    _, max_words = target_words(content_style, number_verses)
+    return int(max_words * TOKENS_PER_WORD * TOKEN_HEADROOM)
+
+def is_truncated(response):
+    """
+    Returns:
+        bool: Whether a response stopped at its output-token budget.
+    """
+    if getattr(response, "status", None) == "incomplete":
+        return True
+    return any(choice.finish_reason == "length" for choice in getattr(response, "choices", None) or [])
+
+def routed_create(resource, stage, **kwargs):
+    """
+    Calls resource.create through the shared rate limiter. With a stage, the
+    model is picked by the model router and the call's latency, usage and
+    error are recorded for it. Every successful call goes into the usage ledger.
+    """
+    router = get_model_router() if stage else None
+    if router:
+        kwargs["model"] = router.choose(stage)
+    start = time.time()
+    try:
+        with IN_FLIGHT.track("openai"):
+            response = limited_create(get_rate_limiter(), resource, kwargs["model"], **kwargs)
+    except Exception as e:
+        if router:
+            router.record(stage, kwargs["model"], time.time() - start, error=repr(e))
+        raise
+    seconds = time.time() - start
+    usage = usage_dict(response)
+    truncated = is_truncated(response)
+    if router:
+        router.record(stage, kwargs["model"], seconds, usage=usage)
+    get_usage_ledger().record(stage or "other", kwargs["model"], usage, seconds, truncated)
+    tokens = normalize_usage(usage)
+    for kind in ("prompt_tokens", "completion_tokens", "cached_tokens"):
+        TOKENS.inc(stage or "other", kind.replace("_tokens", ""), amount=tokens[kind])
+    if tokens["prompt_tokens"]:
+        (CACHE_HITS if tokens["cached_tokens"] else CACHE_MISSES).inc("prompt")
+    if truncated:
+        print(f"---- {stage or kwargs['model']} output hit its token budget ----")
+    return response
+
+def chat_completion(stage=None, **kwargs):
+    """
+    Creates a chat completion through the shared OpenAI rate limiter,
+    routed to a model for `stage` if given.
+    """
+    return routed_create(client.chat.completions, stage, **kwargs)
+
+def repair_completion(**kwargs):
+    """
+    Creates the completion that fills in a story's missing verses or proverbs,
+    routed and accounted for as the "repair" stage.
+    """
+    return chat_completion(stage="repair", **kwargs)
+
+def create_response(stage=None, **kwargs):
+    """
+    Creates a response (e.g. with the image_generation tool) through the
+    shared OpenAI rate limiter, routed to a model for `stage` if given.
+    """
+    return routed_create(client.responses, stage, **kwargs)
+
+def get_webhook_url(is_dev_mode):
+    """
+    Returns the appropriate Slack webhook URL based on the development mode flag.
 
     Args:
         is_dev_mode (bool): True if in development mode, False otherwise.
 
     Returns:
-        WebhookClient: The Slack WebhookClient instance.
+        str: The Slack webhook URL.
     """
     if is_dev_mode:
-        return WebhookClient(f"https://hooks.slack.com/services/{SLACK_DEV_KEY}")
+        return f"https://hooks.slack.com/services/{SLACK_DEV_KEY}"
     else:
-        return WebhookClient(f"https://hooks.slack.com/services/{SLACK_AI_KEY}")
+        return f"https://hooks.slack.com/services/{SLACK_AI_KEY}"
+
+def get_slack_destinations(is_dev_mode, tenant=None):
+    """
+    Returns every Slack destination an edition is posted to.
+
+    In development mode that is only the dev webhook. Otherwise it is the
+    tenant's destinations, or for the default book keys.slack_destinations
+    if set, a list of dicts with a "name", either a "url" or a
+    "webhook_key", and an optional "rate_per_minute", or just the
+    ai_stories webhook.
+
+    Args:
+        is_dev_mode (bool): True if in development mode, False otherwise.
+        tenant (dict): The book, or None for the default one.
+
+    Returns:
+        list: Dicts with "name", "url" and "rate_per_minute".
+    """
+    if is_dev_mode:
+        return [{"name": "dev", "url": get_webhook_url(True), "rate_per_minute": None}]
+
+    configured = (tenant or {}).get("destinations") or getattr(keys, "slack_destinations", None)
+    if not configured:
+        return [{"name": "ai", "url": get_webhook_url(False), "rate_per_minute": None}]
+
+    destinations = []
+    for destination in configured:
+        url = destination.get("url") or f"https://hooks.slack.com/services/{destination['webhook_key']}"
+        destinations.append({
+            "name": destination["name"],
+            "url": url,
+            "rate_per_minute": destination.get("rate_per_minute"),
+        })
+    return destinations
 
 def get_gpt_prompt(content_style, theme, activity_data, bro_gpt_text, number_verses, starting_verse_number):
     """
-    Generates the prompt for ChatGPT.
+    Generates the variable part of the prompt for ChatGPT. The static
+    instructions for each style live in prompts.py, ahead of it.
 
     Args:
         content_style (int): The selected content style (1-6).
@@ -61,138 +365,51 @@ def get_gpt_prompt(content_style, theme, activity_data, bro_gpt_text, number_ver
     Returns:
         str: The GPT prompt.
     """
-    if content_style == 1:  # Book/Chapter
-        return (
-            f"You are the greatest storyteller in the world. Tell me a descriptive story about John. "
-            f"John loves to drink and loves to gamble. Tell me about when John was "
-            f"{activity_data['activity']}{bro_gpt_text} "
-            f"with the theme of {theme}. "
-            f"Make sure to incorporate a cocktail which should be in theme with the story, "
-            f"but do not give the cocktail a name. "
-            f"Use exactly {number_verses} sentences. "
-            f"Number each sentence, starting with {starting_verse_number}. "
-            f"Add a new line after each sentence. "
-            f"For example, {starting_verse_number}: Your first sentence goes here.\n\n"
-        )
-    elif content_style == 2:  # Psalms (Song Lyrics)
-        return (
-            f"Write a song about John experiencing {theme} while {activity_data['activity']}{bro_gpt_text}. "
-            f"Incorporate a cocktail inspired by the theme but do not give the cocktail a name. "
-            f"Choose from a number of different music styles like heavy metal, rap, 80 pop, classic rock, or something fun."
-            f"Use no more than 150 words."
-        )
-    elif content_style == 3:  # Proverbs (One-Sentence Examples)
-        return (
-            f"Give me 3 short, insightful proverbs about John's experiences with {theme} "
-            f"while {activity_data['activity']}{bro_gpt_text}. "
-            f"Each proverb should be a single, impactful sentence, in quotes. "
-            f"Tie the proverbs together in a short story using a religious tone. "
-            f"Do not number the sentences and put two new lines between each quote."
-        )
-    elif content_style == 4:  # Parables (Short Story with Moral)
-        return (
-            f"Tell me a short parable about John's experiences with {theme} while {activity_data['activity']}{bro_gpt_text}. "
-            f"The parable should have a clear moral or lesson and be extremely formal. "
-            f"Use no more than 150 words."
-        )
-    elif content_style == 5:  # Poem
-        return (
-            f"Write a poem about John experiencing {theme} while {activity_data['activity']}{bro_gpt_text}. "
-            f"Incorporate a cocktail inspired by the theme but do not give the cocktail a name. "
-            f"The poem should have a poetic and reflective tone. Pick a poet to emulate but do not tell me who."
-            f"Use no more than 50 words."
-        )
-    elif content_style == 6:  # Quips/Jokes
-        return (
-            f"Tell me a dirty joke about John's experiences with {theme} "
-            f"while {activity_data['activity']}{bro_gpt_text} in the style of stand up comedy. "
-            f"Use no more than 150 words. Do not preface the joke, just tell it."
-        )
-    else:
-        raise ValueError("Invalid content style. Please select a style between 1 and 6.")
+    return story_plan(content_style, theme, activity_data['activity'], bro_gpt_text, number_verses,
+                      starting_verse_number)
 
-def generate_gpt_story(prompt, content_style):
+def generate_gpt_story(prompt, content_style, n=1, number_verses=None, starting_verse=None, recent_stories=(),
+                       tenant=None):
     """
     Generates a story using the OpenAI GPT API.
 
+    When n > 1, n candidates are requested in a single completion call and
+    ranked locally (format compliance, length, lexical diversity and
+    similarity to recent archived stories); the best one is returned.
+
     Args:
         prompt (str): The prompt for ChatGPT.
         content_style (int): The selected content style (1-6).
+        n (int): The number of candidates to request.
+        number_verses (int): The number of verses asked for (style 1 only).
+        starting_verse (int): The starting verse number (style 1 only).
+        recent_stories (list): Recent archived stories to steer away from.
+        tenant (dict): The book, or None for the default one.
 
     Returns:
         str: The generated story.
     """
-    if content_style == 1:  # Book/Chapter
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are the most prolific story teller of all time. "
-                                            "You always leave your readers astonished, bewildered, intrigued, or some other strong emotion."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1
-        )
-        return response.choices[0].message.content
-
-    elif content_style == 2:  # Psalms (Song Lyrics)
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are a skilled poet and lyricist."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1  # Lower temperature for more structured output
-        )
-        return response.choices[0].message.content
-
-    elif content_style == 3:  # Proverbs (One-Sentence Examples)
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are a wise sage who can craft insightful proverbs."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1
-        )
-        return response.choices[0].message.content
-
-    elif content_style == 4:  # Parables (Short Story with Moral)
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are a master storyteller who can weave captivating parables."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1
-        )
-        return response.choices[0].message.content
-
-    elif content_style == 5:  # Poem
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are a skilled poet."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1
-        )
-        return response.choices[0].message.content
-
-    elif content_style == 6:  # Quips/Jokes
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are a witty comedian and a wise guy."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=1
-        )
-        return "\n".join(response.choices[0].message.content.split("\n"))
+    tenant = tenant or get_tenant()
+    response = chat_completion(
+        stage="story",
+        messages=story_messages(content_style, prompt, tenant["protagonist"]),
+        extra_body={"prompt_cache_key": cache_key(tenant_scope(tenant))},
+        timeout=FALLBACK_MAX_SECONDS,
+        temperature=1,
+        n=n,
+        max_tokens=story_max_tokens(content_style, number_verses),
+    )
+    candidates = [choice.message.content for choice in response.choices]
+    if len(candidates) == 1:
+        return candidates[0]
 
-    else:
-        raise ValueError("Invalid content style.")
+    ranked = rank_candidates(candidates, content_style, number_verses, starting_verse, recent_stories)
+    print("---- story candidates ----")
+    for score, _, parts in ranked:
+        print(f"{score:.3f} {parts}")
+    return ranked[0][1]
 
-def generate_dalle_prompt(story, bro_dalle_text, content_style):
+def generate_dalle_prompt(story, bro_dalle_text, content_style, tenant=None):
     """
     Generates a concise DALL-E prompt using GPT-4.
 
@@ -200,97 +417,71 @@ def generate_dalle_prompt(story, bro_dalle_text, content_style):
         story (str): The generated story from GPT.
         bro_dalle_text (str): Text related to the bro for DALL-E, if applicable.
         content_style (int): The selected content style (1-6).
+        tenant (dict): The book, or None for the default one.
 
     Returns:
         str: The DALL-E prompt, or None if no image is to be generated.
     """
+    tenant = tenant or get_tenant()
+    # Chronicles and parables get narrative images, psalms and poems abstract ones,
+    # proverbs their core message and jests a humorous take (see prompts.py)
+    response = chat_completion(
+        stage="image_prompt",
+        max_tokens=STAGE_MAX_TOKENS["image_prompt"],
+        messages=image_prompt_messages(content_style, story, bro_dalle_text, tenant["protagonist"]),
+        extra_body={"prompt_cache_key": cache_key(tenant_scope(tenant))},
+        temperature=0.7,
+    )
+    return response.choices[0].message.content
 
-    if content_style in [1, 4]:  # Chronicles, Parables (more visual narratives)
-
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert image prompt engineer. "
-                                            "Your task is to create a concise and evocative DALL-E prompt "
-                                            "based on the provided text, suitable for generating a high-quality image. "
-                                            "Incorporate character descriptions where relevant."},
-                {"role": "user", "content": f"Generate a DALL-E prompt, less than 100 words, for an image that visually represents: {story} {bro_dalle_text}"}
-            ],
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
-
-    elif content_style in [2, 5]:  # Psalms, Verses (more abstract, mood-based)
-
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert image prompt engineer. "
-                                            "Your task is to create a concise and evocative DALL-E prompt "
-                                            "based on the provided text, suitable for generating an abstract or symbolic image."},
-                {"role": "user", "content": f"Generate a DALL-E prompt, less than 100 words, for an image that visually represents the mood and themes of: {story} {bro_dalle_text}"}
-            ],
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
-
-    elif content_style == 3:  # Proverbs (focus on core message)
-
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert image prompt engineer. "
-                                            "Your task is to create a concise and evocative DALL-E prompt "
-                                            "that visually represents the core message of the proverb."},
-                {"role": "user", "content": f"Generate a DALL-E prompt, less than 100 words, for an image that illustrates: {story} {bro_dalle_text}"}
-            ],
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
-
-    elif content_style == 6:  # Jests (humor and exaggeration)
-
-        response = client.chat.completions.create(
-            model="gpt-4.1-mini",
-            messages=[
-                {"role": "system", "content": "You are an expert image prompt engineer. "
-                                            "Your task is to create a concise and evocative DALL-E prompt "
-                                            "that humorously illustrates the core idea of the joke. "
-                                            "Incorporate character descriptions where relevant."},
-                {"role": "user", "content": f"Generate a DALL-E prompt, less than 100 words, for a humorous image based on: {story} {bro_dalle_text}"}
-            ],
-            temperature=0.7,
-        )
-        return response.choices[0].message.content
-
-    else:
-        raise ValueError("Invalid content style.")
+def rewrite_image_prompt(prompt, tenant=None):
+    """
+    Asks the image prompt model for a version of a prompt the image tool is less likely to refuse.
 
-def create_file(file_path):
-  with open(file_path, "rb") as file_content:
-    result = client.files.create(
-        file=file_content,
-        purpose="vision",
+    Returns:
+        str: The rewritten prompt.
+    """
+    tenant = tenant or get_tenant()
+    response = chat_completion(
+        stage="image_prompt",
+        max_tokens=STAGE_MAX_TOKENS["image_prompt"],
+        messages=image_prompt_rewrite_messages(prompt, tenant["protagonist"]),
+        extra_body={"prompt_cache_key": cache_key(tenant_scope(tenant))},
+        temperature=0.3,
     )
-    return result.id
-
-def encode_image(file_path):
-    with open(file_path, "rb") as f:
-        base64_image = base64.b64encode(f.read()).decode("utf-8")
-    return base64_image
+    return response.choices[0].message.content
 
-def generate_image(prompt, bro):
+def generate_image(prompt, bro, k=1, recent_hashes=(), detail=PORTRAIT_DETAIL, image_settings=None, image_base="boj",
+                   tenant=None):
     """
-    Generates an image using the OpenAI create edit API.
+    Generates an image using the OpenAI responses API image_generation tool.
+
+    When k > 1, k images are generated concurrently and scored locally
+    (sharpness, colour entropy, distance from recent archived images); the
+    best one is kept.
+
     Args:
         prompt (str): The prompt for the image model.
+        bro (dict): The bro in the scene, or None if John is alone.
+        k (int): The number of images to generate.
+        recent_hashes (list): Perceptual hashes of recent archived images.
+        detail (str): Reference portrait detail, "low" or "high".
+        image_settings (dict): Size/quality/format chosen by the image policy, if any.
+        image_base (str): Path, without extension, the image is written to.
+        tenant (dict): The book whose cast portraits are used, or None for the default one.
 
     Returns:
-        str: The URL of the generated image, or None if no image is generated.
+        str: The path of the saved image, or None if no image is generated.
     """
     if prompt is None:
         return None  # No prompt, no image
 
+    tenant = tenant or get_tenant()
+    protagonist = tenant["protagonist"]
+    img_path = tenant["img_path"] or IMG_PATH
+    scope = tenant_scope(tenant)
+    atlas_dir = os.path.join(ATLAS_DIR, scope) if scope else ATLAS_DIR
+
     prompt_text = (
             f"The reference images provided are fictional character illustrations, each labeled by name. "
             f"Using the appropriate fictional character as artistic inspiration, "
@@ -298,582 +489,377 @@ def generate_image(prompt, bro):
             f"The result should be creative, illustrative, and not intended to represent any real person. "
     )
 
-    base64_image1 = encode_image(IMG_PATH + "John.png")
-    file_id1 = create_file(IMG_PATH + "John.png")
-
     if bro:
+        # One labeled protagonist+bro reference sheet instead of a separate input per portrait
         name = bro['name']
-        base64_image2 = encode_image(IMG_PATH + name +".png")
-        file_id2 = create_file(IMG_PATH + name +".png")
-
-        response = client.responses.create(
-            model="gpt-4.1-mini",
-            input=[
-                {
-                    "role": "user",
-                    "content": [
-                        {"type": "input_text", "text": prompt_text},
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{base64_image1}",
-                        },
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{base64_image2}",
-                        },
-                        {
-                            "type": "input_image",
-                            "file_id": file_id1,
-                        },
-                        {
-                            "type": "input_image",
-                            "file_id": file_id2,
-                        }
-                    ],
-                }
-            ],
-            tools=[{"type": "image_generation"}],
-        )
+        sheet_path = get_pair_sheet(img_path, atlas_dir, name, protagonist)
+        data_url, _ = encode_portrait(sheet_path, PORTRAIT_CACHE_DIR, detail, panels=2)
+        payload_bytes = len(data_url)
+
+        prompt_text += (f"The reference sheet shows {protagonist} on the left and {name} on the right, "
+                        f"each captioned by name. ")
+        content = [
+            {"type": "input_text", "text": prompt_text},
+            {
+                "type": "input_image",
+                "image_url": data_url,
+                # Low detail would shrink the whole sheet to 512px, leaving each face half that
+                "detail": "high",
+            },
+        ]
     else:
-        response = client.responses.create(
-            model="gpt-4.1-mini",
+        # Size-optimized variant of the reference portrait
+        data_url, _ = encode_portrait(os.path.join(img_path, f"{protagonist}.png"), PORTRAIT_CACHE_DIR, detail)
+        payload_bytes = len(data_url)
+
+        content = [
+            {"type": "input_text", "text": prompt_text},
+            {
+                "type": "input_image",
+                "image_url": data_url,
+                "detail": detail,
+            },
+        ]
+
+    print(f"---- reference payload: {payload_bytes} bytes ({content[-1]['detail']} detail) ----")
+
+    def request_image():
+        start = time.time()
+        response = create_response(
+            stage="image",
             input=[
                 {
                     "role": "user",
-                    "content": [
-                        {"type": "input_text", "text": prompt_text},
-                        {
-                            "type": "input_image",
-                            "image_url": f"data:image/jpeg;base64,{base64_image1}",
-                        },
-                        {
-                            "type": "input_image",
-                            "file_id": file_id1,
-                        }
-                    ],
+                    "content": content,
                 }
             ],
-            tools=[{"type": "image_generation"}],
+            tools=[image_tool(image_settings or {})],
         )
+        print(f"---- image request took {time.time() - start:.1f}s ----")
 
-    
-    image_generation_calls = [
-        output
-        for output in response.output
-        if output.type == "image_generation_call"
-    ]
+        image_data = [
+            output.result
+            for output in response.output
+            if output.type == "image_generation_call"
+        ]
 
-    image_data = [output.result for output in image_generation_calls]
+        if not image_data:
+            print(response.output)
+            return None
+        return base64.b64decode(image_data[0])
 
-    if image_data:
-        image_base64 = image_data[0]
-        with open("boj.png", "wb") as f:
-            f.write(base64.b64decode(image_base64))
+    if k > 1:
+        images = []
+        with ThreadPoolExecutor(max_workers=k) as pool:
+            futures = [pool.submit(request_image) for _ in range(k)]
+            for future in futures:
+                try:
+                    image = future.result()
+                except Exception as e:
+                    print(f"Image generation failed: {e}")
+                    continue
+                if image:
+                    images.append(image)
     else:
-        print(response.output.content)
+        image = request_image()
+        images = [image] if image else []
+
+    if not images:
+        return None
+
+    best = 0
+    if len(images) > 1:
+        best, scores = pick_best_image(images, recent_hashes)
+        print("---- image candidates ----")
+        for score, parts in scores:
+            print(f"{score:.3f} {parts}")
+
+    image_path = f"{image_base}." + (image_settings or {}).get("output_format", "png")
+    with open(image_path, "wb") as f:
+        f.write(images[best])
+    return image_path
 
-def generate_cocktail_recipe(theme, activity_data):
+def generate_cocktail_recipe(theme, activity_data, tenant=None):
     """
     Generates a cocktail recipe using the OpenAI GPT API.
 
     Args:
         theme (str): The selected theme for the story.
         activity_data (dict): The chosen activity data.
+        tenant (dict): The book, or None for the default one.
 
     Returns:
         str: The generated cocktail recipe in markdown format, or None if no recipe is generated.
     """
+    tenant = tenant or get_tenant()
     # Generate a recipe for these themes
-    response = client.chat.completions.create(
-        model="gpt-4.1-mini",
-        messages=[
-            {"role": "system", "content": "You are a mixologist. You mix up the most incredible cocktails."},
-            {"role": "user", "content": f"Craft a cocktail recipe inspired by the theme of {theme} "
-                                        f"and the activity of {activity_data['activity']}. "
-                                        f"Give the cocktail a name and present the output as you find in a recipe book. "
-                                        f"Only provide the drink name, recipe, and instructions. "
-                                        f"Do not provide any links. "
-                                        f"Provide the output in markdown formatting."},
-        ],
+    response = chat_completion(
+        stage="cocktail",
+        max_tokens=STAGE_MAX_TOKENS["cocktail"],
+        messages=cocktail_messages(theme, activity_data['activity'], tenant["protagonist"]),
+        extra_body={"prompt_cache_key": cache_key(tenant_scope(tenant))},
+        timeout=COCKTAIL_TIMEOUT,
         temperature=0.7,
     )
     return response.choices[0].message.content
 
-def upload_image_to_imgur():
+def get_image_publisher(name):
     """
-    Uploads the generated image to Imgur.
+    Returns the configured image hosting backend.
 
     Args:
-        image_url (str): The URL of the image.
+        name (str): "imgur", "local" or "s3".
 
     Returns:
-        str: The URL of the uploaded image on Imgur.
+        Publisher: The publisher instance.
     """
-    imgur_result = subprocess.run(
-        [HOME_DIR + "/.local/bin/imgur-uploader", "boj.png"],
-        stdout=subprocess.PIPE,
-    )
-
-    extractor = URLExtract()
-    imgur_str = str(imgur_result)
-    urls = extractor.find_urls(imgur_str)
-    return urls[0][:-4]  # Remove trailing newline character
+    if name == "imgur":
+        return ImgurPublisher(HOME_DIR + "/.local/bin/imgur-uploader")
+    elif name == "local":
+        return LocalHTTPPublisher(keys.image_serve_dir, keys.image_base_url)
+    elif name == "s3":
+        return S3Publisher(
+            keys.s3_bucket,
+            keys.s3_public_base_url,
+            endpoint_url=getattr(keys, "s3_endpoint_url", None),
+            access_key=getattr(keys, "s3_access_key", None),
+            secret_key=getattr(keys, "s3_secret_key", None),
+        )
+    else:
+        raise ValueError("Invalid image publisher. Please use 'imgur', 'local' or 's3'.")
 
-def send_slack_message(webhook_client, story, theme, activity_data, image_url, cocktail_recipe, content_style, str_numbers):
+def build_slack_message(story, theme, activity_data, image_url, cocktail_recipe, content_style, str_numbers, image_alt_text=None,
+                        tenant=None):
     """
-    Sends the generated story, image, and recipe to Slack.
+    Renders the story, image, and recipe into a Slack message payload.
 
     Args:
-        webhook_client (WebhookClient): The Slack WebhookClient instance.
         story (str): The generated story.
         theme (str): The selected theme for the story.
         activity_data (dict): The chosen activity data.
         image_url (str): The URL of the uploaded image.
         cocktail_recipe (str): The generated cocktail recipe.
         content_style (int): The selected content style.
+        str_numbers (str): The verse/psalm/proverb numbers shown in the context line.
+        image_alt_text (str): Alt text for the image, e.g. the image prompt.
+        tenant (dict): The book, or None for the default one.
+
+    Returns:
+        dict: {"text": intro text, "blocks": Slack blocks}
     """
-    try:
-        blocks = [
+    tenant = tenant or get_tenant()
+    blocks = [
+        {
+            "type": "header",
+            "text": {
+                "type": "plain_text",
+                "text": tenant["header"],
+            },
+        },
+        {
+            "type": "context",
+            "elements": [
+                {
+                    "text": f"Book of {theme.capitalize()} | Chapter "
+                            f"{activity_data['chapter_number']}: "
+                            f"{activity_data['chapter_title']} | "
+                            f"{style_name(content_style, tenant)} "
+                            f"{str_numbers}",
+                    "type": "mrkdwn",
+                }
+            ],
+        },
+        {"type": "divider"},
+        {
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": story},
+        },
+        {"type": "divider"},
+    ]
+
+    if image_url:
+        image_title = (f"[{theme.capitalize()} - Chapter "
+                       f"{activity_data['chapter_number']}: "
+                       f"{activity_data['chapter_title']}]")
+        blocks.extend([
             {
-                "type": "header",
-                "text": {
+                "type": "image",
+                "title": {
                     "type": "plain_text",
-                    "text": ":game_die: :beer: :game_die:  The Books of John  :game_die: :beer: :game_die:",
+                    "text": image_title,
+                    "emoji": True,
                 },
-            },
-            {
-                "type": "context",
-                "elements": [
-                    {
-                        "text": f"Book of {theme.capitalize()} | Chapter "
-                                f"{activity_data['chapter_number']}: "
-                                f"{activity_data['chapter_title']} | "
-                                f"{CONTENT_STYLES[content_style]} "
-                                f"{str_numbers}",
-                        "type": "mrkdwn",
-                    }
-                ],
+                "image_url": image_url,
+                "alt_text": (image_alt_text or image_title)[:2000],
             },
             {"type": "divider"},
-        ]
+        ])
 
-        if content_style == 1:  # Book/Chapter
-            blocks.extend([
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": story},
-                },
-                {"type": "divider"},
-            ])
-        elif content_style == 2:  # Psalms (Song Lyrics)
-            blocks.extend([
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": story},  # Format as lyrics
-                },
-                {"type": "divider"},
-            ])
-        elif content_style == 3:  # Proverbs (One-Sentence Examples)
-            blocks.extend([
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": story},  # Use bullet points
-                },
-                {"type": "divider"},
-            ])
-        elif content_style == 4:  # Parables (Short Story with Moral)
-            blocks.extend([
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": story},
-                },
-                {"type": "divider"},
-            ])
-        elif content_style == 5:  # Poem
-            blocks.extend([
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": story},  # Use code block for better formatting
-                },
-                {"type": "divider"},
-            ])
-        elif content_style == 6:  # Quips/Jokes
-            blocks.extend([
-                {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": story},  # Use bullet points
-                },
-                {"type": "divider"},
-            ])
+    if cocktail_recipe:
+        blocks.extend([
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": cocktail_recipe},
+            },
+        ])
+
+    if content_style == 1:
+        intro_text = f"A daily reading from {tenant['book_title'].upper()}..."
+    elif content_style == 2:
+        intro_text = "A new psalm has been revealed..."
+    elif content_style == 3:
+        intro_text = "Fresh proverbs have been unearthed..."
+    elif content_style == 4:
+        intro_text = "A new parable has emerged..."
+    elif content_style == 5:
+        intro_text = "A new verse has been composed..."
+    elif content_style == 6:
+        intro_text = "A new jest has been discovered..."
+
+    return {"text": intro_text, "blocks": blocks}
+
+def build_digest_message(editions, theme, activity_data, image_url, cocktail_recipe, image_alt_text=None, tenant=None):
+    """
+    Renders a digest, one section per content style, into a single Slack message payload.
 
-        if image_url:
-            blocks.extend([
-                {
-                    "type": "image",
-                    "title": {
-                        "type": "plain_text",
-                        "text": f"[{theme.capitalize()} - Chapter "
-                                f"{activity_data['chapter_number']}: "
-                                f"{activity_data['chapter_title']}]",
-                        "emoji": True,
-                    },
-                    "image_url": image_url,
-                    "alt_text": dalle_prompt,
-                },
-                {"type": "divider"},
-            ])
+    Args:
+        editions (dict): Content style -> edition record.
+        theme (str): The shared theme.
+        activity_data (dict): The shared activity data.
+        image_url (str): The URL of the shared image.
+        cocktail_recipe (str): The shared cocktail recipe.
+        image_alt_text (str): Alt text for the image, e.g. the image prompt.
+        tenant (dict): The book, or None for the default one.
 
-        if cocktail_recipe:
-            blocks.extend([
+    Returns:
+        dict: {"text": intro text, "blocks": Slack blocks}
+    """
+    tenant = tenant or get_tenant()
+    blocks = [
+        {
+            "type": "header",
+            "text": {
+                "type": "plain_text",
+                "text": tenant["header"],
+            },
+        },
+        {
+            "type": "context",
+            "elements": [
                 {
-                    "type": "section",
-                    "text": {"type": "mrkdwn", "text": cocktail_recipe},
-                },
-            ])
-
-        if content_style == 1:
-            intro_text="A daily reading from THE BOOKS OF JOHN...",
-        elif content_style == 2:
-            intro_text = "A new psalm has been revealed..."
-        elif content_style == 3:
-            intro_text = "Fresh proverbs have been unearthed..."
-        elif content_style == 4:
-            intro_text = "A new parable has emerged..."
-        elif content_style == 5:
-            intro_text = "A new verse has been composed..."
-        elif content_style == 6:
-            intro_text = "A new jest has been discovered..."
-
-        response = webhook_client.send(
-            text=intro_text,
-            blocks=blocks,
-        )
-        print("---- Slack responses ----")
-        print(response)
-
-    except SlackApiError as e:
-        # Log the error
-        print(f"Error sending Slack message: {e}")
-
-if __name__ == "__main__":
-
-    # variables for our book
-    book_title = "The Books of John"
-
-    emotions = [
-        "love",
-        "joy",
-        "anger",
-        "sadness",
-        "fear",
-        "surprise",
-        "disgust",
-        "envy",
-        "hope",
-        "hurt",
-        "shame",
-        "guilt",
-        "pride",
-        "desire",
-        "nostalgia",
-        "excitement",
-        "enlightenment",
-        "loneliness",
-        "jealousy",
-        "contentment",
-        "satisfaction",
-        "loathing",
-        "despair",
-        "passion",
-        "yearning",
-        "bitterness",
-        "ambivalence",
-        "melancholy",
-        "resentment",
-        "awe",
-        "confusion",
-        "anticipation",
-        "tranquility",
-        "happiness",
-        "amusement",
-        "absurdity",
-        "whimsy",
-        "outrage",
-        "insanity",
-        "hilarity",
-        "euphoria",
-        "gratitude",
-        "serenity",
-        "bliss",
-        "exhilaration",
-        "revelation"
+                    "text": f"Book of {theme.capitalize()} | Chapter "
+                            f"{activity_data['chapter_number']}: "
+                            f"{activity_data['chapter_title']} | Digest",
+                    "type": "mrkdwn",
+                }
+            ],
+        },
+        {"type": "divider"},
     ]
 
-    bro_dict = {
-
-            "JP":
-                {
-                  "sex": "male",
-                  "sex": "male",
-                  "name": "JP",
-                  "hair": "blonde",
-                  "eyes": "blue",
-                  "beard": False,
-                },
-
-            "Kris":
-                {
-                  "sex": "male",
-                  "name": "Kris",
-                  "hair": "blonde",
-                  "eyes": "blue",
-                  "beard": True
-                },
-
-            "Bilinski":
-                {
-                  "sex": "male",
-                  "name": "Bilinski",
-                  "hair": "blonde",
-                  "eyes": "blue",
-                  "beard": False
-                },
-
-            "Bobby":
-                {
-                  "sex": "male",
-                  "name": "Bobby",
-                  "hair": "long brown",
-                  "eyes": "brown",
-                  "beard": True
-                },
+    for content_style in sorted(editions):
+        edition = editions[content_style]
+        blocks.extend([
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": f"*{style_name(content_style, tenant)} {edition['str_numbers']}*"},
+            },
+            {
+                "type": "section",
+                "text": {"type": "mrkdwn", "text": edition["story"]},
+            },
+            {"type": "divider"},
+        ])
 
-            "Matt":
-                {
-                  "sex": "male",
-                  "name": "Matt",
-                  "hair": "short brown",
-                  "eyes": "brown",
-                  "beard": True
+    if image_url:
+        image_title = (f"[{theme.capitalize()} - Chapter "
+                       f"{activity_data['chapter_number']}: "
+                       f"{activity_data['chapter_title']}]")
+        blocks.extend([
+            {
+                "type": "image",
+                "title": {
+                    "type": "plain_text",
+                    "text": image_title,
+                    "emoji": True,
                 },
+                "image_url": image_url,
+                "alt_text": (image_alt_text or image_title)[:2000],
+            },
+            {"type": "divider"},
+        ])
 
-            "Robert":
-                {
-                  "sex": "male",
-                  "name": "Robert",
-                  "hair": "red",
-                  "eyes": "brown",
-                  "beard": True
-                },
+    if cocktail_recipe:
+        blocks.append({
+            "type": "section",
+            "text": {"type": "mrkdwn", "text": cocktail_recipe},
+        })
 
-            "Wells":
-                {
-                  "sex": "male",
-                  "name": "Wells",
-                  "hair": "short brown",
-                  "eyes": "blue",
-                  "beard": False
-                },
-            "Amy":
-                {
-                  "sex": "female",
-                  "name": "Amy",
-                  "hair": "long blonde",
-                  "eyes": "brown",
-                  "beard": False
-                },
-            "Brian":
-                {
-                  "sex": "male",
-                  "name": "Brian",
-                  "hair": "short brown",
-                  "eyes": "brown",
-                  "beard": True
-                },
-    }
+    return {"text": f"The complete daily digest from {tenant['book_title'].upper()}...", "blocks": blocks}
 
-    activities_list = [
-        {
-            "activity": "drinking whiskey",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "Whiskey",
-        },
-        {
-            "activity": "playing golf",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert"],
-            "chapter_title": "Tee Time",
-        },
-        {
-            "activity": "gambling at the casino",
-            "bro_list": ["JP", "Bilinski"],
-            "chapter_title": "Rain Man",
-        },
-        {
-            "activity": "watching sports",
-            "bro_list": ["JP", "Kris", "Bilinski", "Brian"],
-            "chapter_title": "The Sport",
-        },
-        {
-            "activity": "playing blackjack",
-            "bro_list": ["JP", "Bilinski"],
-            "chapter_title": "Counting Cards",
-        },
-        {
-            "activity": "throwing dice",
-            "bro_list": ["JP", "Kris", "Bilinski"],
-            "chapter_title": "Come 69",
-        },
-        {
-            "activity": "delivering a huge, empty package to Amy",
-            "bro_list": None,
-            "chapter_title": "Tracking Numbers",
-        },
-        {
-            "activity": "making cocktails",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "Mixology",
-        },
-        {
-            "activity": "drinking beers",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "Drinking, Part 2",
-        },
-        {
-            "activity": "enjoying craft beer",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "Fancy Drink",
-        },
-        {
-            "activity": "investing in cryptocurrency",
-            "bro_list": ["JP", "Bilinski", "Brian"],
-            "chapter_title": "Examination of Cryptocurrency Microeconomics",
-        },
-        {
-            "activity": "drinking wine",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "Side Wine",
-        },
-        {
-            "activity": "telling long stories",
-            "bro_list": None,
-            "chapter_title": "Verbose Logging",
-        },
-        {
-            "activity": "gaming the stock market",
-            "bro_list": ["JP"],
-            "chapter_title": "Stonks",
-        },
-        {
-            "activity": "playing old nintendo games",
-            "bro_list": ["JP", "Kris", "Brian"],
-            "chapter_title": "8-bit Adventures",
-        },
-        {
-            "activity": "jumping on the trampoline",
-            "bro_list": ["JP", "Kris", "Brian"],
-            "chapter_title": "The Dangers of Childhood",
-        },
-        {
-            "activity": "being shirtless",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "FREEDOM",
-        },
-        {
-            "activity": "smoking weed",
-            "bro_list": ["JP", "Bobby", "Robert"],
-            "chapter_title": "At 30,000 Ft",
-        },
-        {
-            "activity": "slaying a beast named Amy",
-            "bro_list": None,
-            "chapter_title": "The Great Hunt",
-        },
-        {
-            "activity": "playing slot machines",
-            "bro_list": ["JP", "Kris", "Bilinski"],
-            "chapter_title": "Grinding",
-        },
-        {
-            "activity": "drinking and driving",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "Road Sodes",
-        },
-        {
-            "activity": "getting nothing done",
-            "bro_list": None,
-            "chapter_title": "Fruitless Labor",
-        },
-        {
-            "activity": "wiping a crack in the wrong direction, which gets some balls dirty",
-            "bro_list": ["Bobby", "Wells"],
-            "chapter_title": "C2S",
-        },
-        {
-            "activity": "chillin in a hot tub",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "Hot Tub Tech 2",
-        },
-        {
-            "activity": "celebrating",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells"],
-            "chapter_title": "Celebrate",
-        },
-        {
-            "activity": "grilling a ny strip",
-            "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
-            "chapter_title": "MEAT",
-        },
-        {
-            "activity": "trimming hedges for hours",
-            "bro_list": None,
-            "chapter_title": "Trimming the Hedges",
-        },
-        {
-            "activity": "advocating for one of bernie sanders' economic, social, or foreign policies",
-            "bro_list": None,
-            "chapter_title": "Feel the Bern",
-        },
-    ]
+def start_outbox_delivery():
+    """
+    Starts a detached outbox delivery worker so this run can finish as soon
+    as its payload is queued.
+    """
+    subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "outbox.py"), "deliver", OUTBOX_PATH],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
 
-    # Set your OpenAI API key
-    client.api_key = OPENAI_API_KEY
+@contextmanager
+def stage_slot(stage):
+    """
+    Holds one of the stage's concurrency slots, if the stage is limited.
 
-    # Determine content style: command-line argument or random
-    content_style = None
-    is_dev_mode = False
+    stage_semaphores is empty for a normal run; the backfill job fills it
+    with process-shared semaphores so e.g. only a few image renders run at once.
+    """
+    semaphore = stage_semaphores.get(stage)
+    if semaphore is None:
+        yield
+        return
+    with semaphore:
+        yield
+
+def plan_edition(content_style=None, theme=None, activity_number=None, bro_key=None, rng=random, tenant=None):
+    """
+    Picks everything that is random about an edition.
 
-    if len(sys.argv) > 1:
-        for arg in sys.argv[1:]:
-            if arg == "--dev":
-                is_dev_mode = True
-                print("Posting to development")
-            elif arg == "--cs":
-                try:
-                    content_style = int(sys.argv[sys.argv.index(arg) + 1])
-                    if content_style not in range(1, 7):
-                        raise ValueError("Invalid content style. Please enter a number between 1 and 6.")
-                except (ValueError, IndexError):
-                    print("Invalid argument. Please provide a valid content style (1-6) after '--cs'.")
-                    sys.exit(1)
+    Args:
+        content_style (int): The content style (1-6), or None for a random one of the book's styles.
+        theme (str): The theme, or None for a random emotion.
+        activity_number (int): Index into the book's activities_list, or None for a random one.
+        bro_key (str): The bro, or None for a random one from the activity's bro_list.
+        rng (random.Random): Source of randomness, e.g. seeded for backfills.
+        tenant (dict): The book, or None for the default one.
 
+    Returns:
+        dict: The edition plan.
+    """
+    tenant = tenant or get_tenant()
     if content_style is None:
-        content_style = random.randint(1, 6)
-
-    print(CONTENT_STYLES[content_style])
+        content_style = rng.choice(tenant["content_styles"])
 
     # Pick a random emotion
-    theme = random.choice(emotions)
+    if theme is None:
+        theme = rng.choice(tenant["emotions"])
 
     # Storing activity number as the chapter number
-    activity_number = random.randint(0, len(activities_list) - 1)
-    activity_data = activities_list[activity_number]
+    activities = tenant["activities_list"]
+    if activity_number is None:
+        activity_number = rng.randint(0, len(activities) - 1)
+    activity_data = dict(activities[activity_number])
     activity_data['chapter_number'] = activity_number + 1  # Add chapter number to activity data
 
     # Get a bro (or not) to bro with
     bros = activity_data["bro_list"]
     if bros:
-        bro_key = random.choice(bros)
-        bro = bro_dict[bro_key]
+        if bro_key is None:
+            bro_key = rng.choice(bros)
+        bro = tenant["bro_dict"][bro_key]
 
         bro_gpt_text = f" with his bro {bro['name']}"
 
@@ -883,40 +869,687 @@ if __name__ == "__main__":
         bro_dalle_text = ""
         bro = None
 
-
     # Random number of verses and starting verse (if applicable)
     starting_verse = None
     number_verses = None
     if content_style == 1:  # Book/Chapter
-        starting_verse = random.randint(1, 995)
-        number_verses = random.randint(2, 4)
+        starting_verse = rng.randint(1, 995)
+        number_verses = rng.randint(2, 4)
         ending_verse = starting_verse + (number_verses - 1)
         str_numbers = f"{starting_verse} - {ending_verse}"
     elif content_style in [2, 4, 5, 6]: #Psalm/Parable/Peom/Jest
-        str_numbers = random.randint(1, 10000)
+        str_numbers = rng.randint(1, 10000)
     elif content_style == 3: #Proverb
-        str_numbers = f"{random.randint(1, 100), random.randint(200, 500), random.randint(4000, 10000)}" 
+        str_numbers = f"{rng.randint(1, 100), rng.randint(200, 500), rng.randint(4000, 10000)}"
+
+    return {
+        "edition_id": archive.new_edition_id(),
+        "tenant": tenant,
+        "content_style": content_style,
+        "theme": theme,
+        "activity_number": activity_number,
+        "activity_data": activity_data,
+        "bro_key": bro_key if bro else None,
+        "bro": bro,
+        "bro_gpt_text": bro_gpt_text,
+        "bro_dalle_text": bro_dalle_text,
+        "number_verses": number_verses,
+        "starting_verse": starting_verse,
+        "str_numbers": str_numbers,
+    }
+
+def produce_story(plan, trace, story_candidates=1):
+    """
+    Writes and validates the story for a plan.
+
+    Returns:
+        tuple: (story, validation report)
+    """
+    content_style = plan["content_style"]
+    number_verses = plan["number_verses"]
+    starting_verse = plan["starting_verse"]
 
     # Generate GPT prompt
-    gpt_prompt = get_gpt_prompt(content_style, theme, activity_data, bro_gpt_text, number_verses, starting_verse)
+    gpt_prompt = get_gpt_prompt(content_style, plan["theme"], plan["activity_data"], plan["bro_gpt_text"],
+                                number_verses, starting_verse)
+
+    # Generate GPT story, unless the API has been failing or too slow lately
+    fallback_reason = None
+    if get_model_router().degraded("story", FALLBACK_MAX_SECONDS):
+        fallback_reason = "story API degraded"
+    else:
+        try:
+            with stage_slot("story"), trace.span("story", style=content_style, candidates=story_candidates):
+                story = generate_gpt_story(
+                    gpt_prompt,
+                    content_style,
+                    n=story_candidates,
+                    number_verses=number_verses,
+                    starting_verse=starting_verse,
+                    recent_stories=(archive.recent_stories(ARCHIVE_PATH, tenant_id=plan["tenant"]["id"])
+                                    if story_candidates > 1 else ()),
+                    tenant=plan["tenant"],
+                )
+        except (openai.APIError, TimeoutError, ConnectionError) as e:
+            # Only an unreachable or failing API falls back; a bug in our own code should still surface
+            fallback_reason = repr(e)
+
+    if fallback_reason:
+        print(f"---- offline story ({fallback_reason}) ----")
+        with trace.span("story_fallback", style=content_style):
+            model = load_or_train(fallback_model_path(plan["tenant"]), ARCHIVE_PATH, plan["tenant"]["id"])
+            if model is None:
+                raise RuntimeError(f"The story API is unavailable ({fallback_reason}) and there is no archive "
+                                   f"to train the offline generator on.")
+            story = model.story(content_style, plan["theme"], plan["activity_data"]["activity"],
+                                plan["bro_gpt_text"], number_verses, starting_verse,
+                                protagonist=plan["tenant"]["protagonist"])
+        trace.decide("story_fallback", fallback_reason)
+
+    # Check the story against its style and repair it instead of re-running the edition
+    with trace.span("validate", style=content_style):
+        if fallback_reason:
+            story, validation = validate_story(story, content_style, number_verses, starting_verse)
+            validation["fallback"] = fallback_reason
+        else:
+            story, validation = validate_and_repair(repair_completion, story, content_style, number_verses,
+                                                    starting_verse)
+    if validation["problems"]:
+        print("---- story repairs ----")
+        print(validation["problems"])
+    return story, validation
+
+def produce_image(plan, story, trace, image_candidates=1, portrait_detail=PORTRAIT_DETAIL, image_base="boj"):
+    """
+    Writes the image prompt for a story and generates the image.
 
-    # Generate GPT story
-    story = generate_gpt_story(gpt_prompt, content_style)
+    The prompt is scored locally first; prompts the image tool would likely
+    refuse are rewritten, or not sent at all if rewriting doesn't help.
 
+    Returns:
+        tuple: (image prompt, path of the generated image or None, pre-flight result)
+    """
     # Generate DALL-E prompt (if applicable)
-    dalle_prompt = generate_dalle_prompt(story, bro_dalle_text, content_style)
+    with stage_slot("image_prompt"), trace.span("image_prompt"):
+        dalle_prompt = generate_dalle_prompt(story, plan["bro_dalle_text"], plan["content_style"], plan["tenant"])
+
+    # Pre-flight the prompt before paying for the image call
+    with trace.span("preflight"):
+        model = image_preflight.load_or_train(PREFLIGHT_MODEL_PATH, ARCHIVE_PATH)
+        preflight = image_preflight.check_image_prompt(dalle_prompt, model,
+                                                       lambda prompt: rewrite_image_prompt(prompt, plan["tenant"]))
+    preflight["original_prompt"] = dalle_prompt
+    trace.decide("preflight", {k: preflight[k] for k in ("score", "final_score", "categories", "rewrites", "skip")})
+    if preflight["rewrites"]:
+        print(f"---- image prompt rewritten ({preflight['score']} -> {preflight['final_score']}) ----")
+    if preflight["skip"]:
+        print(f"---- image skipped, prompt would likely be refused: {preflight['categories']} ----")
+        return dalle_prompt, None, preflight
+    dalle_prompt = preflight["prompt"]
+
+    # Pick image size/quality/format from the time left and recent render times
+    image_settings = choose_image_settings(
+        RUN_TIME_BUDGET - trace.elapsed(),
+        image_latencies(load_traces(TRACE_PATH, limit=200)),
+    )
+    trace.decide("image_settings", image_settings)
+    print(f"---- image settings: {image_settings} ----")
 
     # Generate DALL-E image (if applicable)
-    generate_image(dalle_prompt, bro)
+    with stage_slot("image"), trace.span("image", quality=image_settings["quality"], size=image_settings["size"], k=image_candidates):
+        image_path = generate_image(
+            dalle_prompt,
+            plan["bro"],
+            k=image_candidates,
+            recent_hashes=(archive.recent_image_hashes(ARCHIVE_PATH, tenant_id=plan["tenant"]["id"])
+                           if image_candidates > 1 else ()),
+            detail=portrait_detail,
+            image_settings=image_settings,
+            image_base=image_base,
+            tenant=plan["tenant"],
+        )
+    return dalle_prompt, image_path, preflight
+
+def transcode_edition_image(image_path, edition_id, trace):
+    """
+    Transcodes a generated image for hosting and the archive.
+
+    Returns:
+        dict: The files from transcode_image, or just the "original" image if
+            transcoding fails, so the paid-for edition still goes out.
+    """
+    try:
+        with trace.span("transcode"):
+            return transcode_image(image_path, IMAGE_ARCHIVE_DIR, edition_id)
+    except (OSError, ValueError) as e:
+        print(f"---- transcode failed, using the original image: {e} ----")
+        return {"original": image_path}
+
+def store_image(edition_id, image_files, trace, publisher_name=IMAGE_PUBLISHER):
+    """
+    Stores the compact copy (or the original, if it couldn't be transcoded)
+    by content hash and publishes it; the original stays in the image archive.
+
+    Returns:
+        tuple: (image SHA-256, public URL); either may be None.
+    """
+    with stage_slot("upload"), trace.span("upload", publisher=publisher_name):
+        if not image_files:
+            return None, None
+        image_store = ImageStore(IMAGE_STORE_DIR)
+        image_sha = image_store.put(image_files.get("compact") or image_files["original"])
+        image_store.record_edition(edition_id, image_sha)
+        image_url = None
+        if publisher_name:
+            try:
+                image_url = image_store.publish(image_sha, get_image_publisher(publisher_name))
+            except (PublishError, OSError) as e:
+                # Post without the image rather than not at all; it is stored and can be reposted
+                print(f"---- image upload failed: {e} ----")
+        return image_sha, image_url
+
+def mix_cocktail(plan, trace, recipe_cache, cache_only=False):
+    """
+    Args:
+        cache_only (bool): Don't call the API, e.g. because the story already fell back to the offline model.
+
+    Returns:
+        str: The cocktail recipe, reused from the cache when we can.
+    """
+    theme = plan["theme"]
+    activity_data = plan["activity_data"]
+    if cache_only:
+        with trace.span("cocktail", cache_only=True):
+            return recipe_cache.cached_recipe(theme, activity_data['activity'])
+    try:
+        with stage_slot("cocktail"), trace.span("cocktail"):
+            return recipe_cache.get_recipe(
+                theme,
+                activity_data['activity'],
+                lambda: generate_cocktail_recipe(theme, activity_data, plan["tenant"]),
+            )
+    except Exception as e:
+        # Post without a cocktail rather than not at all
+        print(f"---- no cocktail: {e} ----")
+        return None
+
+def edition_record(plan, story, validation, dalle_prompt, image_path, image_files, image_sha, image_url, cocktail_recipe,
+                   preflight=None):
+    """
+    Returns:
+        dict: The edition record, as archived.
+    """
+    activity_data = plan["activity_data"]
+    bro = plan["bro"]
+    return {
+        "edition_id": plan["edition_id"],
+        "tenant": plan["tenant"]["id"],
+        "book_title": plan["tenant"]["book_title"],
+        "created": time.time(),
+        "theme": plan["theme"],
+        "chapter_number": activity_data['chapter_number'],
+        "chapter_title": activity_data['chapter_title'],
+        "activity": activity_data['activity'],
+        "content_style": plan["content_style"],
+        "style_name": style_name(plan["content_style"], plan["tenant"]),
+        "bro": bro['name'] if bro else None,
+        "str_numbers": str(plan["str_numbers"]),
+        "story": story,
+        "validation": validation,
+        "dalle_prompt": dalle_prompt,
+        "preflight": {k: v for k, v in preflight.items() if k != "prompt"} if preflight else None,
+        # Sent but no image back: what the pre-flight model learns from
+        "image_refused": bool(dalle_prompt) and not image_path and not (preflight or {}).get("skip"),
+        "image_url": image_url,
+        "image_sha": image_sha,
+        "image_hash": image_hash(image_path) if image_path else None,
+        "image_files": image_files,
+        "cocktail_recipe": cocktail_recipe,
+    }
+
+def produce_edition(plan, trace, recipe_cache, story_candidates=1, image_candidates=1,
+                    portrait_detail=PORTRAIT_DETAIL, publisher_name=IMAGE_PUBLISHER, image_base="boj"):
+    """
+    Runs the generation pipeline for a plan: story, image, cocktail and image hosting.
+
+    Args:
+        plan (dict): The edition plan from plan_edition.
+        trace (RunTrace): Where stage timings and decisions are recorded.
+        recipe_cache (RecipeCache): The cocktail recipe cache.
+        story_candidates (int): Story candidates requested per completion call.
+        image_candidates (int): Images generated concurrently.
+        portrait_detail (str): Reference portrait detail, "low" or "high".
+        publisher_name (str): Image hosting backend, or None to only store the image locally.
+        image_base (str): Path (without extension) the raw generated image is written to.
+
+    Returns:
+        dict: The edition record, as archived.
+    """
+    edition_id = plan["edition_id"]
+
+    story, validation = produce_story(plan, trace, story_candidates)
+    if "fallback" in validation:
+        # The API is down; an offline edition goes out without an image
+        dalle_prompt, image_path, preflight = None, None, None
+    else:
+        dalle_prompt, image_path, preflight = produce_image(plan, story, trace, image_candidates, portrait_detail,
+                                                            image_base)
+
+    # Transcode the image in a worker thread while the cocktail is mixed
+    with ThreadPoolExecutor(max_workers=1) as transcode_pool:
+        transcode_future = transcode_pool.submit(transcode_edition_image, image_path, edition_id, trace) \
+            if image_path else None
+        cocktail_recipe = mix_cocktail(plan, trace, recipe_cache, cache_only="fallback" in validation)
+        image_files = transcode_future.result() if transcode_future else None
+
+    image_sha, image_url = store_image(edition_id, image_files, trace, publisher_name)
+
+    return edition_record(plan, story, validation, dalle_prompt, image_path, image_files, image_sha, image_url,
+                          cocktail_recipe, preflight)
+
+def plan_digest(rng=random, tenant=None):
+    """
+    Plans one edition per content style of a book, all sharing a theme, activity and bro.
+
+    Returns:
+        dict: Content style -> edition plan.
+    """
+    tenant = tenant or get_tenant()
+    base = plan_edition(rng=rng, tenant=tenant)
+    return {
+        content_style: plan_edition(content_style, base["theme"], base["activity_number"], base["bro_key"], rng,
+                                    tenant)
+        for content_style in tenant["content_styles"]
+    }
+
+def digest_image_style(plans):
+    """
+    Returns:
+        int: The content style whose story a digest's image is drawn from.
+    """
+    return DIGEST_IMAGE_STYLE if DIGEST_IMAGE_STYLE in plans else min(plans)
+
+def produce_digest(plans, trace, recipe_cache, story_candidates=1, image_candidates=1,
+                   portrait_detail=PORTRAIT_DETAIL, publisher_name=IMAGE_PUBLISHER, image_base="boj"):
+    """
+    Generates every style's story concurrently, with one shared image and cocktail.
+
+    The cocktail only depends on the theme and activity, so it starts right
+    away; the image is drawn from the DIGEST_IMAGE_STYLE story (if the book
+    has that style) as soon as that one is written, while the other stories
+    are still being generated.
+
+    Args:
+        plans (dict): Content style -> plan, from plan_digest.
+
+    Returns:
+        dict: Content style -> edition record.
+    """
+    image_style = digest_image_style(plans)
+    image_plan = plans[image_style]
+
+    with ThreadPoolExecutor(max_workers=len(plans) + 1) as pool:
+        # Mixed before any story is back, so only a story API that is already known to be down can skip it
+        cocktail_future = pool.submit(mix_cocktail, image_plan, trace, recipe_cache,
+                                      get_model_router().degraded("story", FALLBACK_MAX_SECONDS))
+        story_futures = {
+            content_style: pool.submit(produce_story, plan, trace, story_candidates)
+            for content_style, plan in plans.items()
+        }
+
+        image_story, image_validation = story_futures[image_style].result()
+        dalle_prompt, image_path, preflight = None, None, None
+        if "fallback" not in image_validation:
+            dalle_prompt, image_path, preflight = produce_image(image_plan, image_story, trace, image_candidates,
+                                                                portrait_detail, image_base)
+        image_files = transcode_edition_image(image_path, image_plan["edition_id"], trace) if image_path else None
+
+        stories = {content_style: future.result() for content_style, future in story_futures.items()}
+        cocktail_recipe = cocktail_future.result()
+
+    image_sha, image_url = store_image(image_plan["edition_id"], image_files, trace, publisher_name)
+
+    editions = {}
+    for content_style, plan in plans.items():
+        story, validation = stories[content_style]
+        # The image outcome is recorded once, on the style it was drawn from, so a refusal counts once
+        drawn_from = content_style == image_style
+        editions[content_style] = edition_record(plan, story, validation, dalle_prompt, image_path, image_files,
+                                                 image_sha, image_url, cocktail_recipe,
+                                                 preflight if drawn_from else None)
+        editions[content_style]["digest_id"] = image_plan["edition_id"]
+        if not drawn_from:
+            editions[content_style]["image_refused"] = False
+    return editions
+
+def publish_edition(edition_id, payload, trace, destinations):
+    """
+    Commits a rendered payload to the outbox for every destination and fans
+    it out concurrently.
+
+    Args:
+        edition_id (str): The edition (or digest) id.
+        payload (dict): The payload from build_slack_message or build_digest_message.
+        trace (RunTrace): Where stage timings and decisions are recorded.
+        destinations (list): Destinations from get_slack_destinations.
+
+    Returns:
+        list: (idempotency key, status, error) per destination.
+    """
+    outbox = Outbox(OUTBOX_PATH)
+
+    # Commit the payload for every destination before any network call
+    with trace.span("slack", destinations=len(destinations)):
+        for destination in destinations:
+            outbox.enqueue(destination["url"], payload, idempotency_key=f"{edition_id}:{destination['name']}",
+                           rate_per_minute=destination["rate_per_minute"])
+
+    # Fan out to every destination concurrently; anything that fails is retried by a separate worker
+    with trace.span("delivery", destinations=len(destinations)):
+        delivery = outbox.deliver_pending(
+            limit=len(destinations),
+            workers=len(destinations),
+            rate_limiter=RateLimiter({d["url"]: d["rate_per_minute"] for d in destinations if d["rate_per_minute"]}),
+            key_prefix=f"{edition_id}:",
+        )
+    trace.decide("delivery", {key.split(":", 1)[1]: status for key, status, _ in delivery})
+    if outbox.pending_count():
+        start_outbox_delivery()
+    return delivery
 
-    # store to imgur
-    imgur_url = upload_image_to_imgur()
+def repost_edition(edition_id, is_dev_mode, publisher_name=IMAGE_PUBLISHER):
+    """
+    Posts an archived edition again with the image already in the image
+    store, so nothing is generated and nothing is uploaded twice.
 
-    # Generate cocktail recipe (if applicable)
-    cocktail_recipe = generate_cocktail_recipe(theme, activity_data)
+    Args:
+        edition_id (str): The archived edition's id.
+        is_dev_mode (bool): Post to the development destinations.
+        publisher_name (str): Where the image is hosted; it is only uploaded if it isn't there yet.
 
-    # Get webhook client
-    webhook_client = get_webhook_client(is_dev_mode)
+    Returns:
+        list: (idempotency key, status, error) per destination.
+    """
+    edition = next((e for e in archive.load_editions(ARCHIVE_PATH) if e.get("edition_id") == edition_id), None)
+    if edition is None:
+        raise ValueError(f"No archived edition {edition_id}.")
+    tenant = get_tenant(edition.get("tenant", DEFAULT_TENANT_ID))
+
+    # A digest's image is stored under the digest id
+    image_url = edition.get("image_url")
+    image_store = ImageStore(IMAGE_STORE_DIR)
+    image_sha = image_store.edition_sha(edition.get("digest_id", edition_id))
+    if image_sha and publisher_name:
+        image_url = image_store.publish(image_sha, get_image_publisher(publisher_name))
+
+    activity_data = {key: edition[key] for key in ("chapter_number", "chapter_title", "activity")}
+    payload = build_slack_message(edition["story"], edition["theme"], activity_data, image_url,
+                                  edition.get("cocktail_recipe"), edition["content_style"], edition["str_numbers"],
+                                  image_alt_text=edition.get("dalle_prompt"), tenant=tenant)
+
+    # Its own id, so the outbox doesn't take it for the original delivery
+    repost_id = f"{edition_id}-repost-{archive.new_edition_id()}"
+    trace = RunTrace(repost_id)
+    delivery = publish_edition(repost_id, payload, trace, get_slack_destinations(is_dev_mode, tenant))
+    trace.save(TRACE_PATH)
+    return delivery
+
+def run_book(tenant, content_style, is_digest, is_dev_mode, recipe_cache, profiler=None, story_candidates=1,
+             image_candidates=1, portrait_detail=PORTRAIT_DETAIL):
+    """
+    Plans, generates and publishes one book's edition (or digest).
 
-    # Send Slack message
-    send_slack_message(webhook_client, story, theme, activity_data, imgur_url, cocktail_recipe, content_style, str_numbers)
+    Args:
+        tenant (dict): The book.
+        content_style (int): The content style, or None for a random one.
+        is_digest (bool): Post every style in one digest instead.
+        is_dev_mode (bool): Post to the development webhook.
+        recipe_cache (RecipeCache): The cocktail recipe cache, shared by every book.
+        profiler (RunProfiler): Profiles the run's stages, if given.
+
+    Returns:
+        tuple: (content style -> edition record, validation report(s), delivery results, RunTrace)
+    """
+    # Books other than the default one render into their own working image
+    scope = tenant_scope(tenant)
+
+    if is_digest:
+        # Every content style for the same theme/activity/bro, in one post
+        plans = plan_digest(tenant=tenant)
+        image_plan = plans[digest_image_style(plans)]
+        digest_id = image_plan["edition_id"]
+        print(f"Digest ({tenant['book_title']})")
+
+        image_base = os.path.join(DATA_DIR, "work", digest_id) if scope else "boj"
+        if scope:
+            os.makedirs(os.path.dirname(image_base), exist_ok=True)
+        trace = RunTrace(digest_id, profiler)
+        editions = produce_digest(
+            plans,
+            trace,
+            recipe_cache,
+            story_candidates=story_candidates,
+            image_candidates=image_candidates,
+            portrait_detail=portrait_detail,
+            image_base=image_base,
+        )
+        shared = editions[image_plan["content_style"]]
+        payload = build_digest_message(editions, shared["theme"], image_plan["activity_data"], shared["image_url"],
+                                       shared["cocktail_recipe"], shared["dalle_prompt"], tenant)
+        delivery = publish_edition(digest_id, payload, trace, get_slack_destinations(is_dev_mode, tenant))
+        validations = {content_style: edition["validation"] for content_style, edition in editions.items()}
+        return editions, validations, delivery, trace
+
+    plan = plan_edition(content_style, tenant=tenant)
+    print(f"{style_name(plan['content_style'], tenant)} ({tenant['book_title']})")
+
+    image_base = os.path.join(DATA_DIR, "work", plan["edition_id"]) if scope else "boj"
+    if scope:
+        os.makedirs(os.path.dirname(image_base), exist_ok=True)
+    trace = RunTrace(plan["edition_id"], profiler)
+    edition = produce_edition(
+        plan,
+        trace,
+        recipe_cache,
+        story_candidates=story_candidates,
+        image_candidates=image_candidates,
+        portrait_detail=portrait_detail,
+        image_base=image_base,
+    )
+    payload = build_slack_message(edition["story"], edition["theme"], plan["activity_data"], edition["image_url"],
+                                  edition["cocktail_recipe"], edition["content_style"], plan["str_numbers"],
+                                  image_alt_text=edition["dalle_prompt"], tenant=tenant)
+    delivery = publish_edition(edition["edition_id"], payload, trace, get_slack_destinations(is_dev_mode, tenant))
+    return {plan["content_style"]: edition}, edition["validation"], delivery, trace
+
+def get_recipe_cache():
+    """
+    Returns:
+        RecipeCache: The cocktail recipe cache with the configured settings.
+    """
+    return RecipeCache(
+        RECIPE_CACHE_PATH,
+        reuse_probability=RECIPE_REUSE_PROBABILITY,
+        ttl_seconds=RECIPE_TTL_DAYS * 24 * 3600,
+        max_keys=RECIPE_CACHE_MAX_KEYS,
+    )
+
+if __name__ == "__main__":
+
+    # Set your OpenAI API key
+    client.api_key = OPENAI_API_KEY
+
+    # Determine content style: command-line argument or random
+    content_style = None
+    is_dev_mode = False
+    story_candidates = STORY_CANDIDATES
+    image_candidates = IMAGE_CANDIDATES
+    portrait_detail = PORTRAIT_DETAIL
+    is_digest = False
+    profiler = None
+    tenant_id = None
+    all_tenants = False
+    repost_id = None
+    metrics_port = None
+
+    if len(sys.argv) > 1:
+        for arg in sys.argv[1:]:
+            if arg == "--dev":
+                is_dev_mode = True
+                print("Posting to development")
+            elif arg == "--digest":
+                is_digest = True
+            elif arg == "--all-tenants":
+                all_tenants = True
+            elif arg == "--tenant":
+                try:
+                    tenant_id = sys.argv[sys.argv.index(arg) + 1]
+                    get_tenant(tenant_id)
+                except (ValueError, IndexError) as e:
+                    print(f"Invalid argument. Please provide a configured tenant after '--tenant'. {e}")
+                    sys.exit(1)
+            elif arg == "--repost":
+                try:
+                    repost_id = sys.argv[sys.argv.index(arg) + 1]
+                except IndexError:
+                    print("Invalid argument. Please provide an archived edition id after '--repost'.")
+                    sys.exit(1)
+            elif arg == "--profile":
+                # cProfile per stage, tracemalloc and a collapsed-stack dump under DATA_DIR/profiles/
+                profiler = RunProfiler(os.path.join(PROFILE_DIR, time.strftime("%Y%m%d-%H%M%S")))
+            elif arg == "--cs":
+                try:
+                    content_style = int(sys.argv[sys.argv.index(arg) + 1])
+                except (ValueError, IndexError):
+                    print("Invalid argument. Please provide a content style number after '--cs'.")
+                    sys.exit(1)
+            elif arg == "--candidates":
+                try:
+                    story_candidates = int(sys.argv[sys.argv.index(arg) + 1])
+                    if story_candidates < 1:
+                        raise ValueError("Number of candidates must be at least 1.")
+                except (ValueError, IndexError):
+                    print("Invalid argument. Please provide a number of story candidates after '--candidates'.")
+                    sys.exit(1)
+            elif arg == "--images":
+                try:
+                    image_candidates = int(sys.argv[sys.argv.index(arg) + 1])
+                    if image_candidates < 1:
+                        raise ValueError("Number of images must be at least 1.")
+                except (ValueError, IndexError):
+                    print("Invalid argument. Please provide a number of images after '--images'.")
+                    sys.exit(1)
+            elif arg == "--metrics-port":
+                # Serve /metrics while the run lasts, e.g. to watch a long --all-tenants run
+                try:
+                    metrics_port = int(sys.argv[sys.argv.index(arg) + 1])
+                except (ValueError, IndexError):
+                    print("Invalid argument. Please provide a port number after '--metrics-port'.")
+                    sys.exit(1)
+            elif arg == "--detail":
+                try:
+                    portrait_detail = sys.argv[sys.argv.index(arg) + 1]
+                    if portrait_detail not in ("low", "high"):
+                        raise ValueError("Invalid detail. Please use 'low' or 'high'.")
+                except (ValueError, IndexError):
+                    print("Invalid argument. Please provide 'low' or 'high' after '--detail'.")
+                    sys.exit(1)
+
+    if content_style is not None:
+        # The book(s) must offer the style; --tenant may come after --cs
+        books = get_tenants().values() if all_tenants else [get_tenant(tenant_id)]
+        for book in books:
+            if content_style not in book["content_styles"]:
+                print(f"Invalid argument. {book['book_title']} has content styles {book['content_styles']}; "
+                      f"please provide one of them after '--cs'.")
+                sys.exit(1)
+
+    if repost_id:
+        try:
+            delivery = repost_edition(repost_id, is_dev_mode)
+        except (ValueError, PublishError) as e:
+            print(e)
+            sys.exit(1)
+        for key, status, error in delivery:
+            print(f"delivery {key.split(':', 1)[1]}: {status}" + (f" ({error})" if error else ""))
+        sys.exit(0)
+
+    if metrics_port is not None:
+        try:
+            start_metrics_server(metrics_port)
+        except OSError as e:
+            # Nothing to scrape then; the run itself doesn't need it
+            print(f"---- metrics server failed: {e} ----")
+        else:
+            print(f"---- metrics on http://127.0.0.1:{metrics_port}/metrics ----")
+
+    if profiler:
+        profiler.start()
+
+    recipe_cache = get_recipe_cache()
+
+    if all_tenants:
+        # Every book's edition from this one process, sharing the OpenAI client, rate
+        # limits, model router and caches; each book gets its own trace and destinations
+        tenants = list(get_tenants().values())
+        scheduler = FairScheduler({tenant["id"]: tenant["weight"] for tenant in tenants})
+        for tenant in tenants:
+            scheduler.put(tenant["id"], tenant)
+        served = serve(
+            scheduler,
+            lambda _, tenant: run_book(tenant, content_style, is_digest, is_dev_mode, recipe_cache, profiler,
+                                       story_candidates, image_candidates, portrait_detail),
+            TENANT_WORKERS,
+        )
+        runs = []
+        for book_id, _, run, error in served:
+            if error is None:
+                runs.append(run)
+            else:
+                print(f"---- {book_id} failed: {error!r} ----")
+    else:
+        runs = [run_book(get_tenant(tenant_id), content_style, is_digest, is_dev_mode, recipe_cache, profiler,
+                         story_candidates, image_candidates, portrait_detail)]
+
+    # Keep a record of the edition(s)
+    for editions, _, _, _ in runs:
+        for edition in editions.values():
+            archive.append_edition(ARCHIVE_PATH, edition)
+
+    if SITE_DIR:
+        try:
+            print(f"---- archive site: {build_site(ARCHIVE_PATH, SITE_DIR)} ----")
+        except Exception as e:
+            # The editions are out; the site catches up on the next run
+            print(f"---- archive site build failed: {e!r} ----")
+
+    # Let any background recipe refills land before we persist the cache
+    recipe_cache.wait_for_refills()
+    recipe_cache.save()
+
+    print("---- run summary ----")
+    print(f"recipe cache: {recipe_cache.summary()}")
+    for editions, validations, delivery, trace in runs:
+        if len(runs) > 1:
+            print(f"---- {next(iter(editions.values()))['tenant']} ----")
+        print(f"story validation: {validations}")
+        for key, status, error in delivery:
+            print(f"delivery {key.split(':', 1)[1]}: {status}" + (f" ({error})" if error else ""))
+        for span in trace.spans:
+            print(f"{span['stage']}: {span['seconds']:.2f}s")
+        print(f"total: {trace.elapsed():.2f}s")
+
+    if profiler:
+        print("---- profile ----")
+        print(profiler.stop({"import seconds": f"{_imports_seconds:.2f}"}))
+        print(f"reports in {profiler.out_dir}")
+
+    for _, _, _, trace in runs:
+        trace.save(TRACE_PATH)
+
+    # A one-shot run is over before anything could scrape it
+    if METRICS_PUSHGATEWAY:
+        try:
+            push_metrics(METRICS_PUSHGATEWAY, "boj2")
+        except OSError as e:
+            print(f"---- metrics push failed: {e} ----")
@@ -0,0 +1,277 @@
+# variables for our book
+book_title = "The Books of John"
+
+emotions = [
+    "love",
+    "joy",
+    "anger",
+    "sadness",
+    "fear",
+    "surprise",
+    "disgust",
+    "envy",
+    "hope",
+    "hurt",
+    "shame",
+    "guilt",
+    "pride",
+    "desire",
+    "nostalgia",
+    "excitement",
+    "enlightenment",
+    "loneliness",
+    "jealousy",
+    "contentment",
+    "satisfaction",
+    "loathing",
+    "despair",
+    "passion",
+    "yearning",
+    "bitterness",
+    "ambivalence",
+    "melancholy",
+    "resentment",
+    "awe",
+    "confusion",
+    "anticipation",
+    "tranquility",
+    "happiness",
+    "amusement",
+    "absurdity",
+    "whimsy",
+    "outrage",
+    "insanity",
+    "hilarity",
+    "euphoria",
+    "gratitude",
+    "serenity",
+    "bliss",
+    "exhilaration",
+    "revelation"
+]
+
+bro_dict = {
+
+        "JP":
+            {
+              "sex": "male",
+              "sex": "male",
+              "name": "JP",
+              "hair": "blonde",
+              "eyes": "blue",
+              "beard": False,
+            },
+
+        "Kris":
+            {
+              "sex": "male",
+              "name": "Kris",
+              "hair": "blonde",
+              "eyes": "blue",
+              "beard": True
+            },
+
+        "Bilinski":
+            {
+              "sex": "male",
+              "name": "Bilinski",
+              "hair": "blonde",
+              "eyes": "blue",
+              "beard": False
+            },
+
+        "Bobby":
+            {
+              "sex": "male",
+              "name": "Bobby",
+              "hair": "long brown",
+              "eyes": "brown",
+              "beard": True
+            },
+
+        "Matt":
+            {
+              "sex": "male",
+              "name": "Matt",
+              "hair": "short brown",
+              "eyes": "brown",
+              "beard": True
+            },
+
+        "Robert":
+            {
+              "sex": "male",
+              "name": "Robert",
+              "hair": "red",
+              "eyes": "brown",
+              "beard": True
+            },
+
+        "Wells":
+            {
+              "sex": "male",
+              "name": "Wells",
+              "hair": "short brown",
+              "eyes": "blue",
+              "beard": False
+            },
+        "Amy":
+            {
+              "sex": "female",
+              "name": "Amy",
+              "hair": "long blonde",
+              "eyes": "brown",
+              "beard": False
+            },
+        "Brian":
+            {
+              "sex": "male",
+              "name": "Brian",
+              "hair": "short brown",
+              "eyes": "brown",
+              "beard": True
+            },
+}
+
+activities_list = [
+    {
+        "activity": "drinking whiskey",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "Whiskey",
+    },
+    {
+        "activity": "playing golf",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert"],
+        "chapter_title": "Tee Time",
+    },
+    {
+        "activity": "gambling at the casino",
+        "bro_list": ["JP", "Bilinski"],
+        "chapter_title": "Rain Man",
+    },
+    {
+        "activity": "watching sports",
+        "bro_list": ["JP", "Kris", "Bilinski", "Brian"],
+        "chapter_title": "The Sport",
+    },
+    {
+        "activity": "playing blackjack",
+        "bro_list": ["JP", "Bilinski"],
+        "chapter_title": "Counting Cards",
+    },
+    {
+        "activity": "throwing dice",
+        "bro_list": ["JP", "Kris", "Bilinski"],
+        "chapter_title": "Come 69",
+    },
+    {
+        "activity": "delivering a huge, empty package to Amy",
+        "bro_list": None,
+        "chapter_title": "Tracking Numbers",
+    },
+    {
+        "activity": "making cocktails",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "Mixology",
+    },
+    {
+        "activity": "drinking beers",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "Drinking, Part 2",
+    },
+    {
+        "activity": "enjoying craft beer",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "Fancy Drink",
+    },
+    {
+        "activity": "investing in cryptocurrency",
+        "bro_list": ["JP", "Bilinski", "Brian"],
+        "chapter_title": "Examination of Cryptocurrency Microeconomics",
+    },
+    {
+        "activity": "drinking wine",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "Side Wine",
+    },
+    {
+        "activity": "telling long stories",
+        "bro_list": None,
+        "chapter_title": "Verbose Logging",
+    },
+    {
+        "activity": "gaming the stock market",
+        "bro_list": ["JP"],
+        "chapter_title": "Stonks",
+    },
+    {
+        "activity": "playing old nintendo games",
+        "bro_list": ["JP", "Kris", "Brian"],
+        "chapter_title": "8-bit Adventures",
+    },
+    {
+        "activity": "jumping on the trampoline",
+        "bro_list": ["JP", "Kris", "Brian"],
+        "chapter_title": "The Dangers of Childhood",
+    },
+    {
+        "activity": "being shirtless",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "FREEDOM",
+    },
+    {
+        "activity": "smoking weed",
+        "bro_list": ["JP", "Bobby", "Robert"],
+        "chapter_title": "At 30,000 Ft",
+    },
+    {
+        "activity": "slaying a beast named Amy",
+        "bro_list": None,
+        "chapter_title": "The Great Hunt",
+    },
+    {
+        "activity": "playing slot machines",
+        "bro_list": ["JP", "Kris", "Bilinski"],
+        "chapter_title": "Grinding",
+    },
+    {
+        "activity": "drinking and driving",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "Road Sodes",
+    },
+    {
+        "activity": "getting nothing done",
+        "bro_list": None,
+        "chapter_title": "Fruitless Labor",
+    },
+    {
+        "activity": "wiping a crack in the wrong direction, which gets some balls dirty",
+        "bro_list": ["Bobby", "Wells"],
+        "chapter_title": "C2S",
+    },
+    {
+        "activity": "chillin in a hot tub",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "Hot Tub Tech 2",
+    },
+    {
+        "activity": "celebrating",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells"],
+        "chapter_title": "Celebrate",
+    },
+    {
+        "activity": "grilling a ny strip",
+        "bro_list": ["JP", "Kris", "Bilinski", "Bobby", "Matt", "Robert", "Wells", "Brian"],
+        "chapter_title": "MEAT",
+    },
+    {
+        "activity": "trimming hedges for hours",
+        "bro_list": None,
+        "chapter_title": "Trimming the Hedges",
+    },
+    {
+        "activity": "advocating for one of bernie sanders' economic, social, or foreign policies",
+        "bro_list": None,
+        "chapter_title": "Feel the Bern",
+    },
+]
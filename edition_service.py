@@ -0,0 +1,360 @@
+import json
+import os
+import random
+import re
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import IN_FLIGHT, QUEUE_DEPTH, REGISTRY
+from tenants import DEFAULT_TENANT_ID, FairScheduler, default_tenant, load_tenants
+
+# Editions generated at once, and editions each book may have waiting for a worker
+WORKERS = 2
+QUEUE_LIMIT = 8
+
+# Finished jobs are kept this long for GET /editions/{id}
+JOB_TTL = 3600
+
+_EDITION_PATH_RE = re.compile(r"^/editions/([\w-]+)$")
+
+
+def run_pipeline(overrides, recipe_cache=None):
+    """
+    Generates, publishes and archives one edition, like a boj2.py run.
+
+    Args:
+        overrides (dict): Optional "tenant", "style", "theme" and "activity" (chapter number).
+        recipe_cache (RecipeCache): The cocktail recipe cache shared by the service's workers,
+            or None to load one for this run.
+
+    Returns:
+        dict: The edition record.
+    """
+    import boj2
+
+    tenant = boj2.get_tenant(overrides.get("tenant"))
+    activity = overrides.get("activity")
+    plan = boj2.plan_edition(overrides.get("style"), overrides.get("theme"),
+                             activity - 1 if activity else None, tenant=tenant)
+    trace = boj2.RunTrace(plan["edition_id"])
+    recipe_cache = recipe_cache or boj2.get_recipe_cache()
+
+    # Every run gets its own working image so concurrent runs don't clash
+    work_dir = os.path.join(boj2.DATA_DIR, "work")
+    os.makedirs(work_dir, exist_ok=True)
+    image_base = os.path.join(work_dir, plan["edition_id"])
+    edition = boj2.produce_edition(plan, trace, recipe_cache, image_base=image_base)
+    image_files = edition["image_files"] or {}
+    if image_files.get("compact"):
+        # The image archive has its own copy now; if transcoding failed, the working image is the original
+        os.remove(image_base + os.path.splitext(image_files["original"])[1])
+    payload = boj2.build_slack_message(edition["story"], edition["theme"], plan["activity_data"], edition["image_url"],
+                                       edition["cocktail_recipe"], edition["content_style"], plan["str_numbers"],
+                                       image_alt_text=edition["dalle_prompt"], tenant=tenant)
+    boj2.publish_edition(edition["edition_id"], payload, trace, boj2.get_slack_destinations(False, tenant))
+    boj2.archive.append_edition(boj2.ARCHIVE_PATH, edition)
+    trace.save(boj2.TRACE_PATH)
+
+    # The edition is out; a cache that can't be saved shouldn't report it as failed
+    recipe_cache.wait_for_refills()
+    try:
+        recipe_cache.save()
+    except OSError as e:
+        print(f"---- recipe cache save failed: {e} ----")
+    return edition
+
+
+def parse_overrides(body, tenants):
+    """
+    Validates the overrides of a POST /editions body against the book it is for.
+
+    Args:
+        body: The decoded JSON body.
+        tenants (dict): Tenant id -> tenant.
+
+    Returns:
+        dict: "tenant" (the default book if not given), "style", "theme" and "activity", each None if not given.
+
+    Raises:
+        ValueError: If an override is invalid.
+    """
+    if not isinstance(body, dict):
+        raise ValueError("Invalid body. Please send a JSON object.")
+    overrides = {"tenant": body.get("tenant") or DEFAULT_TENANT_ID, "style": body.get("style"),
+                 "theme": body.get("theme"), "activity": body.get("activity")}
+    tenant = tenants.get(overrides["tenant"])
+    if tenant is None:
+        raise ValueError("Invalid tenant.")
+    activities = tenant["activities_list"]
+    for name in ("style", "activity"):
+        # Whole numbers only: JSON true would pass as 1 and 2.0 as 2, then fail as an index in the worker
+        value = overrides[name]
+        if value is not None and (not isinstance(value, int) or isinstance(value, bool)):
+            raise ValueError(f"Invalid {name}. Please send a whole number.")
+    if overrides["style"] is not None and overrides["style"] not in tenant["content_styles"]:
+        raise ValueError(f"Invalid style. Please select one of {tenant['content_styles']}.")
+    if overrides["theme"] is not None and overrides["theme"] not in tenant["emotions"]:
+        raise ValueError("Invalid theme.")
+    if overrides["activity"] is not None and overrides["activity"] not in range(1, len(activities) + 1):
+        raise ValueError(f"Invalid activity. Please select a chapter between 1 and {len(activities)}.")
+    return overrides
+
+
+class EditionService:
+    """
+    Runs on-demand editions for every book on one bounded worker pool.
+
+    Identical requests (same overrides) made while one is queued or running
+    are coalesced onto that run instead of starting another. Waiting runs
+    are queued per book and handed to workers in weighted fair order (see
+    tenants.FairScheduler), so one busy book can't starve the others; once
+    a book has QUEUE_LIMIT runs waiting, its new ones are refused.
+    """
+
+    def __init__(self, run=run_pipeline, workers=WORKERS, queue_limit=QUEUE_LIMIT, tenants=None, recipe_cache=None):
+        """
+        Args:
+            run (callable): run(overrides, recipe_cache) -> edition record.
+            workers (int): Editions generated at once.
+            queue_limit (int): Editions each book may have waiting.
+            tenants (dict): Tenant id -> tenant.
+            recipe_cache (RecipeCache): One cocktail recipe cache for every worker, so they share hits.
+        """
+        self.run = run
+        self.recipe_cache = recipe_cache
+        self.queue_limit = queue_limit
+        self.tenants = tenants or load_tenants([], default_tenant())
+        self.scheduler = FairScheduler({t: tenant["weight"] for t, tenant in self.tenants.items()}, queue_limit)
+        self.jobs = {}
+        self.inflight = {}
+        self.stats = {"runs": 0, "coalesced": 0, "rejected": 0, "max_queued": 0}
+        self._lock = threading.Lock()
+        for _ in range(workers):
+            threading.Thread(target=self._worker, daemon=True).start()
+
+    def _queued(self):
+        return sum(1 for job in self.jobs.values() if job["status"] == "queued")
+
+    def submit(self, overrides):
+        """
+        Starts (or joins) a run for the overrides.
+
+        Returns:
+            tuple: (job dict, coalesced), or (None, False) if the queue is full.
+        """
+        key = json.dumps(overrides, sort_keys=True)
+        with self._lock:
+            self._prune()
+            job_id = self.inflight.get(key)
+            if job_id:
+                self.stats["coalesced"] += 1
+                return dict(self.jobs[job_id]), True
+
+            job = {
+                "id": f"{time.strftime('%Y%m%d-%H%M%S')}-{random.getrandbits(32):08x}",
+                "status": "queued",
+                "overrides": overrides,
+                "created": time.time(),
+                "finished": None,
+                "edition": None,
+                "error": None,
+            }
+            if not self.scheduler.put(overrides["tenant"], (key, job["id"])):
+                self.stats["rejected"] += 1
+                return None, False
+            self.jobs[job["id"]] = job
+            self.inflight[key] = job["id"]
+            self.stats["runs"] += 1
+            queued = self._queued()
+            self.stats["max_queued"] = max(self.stats["max_queued"], queued)
+            QUEUE_DEPTH.set("editions", value=queued)
+            return dict(job), False
+
+    def _worker(self):
+        while True:
+            picked = self.scheduler.get()
+            if picked is None:
+                return
+            _, (key, job_id) = picked
+            self._work(key, job_id)
+
+    def _work(self, key, job_id):
+        with self._lock:
+            job = self.jobs[job_id]
+            job["status"] = "running"
+            overrides = job["overrides"]
+            QUEUE_DEPTH.set("editions", value=self._queued())
+        try:
+            with IN_FLIGHT.track("editions"):
+                edition = self.run(overrides, self.recipe_cache)
+            update = {"status": "done", "edition": edition}
+        except Exception as e:
+            print(f"---- edition {job_id} failed: {e} ----")
+            update = {"status": "failed", "error": repr(e)}
+        with self._lock:
+            job.update(update, finished=time.time())
+            self.inflight.pop(key, None)
+
+    def get(self, job_id):
+        """
+        Returns:
+            dict: A copy of the job, or None.
+        """
+        with self._lock:
+            job = self.jobs.get(job_id)
+            return dict(job) if job else None
+
+    def _prune(self):
+        cutoff = time.time() - JOB_TTL
+        for job_id in [j for j, job in self.jobs.items() if job["finished"] and job["finished"] < cutoff]:
+            del self.jobs[job_id]
+
+
+class _EditionHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body, default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        if self.path != "/editions":
+            return self._reply(404, {"error": "not found"})
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            overrides = parse_overrides(body, self.service.tenants)
+        except ValueError as e:
+            return self._reply(400, {"error": str(e)})
+
+        job, coalesced = self.service.submit(overrides)
+        if job is None:
+            return self._reply(429, {"error": "too many editions queued"}, {"Retry-After": "30"})
+        self._reply(202, {"id": job["id"], "status": job["status"], "coalesced": coalesced},
+                    {"Location": f"/editions/{job['id']}"})
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            data = REGISTRY.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        match = _EDITION_PATH_RE.match(self.path)
+        job = self.service.get(match.group(1)) if match else None
+        if job is None:
+            return self._reply(404, {"error": "not found"})
+        self._reply(200, job)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _EditionServer(ThreadingHTTPServer):
+    # Bursts of clients connect at once; the default listen backlog of 5 resets them
+    request_queue_size = 128
+    daemon_threads = True
+
+
+def make_server(service, host="127.0.0.1", port=8080):
+    """
+    Returns:
+        ThreadingHTTPServer: The HTTP front end for a service (not yet serving).
+    """
+    handler = type("EditionHandler", (_EditionHandler,), {"service": service})
+    return _EditionServer((host, port), handler)
+
+
+def run_load_test(clients=40, workers=WORKERS, queue_limit=QUEUE_LIMIT, run_seconds=(0.5, 1.0), seed=0):
+    """
+    Fires a burst of concurrent requests at a local service whose pipeline
+    is a sleep, and reports coalescing, rejections and time to completion.
+
+    Half the clients ask for one of three popular override sets, so they
+    should coalesce; the rest ask for distinct editions and queue.
+    """
+    rng = random.Random(seed)
+
+    def fake_run(overrides, recipe_cache=None):
+        time.sleep(rng.uniform(*run_seconds))
+        return {"overrides": overrides}
+
+    service = EditionService(fake_run, workers=workers, queue_limit=queue_limit)
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    bodies = []
+    for i in range(clients):
+        if i % 2:
+            bodies.append({"style": 1 + i % 3})
+        else:
+            bodies.append({"style": 1 + i % 6, "activity": 1 + i})
+    rng.shuffle(bodies)
+
+    results = []
+    results_lock = threading.Lock()
+
+    def client(body):
+        start = time.time()
+        request = urllib.request.Request(f"{base}/editions", data=json.dumps(body).encode(),
+                                         headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(request) as response:
+                job = json.load(response)
+        except urllib.error.HTTPError as e:
+            with results_lock:
+                results.append((e.code, None, None))
+            return
+        while True:
+            with urllib.request.urlopen(f"{base}/editions/{job['id']}") as response:
+                status = json.load(response)["status"]
+            if status in ("done", "failed"):
+                break
+            time.sleep(0.05)
+        with results_lock:
+            results.append((202, job["coalesced"], time.time() - start))
+
+    start = time.time()
+    threads = [threading.Thread(target=client, args=(body,)) for body in bodies]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.time() - start
+    server.shutdown()
+
+    latencies = sorted(seconds for code, _, seconds in results if code == 202)
+    print(f"{clients} requests in {elapsed:.1f}s: {len(latencies)} accepted "
+          f"({sum(1 for _, c, _ in results if c)} coalesced), {sum(1 for c, _, _ in results if c == 429)} rejected")
+    print(f"pipeline runs: {service.stats['runs']}, max queued: {service.stats['max_queued']} "
+          f"(limit {queue_limit}), workers: {workers}")
+    if latencies:
+        print(f"time to done: p50 {latencies[len(latencies) // 2]:.2f}s, "
+              f"p95 {latencies[int(len(latencies) * 0.95) - 1]:.2f}s, max {latencies[-1]:.2f}s")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "loadtest":
+        run_load_test()
+    elif len(sys.argv) > 1 and sys.argv[1] == "serve":
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 8080
+        import boj2
+        server = make_server(EditionService(tenants=boj2.get_tenants(), recipe_cache=boj2.get_recipe_cache()), port=port)
+        print(f"serving editions on port {port}")
+        server.serve_forever()
+    else:
+        print("usage: python edition_service.py serve [port] | loadtest")
+        sys.exit(1)
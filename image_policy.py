@@ -0,0 +1,180 @@
+import random
+import sys
+
+from run_trace import load_traces, stage_spans
+
+# Settings tiers, best first. Each is tried in turn until one fits the budget.
+# The first is what the image tool renders by default (a square at its own
+# choice of quality), so a run with time to spare looks and costs the same as
+# it always has; tighter budgets only ever step quality down. The image tool
+# renders nothing smaller than 1024x1024, so the size stays put.
+TIERS = [
+    {"size": "1024x1024", "quality": "auto"},
+    {"size": "1024x1024", "quality": "medium"},
+    {"size": "1024x1024", "quality": "low"},
+]
+
+# Render-time guesses (seconds) per (size, quality), used until enough latencies have been observed
+PRIOR_LATENCY = {
+    ("1024x1024", "auto"): 75.0,
+    ("1024x1024", "medium"): 40.0,
+    ("1024x1024", "low"): 20.0,
+}
+
+# Size of image spans traced before the size was chosen per run
+DEFAULT_SIZE = "1024x1024"
+
+# Observations needed before we trust history over the prior
+MIN_OBSERVATIONS = 5
+
+# Time reserved after the image for upload, cocktail and Slack
+DOWNSTREAM_RESERVE = 15.0
+
+
+def percentile(values, pct):
+    """
+    Returns:
+        float: The `pct` percentile of `values` (nearest rank).
+    """
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+
+def image_latencies(traces):
+    """
+    Collects observed image render times per tier from run traces.
+
+    Returns:
+        dict: (size, quality) -> list of seconds.
+    """
+    latencies = {}
+    for span in stage_spans(traces, "image"):
+        if "error" in span or "quality" not in span:
+            continue
+        key = (span.get("size") or DEFAULT_SIZE, span["quality"])
+        latencies.setdefault(key, []).append(span["seconds"])
+    return latencies
+
+
+def tier_key(tier):
+    return tier["size"], tier["quality"]
+
+
+def estimate_latency(latencies, tier, pct):
+    observed = latencies.get(tier_key(tier), [])
+    if len(observed) < MIN_OBSERVATIONS:
+        return PRIOR_LATENCY[tier_key(tier)]
+    return percentile(observed, pct)
+
+
+def choose_image_settings(remaining_seconds, latencies, pct=90):
+    """
+    Picks image size, quality, output format and compression for this run.
+
+    The best tier whose `pct` percentile render time fits the remaining
+    budget wins; the cheapest tier is used if none fits. Output is PNG when
+    there is plenty of slack, otherwise compressed WebP for a faster upload.
+
+    Args:
+        remaining_seconds (float): Time left in the run budget.
+        latencies (dict): (size, quality) -> observed render seconds.
+        pct (int): Latency percentile a tier must fit.
+
+    Returns:
+        dict: The settings plus the estimate they were chosen on.
+    """
+    available = remaining_seconds - DOWNSTREAM_RESERVE
+    chosen = TIERS[-1]
+    estimate = estimate_latency(latencies, chosen, pct)
+    for tier in TIERS:
+        tier_estimate = estimate_latency(latencies, tier, pct)
+        if tier_estimate <= available:
+            chosen, estimate = tier, tier_estimate
+            break
+
+    settings = dict(chosen)
+    if available > 2 * estimate:
+        settings["output_format"] = "png"
+    else:
+        settings["output_format"] = "webp"
+        settings["output_compression"] = 80
+
+    settings["estimate_s"] = round(estimate, 1)
+    settings["remaining_s"] = round(remaining_seconds, 1)
+    return settings
+
+
+def image_tool(settings):
+    """
+    Returns:
+        dict: The image_generation tool definition for the chosen settings.
+    """
+    tool = {"type": "image_generation"}
+    for key in ("size", "quality", "output_format", "output_compression"):
+        if key in settings:
+            tool[key] = settings[key]
+    return tool
+
+
+def simulate(traces, budgets, percentiles=(50, 75, 90, 95, 99), trials=2000, seed=0):
+    """
+    Replays historical latencies against the policy to tune its percentile.
+
+    For each percentile, every trial draws a remaining budget from `budgets`,
+    lets the policy choose, then draws an actual render time for the chosen
+    tier from history (or its prior, if it has never run). Reports how often
+    the deadline was missed, the average tier delivered (the best tier
+    scores len(TIERS), the cheapest 1) and how often each tier was picked.
+
+    Args:
+        traces (list): Saved run traces.
+        budgets (list): Remaining-seconds values to sample from.
+        percentiles (tuple): Policy percentiles to compare.
+        trials (int): Simulated runs per percentile.
+        seed (int): Random seed.
+
+    Returns:
+        list: (percentile, miss rate, mean tier score, {(size, quality): picks}) per percentile.
+    """
+    latencies = image_latencies(traces)
+    tier_score = {tier_key(tier): len(TIERS) - i for i, tier in enumerate(TIERS)}
+    rng = random.Random(seed)
+    results = []
+
+    for pct in percentiles:
+        misses = 0
+        score = 0
+        picks = {}
+        for _ in range(trials):
+            remaining = rng.choice(budgets)
+            settings = choose_image_settings(remaining, latencies, pct)
+            key = tier_key(settings)
+            observed = latencies.get(key) or [PRIOR_LATENCY[key]]
+            if rng.choice(observed) > remaining - DOWNSTREAM_RESERVE:
+                misses += 1
+            score += tier_score[key]
+            picks[key] = picks.get(key, 0) + 1
+        results.append((pct, misses / trials, score / trials, picks))
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python image_policy.py <traces.jsonl> [budget seconds ...]")
+        sys.exit(1)
+
+    traces = load_traces(sys.argv[1])
+    if len(sys.argv) > 2:
+        budgets = [float(b) for b in sys.argv[2:]]
+    else:
+        # Replay the budgets runs actually had left when the image stage started
+        budgets = [trace["decisions"]["image_settings"]["remaining_s"]
+                   for trace in traces if "image_settings" in trace.get("decisions", {})] or [120.0]
+
+    print(f"{len(traces)} traces, {len(budgets)} budgets")
+    print("pct  miss rate  mean tier  picks")
+    for pct, miss_rate, mean_tier, picks in simulate(traces, budgets):
+        shares = ", ".join(f"{size} {quality} {count / sum(picks.values()):.0%}"
+                           for (size, quality), count in sorted(picks.items(), key=lambda item: -item[1]))
+        print(f"p{pct:<3} {miss_rate:9.3f}  {mean_tier:9.2f}  {shares}")
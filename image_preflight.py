@@ -0,0 +1,297 @@
+import os
+import re
+import sys
+import zlib
+
+import numpy as np
+
+import archive
+
+# Prompts scoring at least this get rewritten before the image call
+REWRITE_THRESHOLD = 0.5
+
+# Prompts still scoring at least this after rewriting are not sent at all
+SKIP_THRESHOLD = 0.8
+
+# Refused prompts needed in the archive before the learned model is trusted
+MIN_REFUSALS = 10
+
+# Hashed n-gram feature buckets for the learned model
+FEATURES = 1 << 14
+
+# (category, weight, pattern) — weight is roughly how often the image tool refuses a prompt that matches.
+# Patterns are whole words or phrases: a cocktail book is full of dirty martinis, blood oranges,
+# shooters, buttered rum and cold ones cracked open, none of which should cost an image.
+_IMPAIRED = r"(drunk(en)?|drinking|intoxicated|tipsy|buzzed|under the influence)"
+_DRIVING = r"(driv(e|es|ing)|behind the wheel)"
+
+RULES = [
+    ("impaired driving", 0.9, re.compile(
+        rf"\b{_IMPAIRED}\b.{{0,40}}\b{_DRIVING}\b|\b{_DRIVING}\b.{{0,40}}\b{_IMPAIRED}\b", re.I | re.S)),
+    ("drugs", 0.8, re.compile(
+        r"\b(weed|marijuana|cannabis|blunts?|bongs?|stoned|cocaine|lsd|shrooms|ecstasy)\b"
+        r"|\b(rolling|smoking|passing|lighting) (a |the )?joints?\b", re.I)),
+    ("smoking", 0.2, re.compile(
+        r"\b(cigarettes?|cigars?|vap(e|es|ing))\b|\bsmok(e|es|ing) (a |some )?(pipe|cigar|cigarette)s?\b", re.I)),
+    ("sexual", 0.9, re.compile(
+        r"\b(nude|naked|topless|sex|sexual|sexy|erotic|lingerie|strippers?|strip club|striptease)\b", re.I)),
+    ("crude", 0.6, re.compile(
+        r"\b(butt(s|ocks)?|ass(es)?|poop(s|ing|ed)?)\b|\bwip(e|es|ing) (a|his|my|their) crack\b"
+        r"|\bballs dirty\b", re.I)),
+    ("bodily fluids", 0.5, re.compile(r"\b(vomit(s|ing|ed)?|puk(e|es|ing)|urinat(e|es|ing)|pee(s|ing)?)\b", re.I)),
+    ("violence", 0.6, re.compile(
+        r"\b(guns?|pistols?|rifles?|gore|gory|bloodshed|bloodied|stab(s|bed|bing)?)\b|\bblood\b(?! orange)"
+        r"|\bkill(s|ed|ing)?\b(?! (it|time))|\bshoot(s|ing)? (at|him|her|them|someone|people)\b", re.I)),
+]
+
+# Deterministic rewrites tried before spending a model call
+REWRITES = [
+    (re.compile(r"\bdrinking and driving\b", re.I), "road-tripping with a cooler of root beer"),
+    (re.compile(r"\b(drunk(en)?|intoxicated|tipsy|buzzed)\b", re.I), "merry"),
+    (re.compile(r"\bsmoking (weed|a joint|a blunt|pot)\b", re.I), "relaxing in a haze of incense"),
+    (re.compile(r"\b(weed|marijuana|cannabis|blunts?|bongs?)\b", re.I), "herbal tea"),
+    (re.compile(r"\bstoned\b", re.I), "blissed-out"),
+    (re.compile(r"\bwiping a crack[^,.;]*", re.I), "dealing with a comic mishap"),
+    (re.compile(r"\bgets some balls dirty\b", re.I), "makes a mess of things"),
+    (re.compile(r"\b(naked|nude|topless)\b", re.I), "in swimsuits"),
+    (re.compile(r"\b(guns?|pistols?|rifles?)\b", re.I), "water pistol"),
+    (re.compile(r"\b(gore|gory|bloodshed|bloodied)\b|\bblood\b(?! orange)", re.I), "spilled red wine"),
+    (re.compile(r"\b(vomit(s|ing|ed)?|puk(e|es|ing))\b", re.I), "queasy"),
+]
+
+_WORD_RE = re.compile(r"[a-z']+")
+
+
+def features(text):
+    """
+    Returns:
+        np.ndarray: Hashed unigram and bigram counts (crc32, so stable across runs).
+    """
+    words = _WORD_RE.findall(text.lower())
+    grams = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    vector = np.zeros(FEATURES, dtype=np.float32)
+    for gram in grams:
+        vector[zlib.crc32(gram.encode()) % FEATURES] += 1
+    return vector
+
+
+def rule_score(text):
+    """
+    Returns:
+        tuple: (probability-like score from the matched rules, matched categories)
+    """
+    categories = [category for category, _, pattern in RULES if pattern.search(text)]
+    keep = 1.0
+    for category, weight, _ in RULES:
+        if category in categories:
+            keep *= 1 - weight
+    return 1 - keep, categories
+
+
+class RefusalModel:
+    """
+    Multinomial naive Bayes over hashed n-grams, trained on archived image
+    prompts labelled by whether the image tool returned an image.
+    """
+
+    def __init__(self, log_prior, log_likelihood):
+        self.log_prior = log_prior
+        self.log_likelihood = log_likelihood
+
+    @classmethod
+    def train(cls, prompts, refused):
+        """
+        Args:
+            prompts (list): Image prompts.
+            refused (list): Whether each prompt was refused.
+
+        Returns:
+            RefusalModel: The model, or None if there are too few refusals to learn from.
+        """
+        refused = np.asarray(refused, dtype=bool)
+        if refused.sum() < MIN_REFUSALS or (~refused).sum() < MIN_REFUSALS:
+            return None
+        matrix = np.stack([features(p) for p in prompts])
+        counts = np.stack([matrix[~refused].sum(axis=0), matrix[refused].sum(axis=0)]) + 1.0
+        log_likelihood = np.log(counts / counts.sum(axis=1, keepdims=True))
+        log_prior = np.log(np.array([(~refused).mean(), refused.mean()]))
+        return cls(log_prior, log_likelihood)
+
+    def score(self, text):
+        """
+        Returns:
+            float: Probability the prompt is refused.
+        """
+        joint = self.log_prior + self.log_likelihood @ features(text)
+        return float(1 / (1 + np.exp(joint[0] - joint[1])))
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "wb") as f:
+            np.savez(f, log_prior=self.log_prior, log_likelihood=self.log_likelihood)
+        os.replace(path + ".tmp", path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(data["log_prior"], data["log_likelihood"])
+
+
+def labelled_prompts(editions):
+    """
+    Image prompts that were actually sent, and whether each was refused.
+
+    A digest shares one image between all its styles; only the edition the
+    image was drawn from (the one whose id is the digest id) is counted.
+
+    Returns:
+        tuple: (prompts, refused flags)
+    """
+    prompts, refused = [], []
+    for edition in editions:
+        preflight = edition.get("preflight") or {}
+        if not edition.get("dalle_prompt") or preflight.get("skip"):
+            continue
+        if edition.get("digest_id", edition.get("edition_id")) != edition.get("edition_id"):
+            continue
+        prompts.append(edition["dalle_prompt"])
+        refused.append(edition.get("image_refused", edition.get("image_hash") is None))
+    return prompts, refused
+
+
+def load_or_train(model_path, archive_path):
+    """
+    Loads the refusal model, retraining it first if the archive has changed since.
+
+    Returns:
+        RefusalModel: The model, or None until the archive has enough refusals.
+    """
+    archive_mtime = os.path.getmtime(archive_path) if os.path.exists(archive_path) else 0
+    if os.path.exists(model_path) and os.path.getmtime(model_path) >= archive_mtime:
+        return RefusalModel.load(model_path)
+    model = RefusalModel.train(*labelled_prompts(archive.load_editions(archive_path)))
+    if model is not None:
+        model.save(model_path)
+    return model
+
+
+def score_prompt(text, model=None):
+    """
+    Combines the rules and the learned model into one refusal score.
+
+    Returns:
+        tuple: (score, matched rule categories)
+    """
+    rules, categories = rule_score(text)
+    learned = model.score(text) if model else 0.0
+    return 1 - (1 - rules) * (1 - learned), categories
+
+
+def rewrite_locally(text):
+    """
+    Returns:
+        str: The prompt with every REWRITES substitution applied.
+    """
+    for pattern, replacement in REWRITES:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def check_image_prompt(prompt, model=None, rewrite=None):
+    """
+    Scores an image prompt before it is sent and rewrites it if it looks
+    likely to be refused: first with the local substitutions, then with
+    `rewrite` (e.g. a small model call) if that isn't enough.
+
+    Args:
+        prompt (str): The image prompt.
+        model (RefusalModel): The learned model, or None for rules only.
+        rewrite (callable): rewrite(prompt) -> safer prompt, or None to only rewrite locally.
+
+    Returns:
+        dict: "prompt" to send, "score" and "categories" of the original, final "final_score",
+            "rewrites" applied and whether to "skip" the image call. A prompt is only skipped
+            once a rewrite has been tried and still scores at least SKIP_THRESHOLD.
+    """
+    score, categories = score_prompt(prompt, model)
+    result = {"prompt": prompt, "score": round(score, 3), "categories": categories,
+              "final_score": round(score, 3), "rewrites": [], "skip": False}
+    if score < REWRITE_THRESHOLD:
+        return result
+
+    candidate = rewrite_locally(prompt)
+    if candidate != prompt:
+        result["rewrites"].append("local")
+        score, _ = score_prompt(candidate, model)
+
+    if score >= REWRITE_THRESHOLD and rewrite:
+        try:
+            candidate = rewrite(candidate)
+            result["rewrites"].append("model")
+            score, _ = score_prompt(candidate, model)
+        except Exception as e:
+            print(f"---- image prompt rewrite failed: {e} ----")
+
+    result.update(prompt=candidate, final_score=round(score, 3), skip=bool(result["rewrites"]) and score >= SKIP_THRESHOLD)
+    return result
+
+
+def evaluate(editions, folds=5):
+    """
+    Measures the filter on archived prompts with known outcomes.
+
+    The learned model is cross-validated (trained without the fold it
+    scores). "Before" is the observed refusal rate. "After" counts refusals
+    among prompts the filter would have sent unchanged, plus the rewritten
+    prompts' own refusal scores, which is an estimate since rewrites were
+    never actually sent.
+
+    Returns:
+        dict: The measurements.
+    """
+    prompts, refused = labelled_prompts(editions)
+    refused = np.asarray(refused, dtype=bool)
+    if not prompts:
+        return {"prompts": 0}
+
+    scores = np.zeros(len(prompts))
+    after_scores = np.zeros(len(prompts))
+    skipped = np.zeros(len(prompts), dtype=bool)
+    order = np.arange(len(prompts))
+    for fold in range(folds):
+        test = order % folds == fold
+        train = [p for p, t in zip(prompts, test) if not t]
+        model = RefusalModel.train(train, refused[~test])
+        for i in np.flatnonzero(test):
+            result = check_image_prompt(prompts[i], model)
+            scores[i] = result["score"]
+            after_scores[i] = result["final_score"]
+            skipped[i] = result["skip"]
+
+    flagged = scores >= REWRITE_THRESHOLD
+    after = refused[~flagged].sum() + after_scores[flagged & ~skipped].sum()
+    return {
+        "prompts": len(prompts),
+        "refusal_rate_before": float(refused.mean()),
+        "flagged": float(flagged.mean()),
+        "recall": float((flagged & refused).sum() / max(1, refused.sum())),
+        "precision": float((flagged & refused).sum() / max(1, flagged.sum())),
+        "skipped": float(skipped.mean()),
+        "refusal_rate_after_estimate": float(after / len(prompts)),
+    }
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "activities":
+        from catalog import activities_list
+        for activity in activities_list:
+            text = f"John {activity['activity']} with his bro."
+            result = check_image_prompt(text)
+            print(f"{result['score']:.2f} -> {result['final_score']:.2f} {activity['chapter_title']:<20} "
+                  f"{result['categories']} {result['prompt'] if result['rewrites'] else ''}")
+    elif len(sys.argv) > 2 and sys.argv[1] == "evaluate":
+        for key, value in evaluate(archive.load_editions(sys.argv[2])).items():
+            print(f"{key}: {value:.3f}" if isinstance(value, float) else f"{key}: {value}")
+    else:
+        print("usage: python image_preflight.py activities | evaluate <archive.jsonl>")
+        sys.exit(1)
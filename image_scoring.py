@@ -0,0 +1,157 @@
+import io
+import time
+
+import numpy as np
+from PIL import Image
+
+# Images with less grayscale spread than this are treated as blank
+BLANK_STD_THRESHOLD = 6.0
+
+# Weights for the parts of an image's score, each part in [0, 1]
+SCORE_WEIGHTS = {
+    "sharpness": 0.4,
+    "entropy": 0.3,
+    "novelty": 0.3,
+}
+
+
+def decode_image(image_bytes):
+    """
+    Args:
+        image_bytes (bytes): Encoded image (PNG, JPEG or WebP).
+
+    Returns:
+        Image: The decoded RGB image.
+    """
+    return Image.open(io.BytesIO(image_bytes)).convert("RGB")
+
+
+def laplacian_variance(gray):
+    """
+    Variance of the 4-neighbour Laplacian, a standard focus/sharpness measure.
+
+    Args:
+        gray (ndarray): 2-D float32 grayscale image.
+
+    Returns:
+        float: The Laplacian variance.
+    """
+    lap = (gray[1:-1, :-2] + gray[1:-1, 2:] + gray[:-2, 1:-1] + gray[2:, 1:-1]
+           - 4 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+
+def colour_entropy(rgb):
+    """
+    Shannon entropy of the colour histogram at 4 bits per channel, scaled to [0, 1].
+
+    Args:
+        rgb (ndarray): H x W x 3 uint8 image.
+
+    Returns:
+        float: The normalized entropy.
+    """
+    q = (rgb >> 4).astype(np.uint16)
+    codes = (q[..., 0] << 8) | (q[..., 1] << 4) | q[..., 2]
+    counts = np.bincount(codes.ravel(), minlength=4096)
+    p = counts[counts > 0] / codes.size
+    return float(-(p * np.log2(p)).sum() / 12)
+
+
+def perceptual_hash(image, hash_size=8):
+    """
+    Difference hash (dHash) of an image as a hex string.
+
+    Args:
+        image (Image): The image to hash.
+        hash_size (int): Bits per row/column; 8 gives a 64 bit hash.
+
+    Returns:
+        str: The hash in hex.
+    """
+    small = np.asarray(image.convert("L").resize((hash_size + 1, hash_size), Image.BILINEAR), dtype=np.int16)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return f"{int(''.join('1' if b else '0' for b in bits), 2):0{hash_size * hash_size // 4}x}"
+
+
+def hash_distance(hash1, hash2):
+    """
+    Returns:
+        int: Hamming distance between two hex hashes.
+    """
+    return bin(int(hash1, 16) ^ int(hash2, 16)).count("1")
+
+
+def image_hash(path):
+    """
+    Returns:
+        str: The perceptual hash of the image file at `path`.
+    """
+    with Image.open(path) as image:
+        return perceptual_hash(image)
+
+
+def score_image(image, recent_hashes=()):
+    """
+    Scores a generated image locally: sharpness, colour entropy and
+    perceptual-hash distance from recently archived images.
+
+    Args:
+        image (Image): The decoded RGB image.
+        recent_hashes (list): Perceptual hashes of recent archived images.
+
+    Returns:
+        tuple: (total score, dict of the individual parts and the image hash)
+    """
+    rgb = np.asarray(image, dtype=np.uint8)
+    gray = rgb.astype(np.float32) @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    image_phash = perceptual_hash(image)
+    if gray.std() < BLANK_STD_THRESHOLD:
+        return 0.0, {"blank": True, "hash": image_phash}
+
+    # Laplacian variance is roughly log-distributed; ~1000 is already crisp
+    sharpness = min(1.0, np.log1p(laplacian_variance(gray)) / np.log1p(1000))
+    entropy = colour_entropy(rgb)
+
+    distances = [hash_distance(image_phash, h) for h in recent_hashes]
+    # 64-bit hashes; anything more than ~20 bits away is a different composition
+    novelty = min(1.0, min(distances) / 20) if distances else 1.0
+
+    parts = {"sharpness": sharpness, "entropy": entropy, "novelty": novelty}
+    total = sum(SCORE_WEIGHTS[name] * value for name, value in parts.items())
+    parts["hash"] = image_phash
+    return total, parts
+
+
+def pick_best_image(images, recent_hashes=()):
+    """
+    Scores decoded candidate images and returns the best one.
+
+    Args:
+        images (list): Encoded image bytes, one per candidate.
+        recent_hashes (list): Perceptual hashes of recent archived images.
+
+    Returns:
+        tuple: (index of the best image, list of (score, parts) per image)
+    """
+    scores = []
+    for image_bytes in images:
+        start = time.perf_counter()
+        score, parts = score_image(decode_image(image_bytes), recent_hashes)
+        parts["score_ms"] = round((time.perf_counter() - start) * 1000, 1)
+        scores.append((score, parts))
+    best = max(range(len(images)), key=lambda i: scores[i][0])
+    return best, scores
+
+
+if __name__ == "__main__":
+    # Rough timing on synthetic 1024x1024 images
+    rng = np.random.default_rng(0)
+    noise = Image.fromarray(rng.integers(0, 256, (1024, 1024, 3), dtype=np.uint8))
+    blank = Image.new("RGB", (1024, 1024), (240, 240, 240))
+    for name, image in [("noise", noise), ("blank", blank)]:
+        start = time.perf_counter()
+        for _ in range(20):
+            score_image(image, ["0" * 16, "f" * 16])
+        print(f"{name}: {(time.perf_counter() - start) / 20 * 1000:.1f} ms/image")
@@ -0,0 +1,269 @@
+import fcntl
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+import subprocess
+import sys
+import threading
+from contextlib import contextmanager
+from functools import partial
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+from urlextract import URLExtract
+
+
+class PublishError(RuntimeError):
+    """
+    An image could not be uploaded to its publisher.
+    """
+
+
+class ImageStore:
+    """
+    Content-addressed image store.
+
+    Images are kept once under their SHA-256 (objects/ab/abcdef....webp), with
+    an index of edition id -> hash and of the URL each object was published
+    to per publisher, so reposting or backfilling an edition never uploads
+    the same bytes twice.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.index_path) as f:
+                self.index = json.load(f)
+        except (OSError, ValueError):
+            self.index = {"objects": {}, "editions": {}, "published": {}}
+
+    @contextmanager
+    def _locked(self):
+        """
+        Holds the store lock (across threads and processes), with a fresh
+        copy of the index that is saved on exit.
+        """
+        os.makedirs(self.root, exist_ok=True)
+        with self._lock, open(os.path.join(self.root, "index.lock"), "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            self._load()
+            yield
+            self._save()
+
+    def _save(self):
+        os.makedirs(self.root, exist_ok=True)
+        with open(self.index_path + ".tmp", "w") as f:
+            json.dump(self.index, f, indent=1)
+        os.replace(self.index_path + ".tmp", self.index_path)
+
+    def put(self, path):
+        """
+        Stores a file under its SHA-256, unless an identical object already exists.
+
+        Args:
+            path (str): The image file.
+
+        Returns:
+            str: The object's SHA-256.
+        """
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        sha = digest.hexdigest()
+        ext = os.path.splitext(path)[1].lower()
+
+        with self._locked():
+            if sha not in self.index["objects"]:
+                object_path = os.path.join(self.root, "objects", sha[:2], sha + ext)
+                os.makedirs(os.path.dirname(object_path), exist_ok=True)
+                shutil.copyfile(path, object_path + ".tmp")
+                os.replace(object_path + ".tmp", object_path)
+                self.index["objects"][sha] = os.path.relpath(object_path, self.root)
+        return sha
+
+    def path_for(self, sha):
+        """
+        Returns:
+            str: The local path of a stored object.
+        """
+        return os.path.join(self.root, self.index["objects"][sha])
+
+    def record_edition(self, edition_id, sha):
+        """
+        Maps an edition to the object holding its image.
+        """
+        with self._locked():
+            self.index["editions"][edition_id] = sha
+
+    def edition_sha(self, edition_id):
+        """
+        Returns:
+            str: The SHA-256 of the edition's image, or None.
+        """
+        return self.index["editions"].get(edition_id)
+
+    def publish(self, sha, publisher):
+        """
+        Returns a public URL for a stored object, uploading it only the first time.
+
+        Args:
+            sha (str): The object's SHA-256.
+            publisher (Publisher): Where to host it.
+
+        Returns:
+            str: The public URL.
+        """
+        published = self.index["published"].get(publisher.name, {})
+        if sha in published:
+            return published[sha]
+
+        # Checked again under the lock, so two runs publishing the same image upload it once
+        with self._locked():
+            published = self.index["published"].setdefault(publisher.name, {})
+            if sha not in published:
+                published[sha] = publisher.upload(self.path_for(sha), sha)
+            return published[sha]
+
+
+class Publisher:
+    """
+    Somewhere images can be hosted. Subclasses implement upload().
+    """
+
+    name = None
+
+    def upload(self, path, sha):
+        """
+        Args:
+            path (str): The local object file.
+            sha (str): The object's SHA-256, usable as a stable key.
+
+        Returns:
+            str: The public URL of the uploaded image.
+
+        Raises:
+            PublishError: If the upload failed.
+        """
+        raise NotImplementedError
+
+
+class ImgurPublisher(Publisher):
+    """
+    Uploads with the imgur-uploader command line tool.
+    """
+
+    name = "imgur"
+
+    def __init__(self, uploader_path):
+        self.uploader_path = uploader_path
+
+    def upload(self, path, sha=None):
+        try:
+            result = subprocess.run([self.uploader_path, path], capture_output=True, text=True)
+        except OSError as e:
+            raise PublishError(f"Could not run {self.uploader_path}: {e}") from e
+
+        urls = [url for url in URLExtract().find_urls(result.stdout) if "imgur.com" in url]
+        if result.returncode != 0 or not urls:
+            output = (result.stderr or result.stdout).strip()
+            raise PublishError(f"imgur upload of {path} failed (exit {result.returncode}): {output}")
+        return urls[-1]
+
+
+class LocalHTTPPublisher(Publisher):
+    """
+    Copies objects into a directory served by serve_static() (or any web
+    server) under their content hash, so they can be cached forever.
+    """
+
+    name = "local"
+
+    def __init__(self, serve_dir, base_url):
+        self.serve_dir = serve_dir
+        self.base_url = base_url.rstrip("/")
+
+    def upload(self, path, sha):
+        file_name = sha + os.path.splitext(path)[1]
+        target = os.path.join(self.serve_dir, file_name)
+        if not os.path.exists(target):
+            os.makedirs(self.serve_dir, exist_ok=True)
+            shutil.copyfile(path, target + ".tmp")
+            os.replace(target + ".tmp", target)
+        return f"{self.base_url}/{file_name}"
+
+
+class S3Publisher(Publisher):
+    """
+    Uploads to an S3-compatible bucket, e.g. a local MinIO.
+
+    Needs boto3 (pip install boto3).
+    """
+
+    name = "s3"
+
+    def __init__(self, bucket, public_base_url, endpoint_url=None, access_key=None, secret_key=None):
+        try:
+            import boto3
+        except ImportError:
+            raise ImportError("The s3 image publisher needs boto3. Please pip install boto3.")
+
+        self.bucket = bucket
+        self.public_base_url = public_base_url.rstrip("/")
+        self.s3 = boto3.client(
+            "s3",
+            endpoint_url=endpoint_url,
+            aws_access_key_id=access_key,
+            aws_secret_access_key=secret_key,
+        )
+
+    def upload(self, path, sha):
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        key = sha + os.path.splitext(path)[1]
+        try:
+            with open(path, "rb") as f:
+                self.s3.put_object(
+                    Bucket=self.bucket,
+                    Key=key,
+                    Body=f,
+                    ContentType=mimetypes.guess_type(path)[0] or "application/octet-stream",
+                    CacheControl="public, max-age=31536000, immutable",
+                )
+        except (BotoCoreError, ClientError) as e:
+            raise PublishError(f"s3 upload of {path} failed: {e}") from e
+        return f"{self.public_base_url}/{key}"
+
+
+class _ImmutableHandler(SimpleHTTPRequestHandler):
+    """
+    Static file handler for content-addressed files: they never change, so
+    clients may cache them for a year.
+    """
+
+    def end_headers(self):
+        self.send_header("Cache-Control", "public, max-age=31536000, immutable")
+        super().end_headers()
+
+
+def serve_static(serve_dir, port=8000):
+    """
+    Serves a LocalHTTPPublisher directory with long-lived cache headers.
+    """
+    handler = partial(_ImmutableHandler, directory=serve_dir)
+    server = ThreadingHTTPServer(("", port), handler)
+    print(f"serving {serve_dir} on port {port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "serve":
+        print("usage: python image_store.py serve <dir> [port]")
+        sys.exit(1)
+    serve_static(sys.argv[2], int(sys.argv[3]) if len(sys.argv) > 3 else 8000)
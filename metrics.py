@@ -0,0 +1,266 @@
+import sys
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stage latency buckets in seconds: Slack posts take well under a second, images up to a couple of minutes
+STAGE_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 90, 120, 180, 300)
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    escaped = [(n, str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")) for n, v in pairs]
+    return "{" + ",".join(f'{n}="{v}"' for n, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=(), registry=None):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        (registry if registry is not None else REGISTRY).register(self)
+
+    def _key(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}.")
+        return tuple(str(label) for label in labels)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            for labels, value in sorted(self._values.items()):
+                lines.extend(self._render_series(labels, value))
+        return lines
+
+    def _render_series(self, labels, value):
+        return [f"{self.name}{_format_labels(self.labelnames, labels)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    """
+    A value that only goes up, e.g. retries or tokens used.
+    """
+
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        if amount < 0:
+            raise ValueError("Counters can only go up.")
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    """
+    A value that goes up and down, e.g. queue depth.
+    """
+
+    kind = "gauge"
+
+    def set(self, *labels, value):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, *labels, amount=1):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    @contextmanager
+    def track(self, *labels):
+        """
+        Counts the enclosed block as in flight.
+        """
+        self.inc(*labels)
+        try:
+            yield
+        finally:
+            self.dec(*labels)
+
+
+class Histogram(_Metric):
+    """
+    Observations counted into cumulative buckets, e.g. stage latencies.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS, registry=None):
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        super().__init__(name, documentation, labelnames, registry)
+
+    def observe(self, *labels, value):
+        key = self._key(labels)
+        with self._lock:
+            counts, total = self._values.get(key, ([0] * len(self.buckets), 0.0))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, *labels):
+        """
+        Observes how long the enclosed block took.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(*labels, value=time.perf_counter() - start)
+
+    def _render_series(self, labels, value):
+        counts, total = value
+        lines = []
+        for bound, count in zip(self.buckets, counts):
+            lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, labels, [('le', _format_value(bound))])} "
+                         f"{count}")
+        lines.append(f"{self.name}_sum{_format_labels(self.labelnames, labels)} {_format_value(total)}")
+        lines.append(f"{self.name}_count{_format_labels(self.labelnames, labels)} {counts[-1]}")
+        return lines
+
+
+class Registry:
+    """
+    The metrics of this process, rendered in the Prometheus text format.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram("boj_stage_seconds", "Time spent in each pipeline stage.", ["stage"])
+ERRORS = Counter("boj_errors_total", "Pipeline stages or deliveries that raised.", ["stage"])
+RETRIES = Counter("boj_retries_total", "Calls retried after a retryable failure.", ["kind"])
+CACHE_HITS = Counter("boj_cache_hits_total", "Cache lookups served from cache.", ["cache"])
+CACHE_MISSES = Counter("boj_cache_misses_total", "Cache lookups that had to generate.", ["cache"])
+TOKENS = Counter("boj_tokens_total", "OpenAI tokens used.", ["stage", "kind"])
+QUEUE_DEPTH = Gauge("boj_queue_depth", "Items waiting in a queue.", ["queue"])
+IN_FLIGHT = Gauge("boj_in_flight_requests", "Requests currently in flight.", ["kind"])
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        data = self.registry.render().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port=9108, host="127.0.0.1", registry=REGISTRY):
+    """
+    Serves /metrics from a background thread, for long-running processes.
+
+    Returns:
+        ThreadingHTTPServer: The server (call shutdown() to stop it).
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def push_metrics(gateway_url, job, instance=None, registry=REGISTRY):
+    """
+    Pushes the registry to a Prometheus pushgateway, replacing the job's
+    previous push. For one-shot runs that end before they could be scraped.
+
+    Args:
+        gateway_url (str): e.g. "http://127.0.0.1:9091".
+        job (str): The job name.
+        instance (str): Optional instance label.
+    """
+    url = f"{gateway_url.rstrip('/')}/metrics/job/{job}" + (f"/instance/{instance}" if instance else "")
+    request = urllib.request.Request(url, data=registry.render().encode(), method="PUT",
+                                     headers={"Content-Type": "text/plain; version=0.0.4"})
+    with urllib.request.urlopen(request, timeout=10) as response:
+        response.read()
+
+
+class _PushgatewayHandler(BaseHTTPRequestHandler):
+    """
+    Local pushgateway stand-in: keeps the last push per grouping key and
+    serves them all on /metrics.
+    """
+
+    pushes = {}
+    lock = threading.Lock()
+
+    def _store(self):
+        if not self.path.startswith("/metrics/job/"):
+            self.send_response(404)
+            self.end_headers()
+            return
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode()
+        with self.lock:
+            self.pushes[self.path] = body
+        self.send_response(200)
+        self.end_headers()
+
+    do_PUT = _store
+    do_POST = _store
+
+    def do_GET(self):
+        if self.path != "/metrics":
+            self.send_response(404)
+            self.end_headers()
+            return
+        with self.lock:
+            data = "".join(f"# pushed to {path}\n{body}" for path, body in sorted(self.pushes.items())).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "pushgateway":
+        port = int(sys.argv[2]) if len(sys.argv) > 2 else 9091
+        print(f"pushgateway stand-in on port {port}")
+        ThreadingHTTPServer(("127.0.0.1", port), _PushgatewayHandler).serve_forever()
+    else:
+        print("usage: python metrics.py pushgateway [port]")
+        sys.exit(1)
@@ -0,0 +1,353 @@
+import fcntl
+import json
+import os
+import random
+import sys
+import threading
+import time
+from collections import deque
+
+from image_policy import percentile
+
+# Candidate models per stage, default first. The router only knows latency and
+# cost, so a stage only lists models whose output is good enough for it: nano
+# writes flat, rule-breaking stories and would win every story call on price.
+STAGE_CANDIDATES = {
+    "story": ["gpt-4.1-mini", "gpt-4.1"],
+    "image_prompt": ["gpt-4.1-mini", "gpt-4.1-nano"],
+    "cocktail": ["gpt-4.1-mini", "gpt-4.1-nano"],
+    "repair": ["gpt-4.1-nano", "gpt-4.1-mini"],  # a few verses or proverbs to fill in a story
+    "image": ["gpt-4.1-mini", "gpt-4.1"],
+}
+
+# Seconds each stage's call should finish in at the policy percentile
+STAGE_BUDGETS = {
+    "story": 30.0,
+    "image_prompt": 15.0,
+    "cocktail": 20.0,
+    "repair": 10.0,
+    "image": 120.0,
+}
+
+# USD per million (input, output) tokens
+MODEL_PRICES = {
+    "gpt-4.1": (2.00, 8.00),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4o": (2.50, 10.00),
+}
+
+# Outcomes kept per (stage, model)
+WINDOW = 50
+
+# Observations needed before a model's record is trusted
+MIN_OBSERVATIONS = 5
+
+# Models failing more often than this are skipped
+MAX_ERROR_RATE = 0.2
+
+# Share of calls sent to the least-observed candidate to keep its record fresh
+EXPLORE_PROBABILITY = 0.05
+
+# A stage is degraded when this many of its last FALLBACK_WINDOW calls failed, or
+# their median latency is over the caller's limit; calls older than FALLBACK_COOLDOWN
+# seconds don't count, so the API gets retried once it has had time to recover
+FALLBACK_WINDOW = 5
+FALLBACK_FAILURES = 3
+FALLBACK_COOLDOWN = 900
+
+# The log is moved to <log>.1 once it is over this size, so start-up reads at most two logs' worth
+MAX_LOG_BYTES = 2 * 1024 * 1024
+
+
+def call_cost(model, usage):
+    """
+    Prices a call from its usage (chat or responses API field names).
+
+    Returns:
+        float: USD, or None if the model or usage is unknown.
+    """
+    if not usage or model not in MODEL_PRICES:
+        return None
+    input_tokens = usage.get("prompt_tokens", usage.get("input_tokens", 0))
+    output_tokens = usage.get("completion_tokens", usage.get("output_tokens", 0))
+    input_price, output_price = MODEL_PRICES[model]
+    return (input_tokens * input_price + output_tokens * output_price) / 1e6
+
+
+def choose_model(stage, stats, candidates=None, budgets=None, pct=95):
+    """
+    The cheapest candidate whose `pct` percentile latency fits the stage budget.
+
+    Models without enough observations, or failing too often, are not
+    eligible. If none fits, the model with the lowest percentile latency
+    wins; with no history at all, the default (first) candidate is used.
+
+    Args:
+        stage (str): The pipeline stage.
+        stats (dict): Model -> list of outcome dicts for this stage.
+        candidates (dict): Stage -> candidate models.
+        budgets (dict): Stage -> seconds.
+        pct (int): Latency percentile a model must fit.
+
+    Returns:
+        tuple: (model, reason)
+    """
+    candidates = (candidates or STAGE_CANDIDATES)[stage]
+    budget = (budgets or STAGE_BUDGETS)[stage]
+
+    summaries = {}
+    for model in candidates:
+        outcomes = stats.get(model, [])
+        if len(outcomes) < MIN_OBSERVATIONS:
+            continue
+        errors = sum(1 for o in outcomes if o.get("error"))
+        latencies = [o["seconds"] for o in outcomes if not o.get("error")]
+        costs = [o["cost"] for o in outcomes if o.get("cost") is not None]
+        if not latencies:
+            continue
+        summaries[model] = {
+            "error_rate": errors / len(outcomes),
+            "latency": percentile(latencies, pct),
+            "cost": sum(costs) / len(costs) if costs else float("inf"),
+        }
+
+    eligible = [m for m, s in summaries.items() if s["error_rate"] <= MAX_ERROR_RATE and s["latency"] <= budget]
+    if eligible:
+        return min(eligible, key=lambda m: summaries[m]["cost"]), "cheapest_within_budget"
+    if summaries:
+        return min(summaries, key=lambda m: summaries[m]["latency"]), "fastest_over_budget"
+    return candidates[0], "default"
+
+
+class ModelRouter:
+    """
+    Picks the model for each stage from a rolling record of its outcomes.
+
+    Every decision and every outcome is appended to a JSON-lines log; the
+    log (and the one rotated out before it) is also what the rolling record
+    is rebuilt from on start-up, and what evaluate() replays offline.
+    """
+
+    def __init__(self, log_path, candidates=None, budgets=None, pct=95, rng=None):
+        self.log_path = log_path
+        self.candidates = candidates or STAGE_CANDIDATES
+        self.budgets = budgets or STAGE_BUDGETS
+        self.pct = pct
+        self.rng = rng or random.Random()
+        self.outcomes = {}
+        self._lock = threading.Lock()
+        rotate_log(log_path)
+        for record in load_log(log_path + ".1") + load_log(log_path):
+            if record["type"] == "outcome":
+                self._remember(record)
+
+    def _remember(self, record):
+        key = (record["stage"], record["model"])
+        self.outcomes.setdefault(key, deque(maxlen=WINDOW)).append(record)
+
+    def _log(self, record):
+        os.makedirs(os.path.dirname(self.log_path) or ".", exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+    def stats(self, stage):
+        """
+        Returns:
+            dict: Model -> recent outcomes for a stage.
+        """
+        with self._lock:
+            return {model: list(outcomes) for (s, model), outcomes in self.outcomes.items() if s == stage}
+
+    def choose(self, stage):
+        """
+        Picks and logs the model for a call.
+
+        Returns:
+            str: The model.
+        """
+        stats = self.stats(stage)
+        model, reason = choose_model(stage, stats, self.candidates, self.budgets, self.pct)
+        if self.rng.random() < EXPLORE_PROBABILITY:
+            model = min(self.candidates[stage], key=lambda m: len(stats.get(m, [])))
+            reason = "explore"
+        with self._lock:
+            self._log({"type": "decision", "time": time.time(), "stage": stage, "model": model, "reason": reason})
+        return model
+
+    def degraded(self, stage, max_seconds=None):
+        """
+        Whether the API path for a stage is failing or too slow to use right now.
+
+        Args:
+            stage (str): The pipeline stage.
+            max_seconds (float): Median latency above which the stage counts as degraded.
+
+        Returns:
+            bool: True if the caller should use its fallback instead.
+        """
+        cutoff = time.time() - FALLBACK_COOLDOWN
+        recent = sorted((o for outcomes in self.stats(stage).values() for o in outcomes), key=lambda o: o["time"])
+        recent = [o for o in recent[-FALLBACK_WINDOW:] if o["time"] >= cutoff]
+        if sum(1 for o in recent if o.get("error")) >= FALLBACK_FAILURES:
+            return True
+        latencies = [o["seconds"] for o in recent if not o.get("error")]
+        return (max_seconds is not None and len(latencies) == FALLBACK_WINDOW
+                and percentile(latencies, 50) > max_seconds)
+
+    def record(self, stage, model, seconds, usage=None, error=None):
+        """
+        Logs the outcome of a call and adds it to the rolling record.
+        """
+        record = {
+            "type": "outcome",
+            "time": time.time(),
+            "stage": stage,
+            "model": model,
+            "seconds": seconds,
+            "usage": usage,
+            "cost": call_cost(model, usage),
+            "error": error,
+        }
+        with self._lock:
+            self._remember(record)
+            self._log(record)
+
+
+def usage_dict(response):
+    """
+    Returns:
+        dict: A response's token usage, or None.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    if hasattr(usage, "model_dump"):
+        return usage.model_dump()
+    return dict(usage)
+
+
+def rotate_log(path, max_bytes=MAX_LOG_BYTES):
+    """
+    Moves a log over `max_bytes` to `path`.1, replacing the one rotated out before it.
+    """
+    try:
+        if os.path.getsize(path) <= max_bytes:
+            return
+    except OSError:
+        return
+    with open(path + ".lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # Another process may have rotated it while we waited
+        if os.path.exists(path) and os.path.getsize(path) > max_bytes:
+            os.replace(path, path + ".1")
+
+
+def load_log(path):
+    """
+    Returns:
+        list: The decision and outcome records, oldest first.
+    """
+    records = []
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except ValueError:
+                    continue
+    except OSError:
+        pass
+    return records
+
+
+def evaluate(records, budgets=None, pct=95):
+    """
+    Replays logged outcomes against the policy.
+
+    Outcomes are walked in order; before each one, the policy chooses a
+    model from the record so far, and the outcome of that model's next
+    logged call is taken as what would have happened. Reports, per stage,
+    how often the budget was missed and the mean cost, next to always using
+    the default model.
+
+    Args:
+        records (list): Records from load_log.
+        budgets (dict): Stage -> seconds, to try budgets other than the configured ones.
+        pct (int): Policy percentile.
+
+    Returns:
+        dict: Stage -> {"policy": (miss rate, mean cost, model counts), "default": (miss rate, mean cost)}
+    """
+    budgets = budgets or STAGE_BUDGETS
+    outcomes = [r for r in records if r["type"] == "outcome" and r["stage"] in STAGE_CANDIDATES]
+    by_model = {}
+    for outcome in outcomes:
+        by_model.setdefault((outcome["stage"], outcome["model"]), []).append(outcome)
+
+    results = {}
+    for stage in STAGE_CANDIDATES:
+        stage_outcomes = [o for o in outcomes if o["stage"] == stage]
+        if not stage_outcomes:
+            continue
+        default = STAGE_CANDIDATES[stage][0]
+        history = {}
+        cursors = {}
+        picks = {}
+        policy_costs = []
+        policy_misses = 0
+        for outcome in stage_outcomes:
+            model, _ = choose_model(stage, history, budgets=budgets, pct=pct)
+            replay = by_model.get((stage, model), [])
+            if replay:
+                chosen = replay[cursors.get(model, 0) % len(replay)]
+                cursors[model] = cursors.get(model, 0) + 1
+            else:
+                chosen = outcome
+            picks[chosen["model"]] = picks.get(chosen["model"], 0) + 1
+            policy_misses += chosen["error"] is not None or chosen["seconds"] > budgets[stage]
+            if chosen["cost"] is not None:
+                policy_costs.append(chosen["cost"])
+            history.setdefault(outcome["model"], []).append(outcome)
+            history[outcome["model"]] = history[outcome["model"]][-WINDOW:]
+
+        default_outcomes = by_model.get((stage, default), [])
+        default_misses = sum(1 for o in default_outcomes if o["error"] is not None or o["seconds"] > budgets[stage])
+        default_costs = [o["cost"] for o in default_outcomes if o["cost"] is not None]
+        results[stage] = {
+            "policy": (
+                policy_misses / len(stage_outcomes),
+                sum(policy_costs) / len(policy_costs) if policy_costs else None,
+                picks,
+            ),
+            "default": (
+                default_misses / len(default_outcomes) if default_outcomes else None,
+                sum(default_costs) / len(default_costs) if default_costs else None,
+            ),
+        }
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python model_router.py <model_log.jsonl> [stage=budget ...]")
+        sys.exit(1)
+
+    budgets = dict(STAGE_BUDGETS)
+    for arg in sys.argv[2:]:
+        stage, seconds = arg.split("=")
+        budgets[stage] = float(seconds)
+
+    records = load_log(sys.argv[1])
+    print(f"{sum(1 for r in records if r['type'] == 'outcome')} outcomes, "
+          f"{sum(1 for r in records if r['type'] == 'decision')} decisions")
+    print("stage         policy miss  policy $/call  default miss  default $/call  picks")
+    for stage, result in evaluate(records, budgets).items():
+        policy_miss, policy_cost, picks = result["policy"]
+        default_miss, default_cost = result["default"]
+        print(f"{stage:<13} {policy_miss:11.3f}  {policy_cost or 0:13.5f}  "
+              f"{default_miss if default_miss is not None else float('nan'):12.3f}  "
+              f"{default_cost or 0:14.5f}  {picks}")
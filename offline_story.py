@@ -0,0 +1,307 @@
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import archive
+from tenants import DEFAULT_TENANT_ID
+from verse_validator import STYLE_RULES, format_verses, parse_verses, split_sentences, validate_story
+
+# Styles with fewer archived stories than this borrow the pooled model
+MIN_STORIES = 5
+
+# Words per generated sentence or line
+MIN_UNIT_WORDS = 4
+MAX_UNIT_WORDS = 28
+
+BOS, EOS = 0, 1
+
+_TOKEN_RE = re.compile(r"[\w'’-]+|[.,!?;:]")
+_QUOTE_RE = re.compile(r'["“]([^"”\n]+)["”]')
+_NO_SPACE_BEFORE = set(".,!?;:")
+
+# First unit per style, so the story is about today's plan; the chain writes the rest
+OPENINGS = {
+    1: "{protagonist} was {activity}{bro} when {theme} came over him.",
+    2: "Sing of {protagonist}, {activity}{bro}, and of {theme}.",
+    3: "And so it was that {protagonist}, {activity}{bro}, learned of {theme}.",
+    4: "There was once a man named {protagonist} who was {activity}{bro}, and {theme} was upon him.",
+    5: "{protagonist}, {activity}{bro}, tasting {theme}.",
+    6: "So {protagonist} is {activity}{bro}, right, and he is just full of {theme}.",
+}
+
+
+def tokenize(text):
+    return _TOKEN_RE.findall(text)
+
+
+def detokenize(tokens):
+    text = ""
+    for token in tokens:
+        if text and token not in _NO_SPACE_BEFORE:
+            text += " "
+        text += token
+    return text
+
+
+def training_units(story, content_style):
+    """
+    Splits an archived story into the units its style is built from.
+
+    Returns:
+        dict: Chain name -> list of unit strings. Style 3 has a separate chain for its proverbs.
+    """
+    if content_style == 1:
+        return {"1": [s for verse in parse_verses(story) for s in split_sentences(verse)]}
+    if content_style == 3:
+        proverbs = _QUOTE_RE.findall(story)
+        narrative = _QUOTE_RE.sub("", story)
+        return {"3-proverb": proverbs, "3": split_sentences(narrative)}
+    if STYLE_RULES[content_style]["unit"] == "line":
+        return {str(content_style): [line.strip() for line in story.splitlines() if line.strip()]}
+    return {str(content_style): split_sentences(story)}
+
+
+class MarkovModel:
+    """
+    Order-2 word Markov chains, one per content style, in compact NumPy arrays.
+
+    Each chain is stored CSR-style: the sorted context keys (w1 * V + w2),
+    row offsets into the next-word ids, and the running count of each row's
+    next words, so sampling is two searchsorted calls per word.
+    """
+
+    def __init__(self, vocab, chains):
+        self.vocab = vocab
+        self.chains = chains
+
+    @classmethod
+    def train(cls, editions):
+        """
+        Trains from archived edition records, skipping the ones it wrote itself.
+
+        Returns:
+            MarkovModel: The trained model.
+        """
+        units = {}
+        stories = {}
+        for edition in editions:
+            content_style = edition.get("content_style")
+            if content_style not in STYLE_RULES or not edition.get("story"):
+                continue
+            if "fallback" in (edition.get("validation") or {}):
+                continue
+            stories[content_style] = stories.get(content_style, 0) + 1
+            for name, chain_units in training_units(edition["story"], content_style).items():
+                units.setdefault(name, []).extend(chain_units)
+                if name != "3-proverb":
+                    units.setdefault("all", []).extend(chain_units)
+
+        vocab = ["<s>", "</s>"]
+        ids = {}
+        counts = {}
+        for name, chain_units in units.items():
+            if name[0].isdigit() and stories.get(int(name[0]), 0) < MIN_STORIES:
+                continue
+            transitions = counts.setdefault(name, {})
+            for unit in chain_units:
+                tokens = [BOS, BOS]
+                for token in tokenize(unit):
+                    if token not in ids:
+                        ids[token] = len(vocab)
+                        vocab.append(token)
+                    tokens.append(ids[token])
+                tokens.append(EOS)
+                for w1, w2, w3 in zip(tokens, tokens[1:], tokens[2:]):
+                    following = transitions.setdefault((w1, w2), {})
+                    following[w3] = following.get(w3, 0) + 1
+
+        size = len(vocab)
+        chains = {}
+        for name, transitions in counts.items():
+            if not transitions:
+                continue
+            contexts = sorted(transitions, key=lambda c: c[0] * size + c[1])
+            offsets = [0]
+            next_ids = []
+            cumulative = []
+            for context in contexts:
+                running = 0
+                for next_id, count in transitions[context].items():
+                    running += count
+                    next_ids.append(next_id)
+                    cumulative.append(running)
+                offsets.append(len(next_ids))
+            chains[name] = {
+                "keys": np.array([c[0] * size + c[1] for c in contexts], dtype=np.int64),
+                "offsets": np.array(offsets, dtype=np.int32),
+                "next": np.array(next_ids, dtype=np.int32),
+                "cumulative": np.array(cumulative, dtype=np.uint32),
+            }
+        return cls(vocab, chains)
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        arrays = {"vocab": np.frombuffer("\n".join(self.vocab).encode(), dtype=np.uint8)}
+        for name, chain in self.chains.items():
+            for field, array in chain.items():
+                arrays[f"{name}/{field}"] = array
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path) or ".", prefix=".markov-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            vocab = data["vocab"].tobytes().decode().split("\n")
+            chains = {}
+            for key in data.files:
+                if "/" in key:
+                    name, field = key.split("/")
+                    chains.setdefault(name, {})[field] = data[key]
+        return cls(vocab, chains)
+
+    def _chain(self, name):
+        return self.chains.get(name) or self.chains.get("all")
+
+    def unit(self, name, rng, max_words=MAX_UNIT_WORDS, attempts=5):
+        """
+        Samples one sentence (or line) from a chain.
+
+        Returns:
+            str: The unit, or "" if the chain is empty.
+        """
+        chain = self._chain(name)
+        if chain is None:
+            return ""
+        keys, offsets, next_ids, cumulative = chain["keys"], chain["offsets"], chain["next"], chain["cumulative"]
+        size = len(self.vocab)
+        tokens = []
+        for _ in range(attempts):
+            tokens = []
+            w1, w2 = BOS, BOS
+            while len(tokens) < max_words:
+                row = int(np.searchsorted(keys, w1 * size + w2))
+                if row >= len(keys) or keys[row] != w1 * size + w2:
+                    break
+                lo, hi = offsets[row], offsets[row + 1]
+                pick = rng.randrange(int(cumulative[hi - 1]))
+                w3 = int(next_ids[lo + int(np.searchsorted(cumulative[lo:hi], pick, side="right"))])
+                if w3 == EOS:
+                    break
+                tokens.append(self.vocab[w3])
+                w1, w2 = w2, w3
+            words = sum(1 for t in tokens if t not in _NO_SPACE_BEFORE)
+            if words >= MIN_UNIT_WORDS:
+                break
+        text = detokenize(tokens)
+        if text and text[-1] not in ".!?":
+            text += "."
+        return text
+
+    def story(self, content_style, theme, activity, bro_text="", number_verses=None, starting_verse=None, rng=None,
+              protagonist="John"):
+        """
+        Writes a story in a content style's format: numbered verses, three
+        quoted proverbs, lines or sentences within the style's word limit.
+
+        Returns:
+            str: The story.
+        """
+        rng = rng or random.Random()
+        name = str(content_style)
+        opening = OPENINGS[content_style].format(protagonist=protagonist, activity=activity, bro=bro_text, theme=theme)
+
+        if content_style == 1:
+            verses = [opening] + [self.unit(name, rng) for _ in range((number_verses or 3) - 1)]
+            return format_verses(verses, starting_verse or 1)
+
+        if content_style == 3:
+            proverbs = [self.unit("3-proverb", rng, max_words=16) for _ in range(STYLE_RULES[3]["proverbs"])]
+            return "\n\n".join([opening] + [f'"{p.rstrip(".")}."' for p in proverbs])
+
+        max_words = STYLE_RULES[content_style].get("max_words", 120)
+        units = [opening]
+        words = len(opening.split())
+        while True:
+            unit = self.unit(name, rng, max_words=min(MAX_UNIT_WORDS, max_words - words))
+            if not unit or words + len(unit.split()) > max_words:
+                break
+            units.append(unit)
+            words += len(unit.split())
+            if words > max_words * 0.7:
+                break
+        separator = "\n" if STYLE_RULES[content_style]["unit"] == "line" else " "
+        return separator.join(units)
+
+
+def load_or_train(model_path, archive_path, tenant_id=DEFAULT_TENANT_ID):
+    """
+    Loads the fallback model, retraining it first if the archive has changed since.
+
+    Args:
+        model_path (str): Where the model is kept.
+        archive_path (str): The edition archive.
+        tenant_id (str): The book whose editions it is trained on, so it writes about that book's cast.
+
+    Returns:
+        MarkovModel: The model, or None if there is nothing to train on.
+    """
+    archive_mtime = os.path.getmtime(archive_path) if os.path.exists(archive_path) else 0
+    if os.path.exists(model_path) and os.path.getmtime(model_path) >= archive_mtime:
+        return MarkovModel.load(model_path)
+    model = MarkovModel.train(archive.load_editions(archive_path, tenant_id=tenant_id))
+    if not model.chains:
+        return None
+    model.save(model_path)
+    return model
+
+
+def run_benchmark(archive_path, model_path, runs=200):
+    """
+    Trains from an archive, then times loading and generating every style
+    and checks the output against the style validator.
+    """
+    start = time.perf_counter()
+    model = MarkovModel.train(archive.load_editions(archive_path))
+    model.save(model_path)
+    print(f"train: {(time.perf_counter() - start) * 1000:.1f} ms, {len(model.vocab)} words, "
+          f"{len(model.chains)} chains, {os.path.getsize(model_path) / 1e3:.0f} KB")
+
+    start = time.perf_counter()
+    model = MarkovModel.load(model_path)
+    print(f"load: {(time.perf_counter() - start) * 1000:.2f} ms")
+
+    rng = random.Random(0)
+    for content_style in sorted(STYLE_RULES):
+        times = []
+        problems = 0
+        for _ in range(runs):
+            number_verses, starting_verse = rng.randint(2, 6), rng.randint(1, 40)
+            start = time.perf_counter()
+            story = model.story(content_style, "joy", "playing golf", " with his bro Matt",
+                                number_verses, starting_verse, rng)
+            times.append(time.perf_counter() - start)
+            _, report = validate_story(story, content_style, number_verses, starting_verse)
+            problems += bool(report["problems"])
+        times.sort()
+        print(f"style {content_style}: median {times[len(times) // 2] * 1000:.2f} ms, "
+              f"max {times[-1] * 1000:.2f} ms, {problems}/{runs} needed repair")
+    print()
+    print(story)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python offline_story.py <archive.jsonl> <model.npz>")
+        sys.exit(1)
+    run_benchmark(sys.argv[1], sys.argv[2])
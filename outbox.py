@@ -0,0 +1,339 @@
+import json
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from slack_sdk.webhook import WebhookClient
+from slack_sdk.errors import SlackApiError
+
+from metrics import ERRORS, QUEUE_DEPTH, RETRIES
+
+# Delivery attempts before a message is dead-lettered
+MAX_ATTEMPTS = 8
+
+# First retry delay in seconds; doubles with every attempt
+BASE_DELAY = 2.0
+
+# How long a worker holds a claimed message before others may retry it
+CLAIM_LEASE = 60.0
+
+# Slack allows roughly one message per second per incoming webhook
+DEFAULT_RATE_PER_MINUTE = 60
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    idempotency_key TEXT NOT NULL UNIQUE,
+    destination TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    rate_per_minute REAL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL,
+    last_error TEXT,
+    created REAL NOT NULL,
+    delivered REAL
+);
+CREATE INDEX IF NOT EXISTS messages_due ON messages (status, next_attempt);
+"""
+
+
+class RetryableError(Exception):
+    """
+    A delivery failure worth retrying (timeouts, 429s, 5xx).
+    """
+
+
+def slack_webhook_send(destination, payload):
+    """
+    Posts a rendered payload to a Slack incoming webhook.
+
+    Args:
+        destination (str): The webhook URL.
+        payload (dict): {"text": ..., "blocks": [...]}.
+
+    Raises:
+        RetryableError: For failures that may succeed later.
+        Exception: For failures that won't (bad payload, revoked webhook).
+    """
+    try:
+        response = WebhookClient(destination).send(text=payload["text"], blocks=payload["blocks"])
+    except (SlackApiError, OSError) as e:
+        raise RetryableError(str(e))
+
+    if response.status_code == 200:
+        return
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableError(f"{response.status_code} {response.body}")
+    raise Exception(f"{response.status_code} {response.body}")
+
+
+class RateLimiter:
+    """
+    Spaces out sends to each destination to at most its rate per minute.
+    Different destinations never wait on each other.
+    """
+
+    def __init__(self, rates_per_minute=None, default_rate=DEFAULT_RATE_PER_MINUTE):
+        self.rates_per_minute = rates_per_minute or {}
+        self.default_rate = default_rate
+        self._next_slot = {}
+        self._lock = threading.Lock()
+
+    def wait(self, destination):
+        """
+        Blocks until `destination` may be sent to again.
+        """
+        interval = 60.0 / (self.rates_per_minute.get(destination) or self.default_rate)
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot.get(destination, now))
+            self._next_slot[destination] = slot + interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class Outbox:
+    """
+    Durable SQLite queue of rendered Slack payloads.
+
+    Payloads are committed before any network call, then delivered by
+    deliver_pending() with exponential backoff. Each message has an
+    idempotency key so the same edition is never queued (or posted) twice
+    for a destination, and messages that keep failing are dead-lettered.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+            columns = [row["name"] for row in db.execute("PRAGMA table_info(messages)")]
+            if "rate_per_minute" not in columns:
+                db.execute("ALTER TABLE messages ADD COLUMN rate_per_minute REAL")
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def enqueue(self, destination, payload, idempotency_key, rate_per_minute=None):
+        """
+        Commits a payload for delivery.
+
+        Args:
+            destination (str): The webhook URL.
+            payload (dict): {"text": ..., "blocks": [...]}.
+            idempotency_key (str): Unique per edition and destination.
+            rate_per_minute (float): The destination's configured rate limit, kept with the
+                message so the detached worker honours it too; None for the default.
+
+        Returns:
+            bool: True if queued, False if the key was already queued.
+        """
+        now = time.time()
+        with closing(self._connect()) as db:
+            cursor = db.execute(
+                "INSERT OR IGNORE INTO messages (idempotency_key, destination, payload, rate_per_minute, next_attempt, "
+                "created) VALUES (?, ?, ?, ?, ?, ?)",
+                (idempotency_key, destination, json.dumps(payload), rate_per_minute, now, now),
+            )
+            return cursor.rowcount == 1
+
+    def _claim(self, limit, key_prefix=None):
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            rows = db.execute(
+                "SELECT * FROM messages WHERE status = 'pending' AND next_attempt <= ? "
+                "AND idempotency_key LIKE ? ORDER BY next_attempt LIMIT ?",
+                (now, (key_prefix or "") + "%", limit),
+            ).fetchall()
+            for row in rows:
+                db.execute("UPDATE messages SET next_attempt = ? WHERE id = ?", (now + CLAIM_LEASE, row["id"]))
+            db.execute("COMMIT")
+            return rows
+        except Exception:
+            # BEGIN IMMEDIATE itself may have failed (e.g. the database was locked), leaving nothing to roll back
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def _record(self, row, error=None, retryable=True):
+        now = time.time()
+        with closing(self._connect()) as db:
+            if error is None:
+                db.execute(
+                    "UPDATE messages SET status = 'delivered', attempts = attempts + 1, delivered = ?, last_error = NULL "
+                    "WHERE id = ?",
+                    (now, row["id"]),
+                )
+                return "delivered"
+
+            attempts = row["attempts"] + 1
+            if not retryable or attempts >= MAX_ATTEMPTS:
+                status = "dead"
+                next_attempt = now
+            else:
+                status = "pending"
+                next_attempt = now + BASE_DELAY * 2 ** (attempts - 1) * random.uniform(0.8, 1.2)
+            db.execute(
+                "UPDATE messages SET status = ?, attempts = ?, next_attempt = ?, last_error = ? WHERE id = ?",
+                (status, attempts, next_attempt, str(error), row["id"]),
+            )
+            return status
+
+    def _deliver(self, row, send):
+        try:
+            send(row["destination"], json.loads(row["payload"]))
+        except RetryableError as e:
+            RETRIES.inc("slack")
+            return row["idempotency_key"], self._record(row, e), str(e)
+        except Exception as e:
+            ERRORS.inc("delivery")
+            return row["idempotency_key"], self._record(row, e, retryable=False), str(e)
+        return row["idempotency_key"], self._record(row), None
+
+    def deliver_pending(self, send=slack_webhook_send, limit=50, workers=8, rate_limiter=None, key_prefix=None):
+        """
+        Delivers every message that is due, once.
+
+        Destinations are delivered to concurrently; messages for the same
+        destination go in order and respect its rate limit: the one given to
+        `rate_limiter`, else the one queued with the message.
+
+        Args:
+            send (callable): send(destination, payload); raises on failure.
+            limit (int): Maximum messages to claim.
+            workers (int): Destinations delivered to at the same time.
+            rate_limiter (RateLimiter): Per-destination rate limits.
+            key_prefix (str): Only deliver messages whose key starts with this, e.g. an edition id.
+
+        Returns:
+            list: (idempotency key, resulting status, error) per message tried.
+        """
+        rate_limiter = rate_limiter or RateLimiter()
+        by_destination = {}
+        for row in self._claim(limit, key_prefix):
+            by_destination.setdefault(row["destination"], []).append(row)
+            if row["rate_per_minute"]:
+                rate_limiter.rates_per_minute.setdefault(row["destination"], row["rate_per_minute"])
+
+        def deliver_destination(rows):
+            destination_results = []
+            for row in rows:
+                rate_limiter.wait(row["destination"])
+                destination_results.append(self._deliver(row, send))
+            return destination_results
+
+        results = []
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(by_destination)))) as pool:
+            for destination_results in pool.map(deliver_destination, by_destination.values()):
+                results.extend(destination_results)
+        return results
+
+    def run_worker(self, send=slack_webhook_send, poll_interval=1.0, until_empty=True, rate_limiter=None):
+        """
+        Keeps delivering until nothing is pending (or forever).
+        """
+        rate_limiter = rate_limiter or RateLimiter()
+        while True:
+            for key, status, error in self.deliver_pending(send, rate_limiter=rate_limiter):
+                print(f"{key}: {status}" + (f" ({error})" if error else ""))
+            if until_empty and not self.pending_count():
+                return
+            time.sleep(poll_interval)
+
+    def pending_count(self):
+        with closing(self._connect()) as db:
+            count = db.execute("SELECT COUNT(*) FROM messages WHERE status = 'pending'").fetchone()[0]
+        QUEUE_DEPTH.set("outbox", value=count)
+        return count
+
+    def dead_letters(self):
+        """
+        Returns:
+            list: Dead-lettered messages as dicts.
+        """
+        with closing(self._connect()) as db:
+            return [dict(row) for row in db.execute("SELECT * FROM messages WHERE status = 'dead'")]
+
+    def requeue(self, message_id):
+        """
+        Moves a dead-lettered message back to pending with a fresh attempt count.
+        """
+        with closing(self._connect()) as db:
+            db.execute(
+                "UPDATE messages SET status = 'pending', attempts = 0, next_attempt = ? WHERE id = ? AND status = 'dead'",
+                (time.time(), message_id),
+            )
+
+
+class _SlowWebhookHandler(BaseHTTPRequestHandler):
+    """
+    Local webhook stub that takes a fixed round-trip time to answer.
+    """
+
+    latency = 0.2
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run_fanout_benchmark(path, destinations=50):
+    """
+    Fans one payload out to many destinations on a local mock with a 200 ms
+    round trip; the whole fan-out should take about one round trip.
+
+    Returns:
+        dict: "delivered" messages and "seconds" the fan-out took.
+    """
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _SlowWebhookHandler, bind_and_activate=False)
+    # The default listen backlog of 5 would make the rest of the fan-out wait on SYN retries
+    server.request_queue_size = destinations
+    server.server_bind()
+    server.server_activate()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    outbox = Outbox(path)
+    payload = {"text": "fan-out", "blocks": []}
+    edition = f"fanout-{time.time()}"
+    for i in range(destinations):
+        outbox.enqueue(f"http://127.0.0.1:{server.server_port}/hook/{i}", payload, f"{edition}:{i}")
+
+    start = time.time()
+    results = outbox.deliver_pending(limit=destinations, workers=destinations, key_prefix=edition)
+    elapsed = time.time() - start
+    delivered = sum(1 for _, status, _ in results if status == "delivered")
+    print(f"delivered {delivered}/{destinations} in {elapsed:.2f}s "
+          f"(round trip {_SlowWebhookHandler.latency:.2f}s)")
+    server.shutdown()
+    return {"delivered": delivered, "seconds": elapsed}
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] not in ("deliver", "fanout"):
+        print("usage: python outbox.py deliver|fanout <outbox.sqlite>")
+        sys.exit(1)
+
+    if sys.argv[1] == "deliver":
+        Outbox(sys.argv[2]).run_worker()
+    else:
+        run_fanout_benchmark(sys.argv[2])
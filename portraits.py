@@ -0,0 +1,142 @@
+import base64
+import glob
+import hashlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from PIL import Image
+
+# Longest side of the variant for each detail level. Low detail inputs are
+# seen by the model at 512px; high detail ones are tiled at 512px with the
+# short side scaled down to 768px, so 1024px loses nothing that matters.
+DETAIL_SIZES = {
+    "low": 512,
+    "high": 1024,
+}
+
+MIME_TYPES = {
+    "JPEG": "image/jpeg",
+    "WEBP": "image/webp",
+}
+
+
+def file_sha256(path):
+    """
+    Returns:
+        str: The SHA-256 hex digest of the file at `path`.
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _compact_encode(image):
+    """
+    Encodes the image as both JPEG and WebP and keeps the smaller one.
+
+    Returns:
+        tuple: (encoded bytes, PIL format name)
+    """
+    best = None
+    for image_format in ("WEBP", "JPEG"):
+        buffer = io.BytesIO()
+        image.save(buffer, format=image_format, quality=85, optimize=True)
+        data = buffer.getvalue()
+        if best is None or len(data) < len(best[0]):
+            best = (data, image_format)
+    return best
+
+
+def prepare_portrait(source_path, cache_dir, detail="low", panels=1):
+    """
+    Returns a cached, size-optimized variant of a reference portrait.
+
+    Variants are keyed by the source's SHA-256, so a portrait is only
+    re-processed when it changes; stale variants of it are removed.
+
+    Args:
+        source_path (str): The full-resolution portrait.
+        cache_dir (str): Where variants are kept.
+        detail (str): "low" or "high".
+        panels (int): Portraits side by side in the image (2 for a pair sheet),
+            so each of them keeps the detail level's size.
+
+    Returns:
+        str: The path of the variant.
+    """
+    if detail not in DETAIL_SIZES:
+        raise ValueError("Invalid detail. Please use 'low' or 'high'.")
+
+    stem = os.path.splitext(os.path.basename(source_path))[0]
+    size = DETAIL_SIZES[detail] * panels
+    level = detail if panels == 1 else f"{detail}x{panels}"
+    prefix = f"{stem}-{file_sha256(source_path)[:16]}-{level}"
+    existing = glob.glob(os.path.join(cache_dir, prefix + ".*"))
+    if existing:
+        return existing[0]
+
+    with Image.open(source_path) as image:
+        image = image.convert("RGBA")
+        # Flatten any transparency onto white; neither JPEG nor lossy WebP needs alpha here
+        flattened = Image.new("RGB", image.size, (255, 255, 255))
+        flattened.paste(image, mask=image.split()[3])
+        flattened.thumbnail((size, size), Image.LANCZOS)
+        data, image_format = _compact_encode(flattened)
+
+    os.makedirs(cache_dir, exist_ok=True)
+    variant_path = os.path.join(cache_dir, f"{prefix}.{image_format.lower()}")
+    for stale in glob.glob(os.path.join(cache_dir, f"{stem}-*-{level}.*")):
+        if stale != variant_path:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass  # Another run got to it first
+
+    # Written aside and moved into place, so a concurrent run never reads half a variant
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, prefix=f".{stem}-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, variant_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return variant_path
+
+
+def encode_portrait(source_path, cache_dir, detail="low", panels=1):
+    """
+    Base64-encodes the optimized variant of a portrait (see prepare_portrait).
+
+    Returns:
+        tuple: (data URL for an input_image, variant path)
+    """
+    variant_path = prepare_portrait(source_path, cache_dir, detail, panels)
+    image_format = "WEBP" if variant_path.endswith(".webp") else "JPEG"
+    with open(variant_path, "rb") as f:
+        encoded = base64.b64encode(f.read()).decode("utf-8")
+    return f"data:{MIME_TYPES[image_format]};base64,{encoded}", variant_path
+
+
+if __name__ == "__main__":
+    # Compare payload size and encode time of the originals and their variants
+    if len(sys.argv) < 3:
+        print("usage: python portraits.py <portrait dir> <cache dir>")
+        sys.exit(1)
+
+    portrait_dir, cache_dir = sys.argv[1], sys.argv[2]
+    for path in sorted(glob.glob(os.path.join(portrait_dir, "*.png"))):
+        original = os.path.getsize(path)
+        print(f"{os.path.basename(path)}: original {original} bytes "
+              f"({len(base64.b64encode(open(path, 'rb').read()))} base64)")
+        for detail in DETAIL_SIZES:
+            start = time.perf_counter()
+            data_url, variant_path = encode_portrait(path, cache_dir, detail)
+            elapsed = (time.perf_counter() - start) * 1000
+            print(f"  {detail}: {os.path.getsize(variant_path)} bytes "
+                  f"({len(data_url)} base64), {elapsed:.1f} ms")
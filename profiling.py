@@ -0,0 +1,207 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# How often the sampler looks at every thread's stack
+SAMPLE_INTERVAL = 0.005
+
+# Frames kept per allocation traceback
+TRACEMALLOC_FRAMES = 25
+
+# Leaf functions that mean a thread is waiting on the network rather than using CPU
+WAIT_FUNCTIONS = {
+    "recv", "recv_into", "read", "readinto", "readline", "send", "sendall", "write",
+    "connect", "create_connection", "getaddrinfo", "do_handshake", "select", "poll", "wait", "sleep",
+}
+WAIT_MODULES = ("socket.py", "ssl.py", "selectors.py", "threading.py", "http/client.py")
+
+
+class RunProfiler:
+    """
+    Profiles one run: a cProfile per pipeline stage (plus one for the main
+    thread outside any stage), tracemalloc peaks and allocation sites, and a
+    sampled collapsed-stack dump for flame graphs.
+
+    Stages report wall time and thread CPU time separately; the difference
+    is time spent waiting (mostly on the network). The sampler also tags
+    each sample as "wait" or "cpu" from the innermost frame, so the flame
+    graph shows where local CPU goes and where the run just blocks.
+    """
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.run_profile = cProfile.Profile()
+        self.stage_profiles = {}
+        self.stages = {}
+        self.stacks = {}
+        self.samples = 0
+        self._thread_stages = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._sampler = None
+        self.started = None
+        self._run_thread = None
+
+    def start(self):
+        """
+        Starts tracemalloc, the sampler and the main-thread profile.
+        """
+        os.makedirs(self.out_dir, exist_ok=True)
+        self.started = time.perf_counter()
+        self._run_thread = threading.get_ident()
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+        self._sampler.start()
+        self.run_profile.enable()
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Profiles the enclosed block as part of a stage, in the calling thread.
+
+        Yields:
+            dict: Filled with "cpu_seconds" and "wait_seconds" on exit.
+        """
+        thread_id = threading.get_ident()
+        with self._lock:
+            stages = self._thread_stages.setdefault(thread_id, [])
+            outermost = not stages
+            stages.append(name)
+
+        # A thread has one profiler at a time: the outermost stage gets its own,
+        # with the run profile paused while it runs on the main thread
+        profile = cProfile.Profile() if outermost else None
+        if profile:
+            if thread_id == self._run_thread:
+                self.run_profile.disable()
+            try:
+                profile.enable()
+            except ValueError:
+                profile = None
+        tracemalloc.reset_peak()
+        cpu_start = time.thread_time()
+        wall_start = time.perf_counter()
+        timings = {}
+        try:
+            yield timings
+        finally:
+            cpu = time.thread_time() - cpu_start
+            wall = time.perf_counter() - wall_start
+            _, peak = tracemalloc.get_traced_memory()
+            if profile:
+                profile.disable()
+                if thread_id == self._run_thread:
+                    self.run_profile.enable()
+            timings["cpu_seconds"] = cpu
+            timings["wait_seconds"] = max(0.0, wall - cpu)
+            with self._lock:
+                self._thread_stages[thread_id].pop()
+                totals = self.stages.setdefault(name, {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_bytes": 0})
+                totals["calls"] += 1
+                totals["wall"] += wall
+                totals["cpu"] += cpu
+                totals["peak_bytes"] = max(totals["peak_bytes"], peak)
+                if profile:
+                    self.stage_profiles.setdefault(name, []).append(profile)
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            with self._lock:
+                thread_stages = {t: list(s) for t, s in self._thread_stages.items() if s}
+            for thread_id, frame in frames.items():
+                if thread_id == own:
+                    continue
+                stack = []
+                leaf = frame
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.reverse()
+                state = "wait" if _is_waiting(leaf) else "cpu"
+                stages = thread_stages.get(thread_id) or ["(no stage)"]
+                key = ";".join([stages[-1], state] + stack)
+                with self._lock:
+                    self.stacks[key] = self.stacks.get(key, 0) + 1
+                    self.samples += 1
+
+    def stop(self, extra=None):
+        """
+        Stops profiling and writes the reports to out_dir:
+        run.prof and stage-<name>.prof (pstats), summary.txt, memory.txt and
+        stacks.txt (collapsed stacks for flamegraph.pl or speedscope).
+
+        Args:
+            extra (dict): Other measurements to put in the summary, e.g. import time.
+
+        Returns:
+            str: The summary text.
+        """
+        self.run_profile.disable()
+        self._stop.set()
+        self._sampler.join()
+        wall = time.perf_counter() - self.started
+        snapshot = tracemalloc.take_snapshot()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        self.run_profile.dump_stats(os.path.join(self.out_dir, "run.prof"))
+        for name, profiles in self.stage_profiles.items():
+            stats = pstats.Stats(profiles[0])
+            for profile in profiles[1:]:
+                stats.add(profile)
+            stats.dump_stats(os.path.join(self.out_dir, f"stage-{name}.prof"))
+
+        with open(os.path.join(self.out_dir, "stacks.txt"), "w") as f:
+            for key, count in sorted(self.stacks.items()):
+                f.write(f"{key} {count}\n")
+
+        with open(os.path.join(self.out_dir, "memory.txt"), "w") as f:
+            f.write(f"peak traced: {peak / 1e6:.1f} MB, still allocated at exit: {current / 1e6:.1f} MB\n\n")
+            f.write("top allocation sites (live at exit):\n")
+            for stat in snapshot.statistics("lineno")[:25]:
+                f.write(f"{stat.size / 1e6:8.2f} MB {stat.count:7d} blocks  {stat.traceback[0]}\n")
+
+        summary = io.StringIO()
+        summary.write(f"wall: {wall:.2f}s, peak memory: {peak / 1e6:.1f} MB, {self.samples} stack samples\n")
+        for key, value in (extra or {}).items():
+            summary.write(f"{key}: {value}\n")
+        summary.write("\nstage            calls    wall s     cpu s    wait s   peak MB\n")
+        for name, totals in sorted(self.stages.items(), key=lambda item: -item[1]["wall"]):
+            summary.write(f"{name:<15} {totals['calls']:6d} {totals['wall']:9.2f} {totals['cpu']:9.2f} "
+                          f"{max(0.0, totals['wall'] - totals['cpu']):9.2f} {totals['peak_bytes'] / 1e6:9.1f}\n")
+
+        wait_samples = sum(count for key, count in self.stacks.items() if key.split(";")[1] == "wait")
+        if self.samples:
+            summary.write(f"\nsampled threads waiting: {wait_samples / self.samples:.0%}, "
+                          f"on CPU: {1 - wait_samples / self.samples:.0%}\n")
+
+        summary.write("\nmain thread outside stages, top functions by cumulative time:\n")
+        stats = pstats.Stats(self.run_profile, stream=summary)
+        stats.sort_stats("cumulative").print_stats(20)
+
+        text = summary.getvalue()
+        with open(os.path.join(self.out_dir, "summary.txt"), "w") as f:
+            f.write(text)
+        return text
+
+
+def _is_waiting(frame):
+    code = frame.f_code
+    return code.co_name in WAIT_FUNCTIONS and code.co_filename.endswith(WAIT_MODULES)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python profiling.py <profile dir>")
+        sys.exit(1)
+    with open(os.path.join(sys.argv[1], "summary.txt")) as f:
+        print(f.read())
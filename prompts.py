@@ -0,0 +1,341 @@
+import hashlib
+import json
+import sys
+
+# Prompts are laid out static-prefix-first: everything static (persona,
+# instructions, format examples) comes first and is identical for every
+# edition of a style; the edition's plan (theme, activity, bro, verse
+# numbers) is always the final message. Never put plan values in a prefix.
+# The protagonist is per book, not per edition, so it may be in the prefix.
+#
+# The provider only caches prompts of at least PROVIDER_CACHE_MIN_TOKENS. No
+# single stage's instructions are that long, and a book runs once a day, far
+# apart for the cache to last. So every call of a run (story, image prompt,
+# rewrite and cocktail) starts with the same HOUSE_STYLE_GUIDE, which is over
+# the minimum: the first call of a run writes it to the cache and the calls
+# that follow within minutes read it back. Calls are routed by book, not by
+# stage (see cache_key), so they land where the guide is cached.
+PROVIDER_CACHE_MIN_TOKENS = 1024
+
+# Shared by every stage, ahead of the stage's own instructions
+HOUSE_STYLE_GUIDE = """House style guide for the Books of John.
+
+The Books of John are a mock-scripture chronicle of John, a man who loves to drink, loves to gamble and loves his \
+bros. Every edition is written as if it were a newly unearthed book of an ancient text: grand, formal and \
+reverent on the surface, about something small, silly and human underneath. The joke is always in the gap between \
+the solemn voice and the everyday subject. Never wink at the reader and never explain the joke.
+
+About John:
+- John is the hero of every edition, even when he loses. He is generous, overconfident, loyal to his bros and \
+always one more round away from a great idea.
+- John's vices are drinking and gambling. He is never cruel, never a victim and never the butt of a mean joke. \
+He can be foolish, but the universe is fond of him.
+- John's bros are his disciples, rivals and partners in crime. When the plan names a bro, give the bro a real \
+part in the story rather than a mention in passing.
+- The setting is the present day: bars, casinos, backyards, golf courses, road trips, ball games and kitchens. \
+Modern things are described in the old voice, e.g. a phone is a glowing tablet, a taxi is a yellow chariot.
+
+Voice and tone:
+- Write in the register of old scripture and folklore: "and it came to pass", "verily", "lo", "behold", used \
+sparingly so they land. Prefer strong, concrete verbs and specific details over adjectives.
+- Every edition has a clear arc: a setup, a turn and a resolution or moral, however short.
+- The theme in the plan is the emotional core of the edition. Show it through what John does and what happens \
+to him rather than naming it over and over.
+- The activity in the plan is what John is doing. It should be recognizable and central, not a backdrop.
+- Humor is warm and absurd. Crude humor is allowed in jests but is never hateful, never about real people and \
+never about anyone's race, religion, gender, sexuality or disability.
+- Do not mention real brands, real celebrities, politics or current events.
+
+Formatting:
+- Editions are posted to Slack. Use plain text, with markdown only where a stage asks for it.
+- Do not add titles, headings, introductions, summaries or sign-offs unless the stage asks for them. Never \
+address the reader, e.g. no "Here is your story" and no "I hope you enjoyed it".
+- Respect every length limit and count the stage gives exactly. Shorter and complete beats longer and cut off.
+- Never use the names of the plan's fields (theme, activity, plan) in the text itself.
+
+The editions come in six styles. Each stage says which one it is writing for; the others are here so every \
+edition of a day reads like part of the same book:
+1. Chronicles: numbered verses, one sentence each, like a chapter of scripture. The verse numbers continue \
+from wherever the plan says the chapter starts. Each verse moves the story forward; no verse only repeats the \
+one before it.
+2. Psalms: a song in a modern music style (heavy metal, rap, eighties pop, classic rock or something fun), sung \
+with the reverence of a hymn. Lines are short, rhythmic and easy to read aloud, with a chorus if it helps.
+3. Proverbs: three quoted one-sentence proverbs tied together by a short story in a religious tone. Each proverb \
+stands on its own, could be stitched onto a pillow and is about the theme, not about cocktails.
+4. Parables: a short, extremely formal story with a clear moral or lesson, stated in the last sentence.
+5. Poems: a short reflective poem in the manner of a poet the reader may recognize but is never told. Every \
+word has to earn its place.
+6. Jests: a stand-up comedy bit, told straight, with a setup, escalation and a real punchline at the end. Do not \
+preface the joke and do not explain it afterwards.
+
+Continuity:
+- Every edition stands alone. Do not refer to earlier editions, other chapters or what happened "last time".
+- Time in the Books of John is loose: a night out can last a chapter, a chapter can span a weekend.
+- When a bro is in the plan, use the bro's name as given and keep the bro consistent with the rest of the \
+edition, e.g. the bro in the story is the bro in the image and the bro toasting with the cocktail.
+
+Cocktails:
+- Every edition comes with a cocktail inspired by the theme and activity of the plan. Inside a story the \
+cocktail is described but never named; the cocktail stage names it.
+- Recipes use real, available ingredients in bar measures (oz, dashes, barspoons), with a glass, an ice choice \
+and a garnish, and can be made at home in under five minutes.
+- Cocktail names are playful and tie the drink to the edition, never to a real brand.
+
+Images:
+- Every edition can come with one illustration. Image prompts describe a single scene: who is in it, what they \
+are doing, where, the light and the mood, and the art style, in under 100 words.
+- John and his bros are drawn as they are described to the image model. Keep faces visible and expressions clear.
+- The image tool has a strict content policy, so show the spirit of a scene rather than its excesses: a raised \
+glass instead of drunkenness, a table of chips instead of ruin, a wink instead of nudity, a cartoonish mess \
+instead of bodily functions. No weapons, gore, drug use, drunk driving or sexual content.
+- Do not ask for text, captions, logos or watermarks in the image.
+"""
+
+# Persona for the story, per content style
+STORY_SYSTEM_PROMPTS = {
+    1: "You are the most prolific story teller of all time. "
+       "You always leave your readers astonished, bewildered, intrigued, or some other strong emotion.",
+    2: "You are a skilled poet and lyricist.",
+    3: "You are a wise sage who can craft insightful proverbs.",
+    4: "You are a master storyteller who can weave captivating parables.",
+    5: "You are a skilled poet.",
+    6: "You are a witty comedian and a wise guy.",
+}
+
+# Static instructions for the story, per content style. The plan follows in the user message.
+STORY_INSTRUCTIONS = {
+    1: (
+        "You are the greatest storyteller in the world. Tell me a descriptive story about John. "
+        "John loves to drink and loves to gamble. Tell me about when John was doing the activity "
+        "in the plan, with the theme in the plan. "
+        "Make sure to incorporate a cocktail which should be in theme with the story, "
+        "but do not give the cocktail a name. "
+        "Use exactly the number of sentences given in the plan. "
+        "Number each sentence, starting with the starting verse in the plan. "
+        "Add a new line after each sentence. "
+        "For example, if the plan starts at verse 12:\n\n"
+        "12: Your first sentence goes here.\n\n"
+        "13: Your second sentence goes here."
+    ),
+    2: (
+        "Write a song about John experiencing the theme in the plan while doing the activity in the plan. "
+        "Incorporate a cocktail inspired by the theme but do not give the cocktail a name. "
+        "Choose from a number of different music styles like heavy metal, rap, 80 pop, classic rock, or something fun. "
+        "Use no more than 150 words."
+    ),
+    3: (
+        "Give me 3 short, insightful proverbs about John's experiences with the theme in the plan "
+        "while doing the activity in the plan. "
+        "Each proverb should be a single, impactful sentence, in quotes. "
+        "Tie the proverbs together in a short story using a religious tone. "
+        "Do not number the sentences and put two new lines between each quote."
+    ),
+    4: (
+        "Tell me a short parable about John's experiences with the theme in the plan "
+        "while doing the activity in the plan. "
+        "The parable should have a clear moral or lesson and be extremely formal. "
+        "Use no more than 150 words."
+    ),
+    5: (
+        "Write a poem about John experiencing the theme in the plan while doing the activity in the plan. "
+        "Incorporate a cocktail inspired by the theme but do not give the cocktail a name. "
+        "The poem should have a poetic and reflective tone. Pick a poet to emulate but do not tell me who. "
+        "Use no more than 50 words."
+    ),
+    6: (
+        "Tell me a dirty joke about John's experiences with the theme in the plan "
+        "while doing the activity in the plan, in the style of stand up comedy. "
+        "Use no more than 150 words. Do not preface the joke, just tell it."
+    ),
+}
+
+_IMAGE_PROMPT_ENGINEER = "You are an expert image prompt engineer. "
+_IMAGE_PROMPT_ASK = " Generate a DALL-E prompt, less than 100 words, for an image that "
+
+# Static image-prompt instructions, per content style
+IMAGE_PROMPT_INSTRUCTIONS = {
+    1: _IMAGE_PROMPT_ENGINEER
+       + "Your task is to create a concise and evocative DALL-E prompt "
+         "based on the provided text, suitable for generating a high-quality image. "
+         "Incorporate character descriptions where relevant."
+       + _IMAGE_PROMPT_ASK + "visually represents the text the user sends.",
+    2: _IMAGE_PROMPT_ENGINEER
+       + "Your task is to create a concise and evocative DALL-E prompt "
+         "based on the provided text, suitable for generating an abstract or symbolic image."
+       + _IMAGE_PROMPT_ASK + "visually represents the mood and themes of the text the user sends.",
+    3: _IMAGE_PROMPT_ENGINEER
+       + "Your task is to create a concise and evocative DALL-E prompt "
+         "that visually represents the core message of the proverb."
+       + _IMAGE_PROMPT_ASK + "illustrates the text the user sends.",
+    6: _IMAGE_PROMPT_ENGINEER
+       + "Your task is to create a concise and evocative DALL-E prompt "
+         "that humorously illustrates the core idea of the joke. "
+         "Incorporate character descriptions where relevant."
+       + _IMAGE_PROMPT_ASK.replace("an image", "a humorous image") + "is based on the text the user sends.",
+}
+IMAGE_PROMPT_INSTRUCTIONS[4] = IMAGE_PROMPT_INSTRUCTIONS[1]  # Parables are visual narratives too
+IMAGE_PROMPT_INSTRUCTIONS[5] = IMAGE_PROMPT_INSTRUCTIONS[2]  # Poems are mood-based like psalms
+
+COCKTAIL_INSTRUCTIONS = (
+    "You are a mixologist. You mix up the most incredible cocktails. "
+    "Craft a cocktail recipe inspired by the theme and the activity in the plan. "
+    "Give the cocktail a name and present the output as you find in a recipe book. "
+    "Only provide the drink name, recipe, and instructions. "
+    "Do not provide any links. "
+    "Provide the output in markdown formatting."
+)
+
+
+def story_plan(content_style, theme, activity, bro_text, number_verses=None, starting_verse=None):
+    """
+    The variable part of a story prompt.
+
+    Args:
+        content_style (int): The selected content style (1-6).
+        theme (str): The selected theme.
+        activity (str): The activity, e.g. "playing poker".
+        bro_text (str): Text related to the bro, if applicable.
+        number_verses (int): The number of verses (style 1 only).
+        starting_verse (int): The starting verse number (style 1 only).
+
+    Returns:
+        str: The plan, sent as the final user message.
+    """
+    if content_style not in STORY_INSTRUCTIONS:
+        raise ValueError("Invalid content style. Please select a style between 1 and 6.")
+    lines = [f"Theme: {theme}", f"Activity: {activity}{bro_text}"]
+    if content_style == 1:
+        lines.append(f"Sentences: {number_verses}")
+        lines.append(f"Starting verse: {starting_verse}")
+    return "Plan:\n" + "\n".join(lines)
+
+
+def cast(text, protagonist="John"):
+    """
+    Returns:
+        str: A static prompt text with another book's protagonist in John's place.
+    """
+    return text if protagonist == "John" else text.replace("John", protagonist)
+
+
+def style_guide_message(protagonist="John"):
+    """
+    Returns:
+        dict: The house style guide, the first message of every call.
+    """
+    return {"role": "system", "content": cast(HOUSE_STYLE_GUIDE, protagonist)}
+
+
+def story_messages(content_style, plan, protagonist="John"):
+    """
+    Returns:
+        list: Chat messages for a story: static persona and instructions, then the plan.
+    """
+    if content_style not in STORY_INSTRUCTIONS:
+        raise ValueError("Invalid content style.")
+    system = STORY_SYSTEM_PROMPTS[content_style] + "\n\n" + STORY_INSTRUCTIONS[content_style]
+    return [
+        style_guide_message(protagonist),
+        {"role": "system", "content": cast(system, protagonist)},
+        {"role": "user", "content": plan},
+    ]
+
+
+def image_prompt_messages(content_style, story, bro_text, protagonist="John"):
+    """
+    Returns:
+        list: Chat messages for an image prompt: static instructions, then the story.
+    """
+    if content_style not in IMAGE_PROMPT_INSTRUCTIONS:
+        raise ValueError("Invalid content style.")
+    return [
+        style_guide_message(protagonist),
+        {"role": "system", "content": cast(IMAGE_PROMPT_INSTRUCTIONS[content_style], protagonist)},
+        {"role": "user", "content": f"{story}\n\nFeaturing: {protagonist}{bro_text}"},
+    ]
+
+
+IMAGE_PROMPT_REWRITE_INSTRUCTIONS = (
+    "You rewrite image prompts so that an image generator with a strict content policy accepts them. "
+    "Keep the characters, setting, mood and humor. "
+    "Replace anything showing drug use, drunk driving, nudity, sexual content, gore, weapons or bodily functions "
+    "with a tame visual equivalent. "
+    "Reply with the rewritten prompt only, less than 100 words."
+)
+
+
+def image_prompt_rewrite_messages(prompt, protagonist="John"):
+    """
+    Returns:
+        list: Chat messages asking for a safer version of an image prompt.
+    """
+    return [
+        style_guide_message(protagonist),
+        {"role": "system", "content": IMAGE_PROMPT_REWRITE_INSTRUCTIONS},
+        {"role": "user", "content": prompt},
+    ]
+
+
+def cocktail_messages(theme, activity, protagonist="John"):
+    """
+    Returns:
+        list: Chat messages for a cocktail recipe: static instructions, then the plan.
+    """
+    return [
+        style_guide_message(protagonist),
+        {"role": "system", "content": COCKTAIL_INSTRUCTIONS},
+        {"role": "user", "content": f"Plan:\nTheme: {theme}\nActivity: {activity}"},
+    ]
+
+
+def cache_key(tenant_id=None):
+    """
+    Returns:
+        str: The prompt_cache_key for a book (other than the default one). Every
+            stage shares it, so calls sharing the style guide are routed together.
+    """
+    return "boj" + (f"-{tenant_id}" if tenant_id else "")
+
+
+def prefix_fingerprint(messages):
+    """
+    Returns:
+        str: A short hash of everything before the final message.
+    """
+    return hashlib.sha256(json.dumps(messages[:-1], sort_keys=True).encode()).hexdigest()[:12]
+
+
+def prefix_tokens(messages):
+    """
+    Returns:
+        int: Rough token count of everything before the final message (4 characters a token).
+    """
+    return len(json.dumps(messages[:-1])) // 4
+
+
+def stage_builders():
+    """
+    Every stage's message builder, for checking prefixes.
+
+    Returns:
+        dict: Name (e.g. "story/1") -> build(plan), where plan has "theme", "activity", "bro",
+            "verses" and "start".
+    """
+    builders = {}
+    for content_style in STORY_INSTRUCTIONS:
+        builders[f"story/{content_style}"] = lambda p, cs=content_style: story_messages(
+            cs, story_plan(cs, p["theme"], p["activity"], p["bro"], p["verses"], p["start"]))
+        builders[f"image_prompt/{content_style}"] = lambda p, cs=content_style: image_prompt_messages(
+            cs, f"A story about {p['theme']} and {p['activity']}.", p["bro"])
+    builders["cocktail"] = lambda p: cocktail_messages(p["theme"], p["activity"])
+    builders["image_rewrite"] = lambda p: image_prompt_rewrite_messages(f"John {p['activity']}{p['bro']}.")
+    return builders
+
+
+if __name__ == "__main__":
+    plan = {"theme": "joy", "activity": "playing poker", "bro": " with his bro JP", "verses": 3, "start": 1}
+    print(f"shared style guide ~{prefix_tokens([style_guide_message(), None])} tokens "
+          f"(cache minimum {PROVIDER_CACHE_MIN_TOKENS})")
+    for name, build in stage_builders().items():
+        messages = build(plan)
+        print(f"{name:<16} prefix {prefix_fingerprint(messages)}  ~{prefix_tokens(messages)} tokens")
@@ -0,0 +1,321 @@
+import json
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import closing
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from metrics import RETRIES
+
+# Requests and tokens per minute per model, used until the API's
+# x-ratelimit-* headers tell us the real limits
+DEFAULT_LIMITS = {
+    "gpt-4.1-mini": (500, 200000),
+    "gpt-4.1-nano": (500, 200000),
+}
+FALLBACK_LIMITS = (60, 40000)
+
+# Stay this far under the advertised limits
+SAFETY_MARGIN = 0.95
+
+# 429s retried after backing off before giving up
+MAX_429_RETRIES = 3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS buckets (
+    model TEXT NOT NULL,
+    kind TEXT NOT NULL,
+    capacity REAL NOT NULL,
+    level REAL NOT NULL,
+    updated REAL NOT NULL,
+    PRIMARY KEY (model, kind)
+);
+"""
+
+
+class SharedRateLimiter:
+    """
+    Token-bucket limiter shared by every process on the machine.
+
+    Each model has a requests bucket and a tokens bucket, both refilled
+    continuously over `window` seconds (a minute for the real API). State
+    lives in SQLite and is only changed inside BEGIN IMMEDIATE transactions,
+    so daemons, backfills and ad-hoc runs draw from the same buckets.
+    """
+
+    def __init__(self, path, window=60.0, limits=None):
+        self.path = path
+        self.window = window
+        self.limits = dict(DEFAULT_LIMITS, **(limits or {}))
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def _buckets(self, db, model, now):
+        """
+        Loads and refills both buckets for a model, creating them if needed.
+        """
+        buckets = {}
+        requests_limit, tokens_limit = self.limits.get(model, FALLBACK_LIMITS)
+        for kind, limit in (("requests", requests_limit), ("tokens", tokens_limit)):
+            row = db.execute(
+                "SELECT capacity, level, updated FROM buckets WHERE model = ? AND kind = ?", (model, kind)
+            ).fetchone()
+            if row is None:
+                capacity = limit * SAFETY_MARGIN
+                row = (capacity, capacity, now)
+                db.execute("INSERT INTO buckets VALUES (?, ?, ?, ?, ?)", (model, kind, *row))
+            capacity, level, updated = row
+            level = min(capacity, level + (now - updated) * capacity / self.window)
+            buckets[kind] = [capacity, level]
+        return buckets
+
+    def _write(self, db, model, buckets, now):
+        for kind, (capacity, level) in buckets.items():
+            db.execute(
+                "UPDATE buckets SET capacity = ?, level = ?, updated = ? WHERE model = ? AND kind = ?",
+                (capacity, level, now, model, kind),
+            )
+
+    def _transaction(self, model, update):
+        now = time.time()
+        db = self._connect()
+        try:
+            db.execute("BEGIN IMMEDIATE")
+            buckets = self._buckets(db, model, now)
+            result = update(buckets)
+            self._write(db, model, buckets, now)
+            db.execute("COMMIT")
+            return result
+        except Exception:
+            # BEGIN IMMEDIATE itself may have failed (e.g. the database was locked), leaving nothing to roll back
+            if db.in_transaction:
+                db.execute("ROLLBACK")
+            raise
+        finally:
+            db.close()
+
+    def acquire(self, model, tokens):
+        """
+        Blocks until one request and `tokens` tokens are available for `model`.
+
+        Args:
+            model (str): The model.
+            tokens (int): Estimated tokens the call will use.
+
+        Returns:
+            float: Seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            def take(buckets):
+                requests, token_bucket = buckets["requests"], buckets["tokens"]
+                # A call bigger than the whole bucket waits for a full bucket
+                needed = min(tokens, token_bucket[0])
+                if requests[1] >= 1 and token_bucket[1] >= needed:
+                    requests[1] -= 1
+                    token_bucket[1] -= needed
+                    return 0.0
+                request_wait = (1 - requests[1]) * self.window / requests[0]
+                token_wait = (needed - token_bucket[1]) * self.window / token_bucket[0]
+                return max(request_wait, token_wait, 0.001)
+
+            wait = self._transaction(model, take)
+            if not wait:
+                return waited
+            wait = min(wait, 1.0) * random.uniform(1.0, 1.2)
+            time.sleep(wait)
+            waited += wait
+
+    def settle(self, model, estimated, actual):
+        """
+        Corrects the tokens bucket once the real usage of a call is known.
+        """
+        def correct(buckets):
+            capacity, level = buckets["tokens"]
+            buckets["tokens"][1] = min(capacity, level + estimated - actual)
+        self._transaction(model, correct)
+
+    def update_from_headers(self, model, headers):
+        """
+        Adapts the buckets to the x-ratelimit-* headers of a response: the
+        advertised limits become the capacities and the bucket levels never
+        exceed what the server says remains.
+        """
+        def adapt(buckets):
+            for kind in ("requests", "tokens"):
+                limit = headers.get(f"x-ratelimit-limit-{kind}")
+                remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+                if limit is not None:
+                    buckets[kind][0] = float(limit) * SAFETY_MARGIN
+                if remaining is not None:
+                    buckets[kind][1] = min(buckets[kind][1], float(remaining) * SAFETY_MARGIN)
+        self._transaction(model, adapt)
+
+    def penalize(self, model, retry_after=None):
+        """
+        Empties the buckets after a 429 so every process backs off.
+
+        Returns:
+            float: Seconds to wait before retrying.
+        """
+        def drain(buckets):
+            buckets["requests"][1] = min(buckets["requests"][1], 0.0)
+            buckets["tokens"][1] = min(buckets["tokens"][1], 0.0)
+        self._transaction(model, drain)
+        return float(retry_after) if retry_after else self.window / 60.0
+
+
+def estimate_tokens(kwargs):
+    """
+    Rough token estimate for a create call: ~4 characters per prompt token
+    plus the output budget.
+    """
+    prompt = kwargs.get("messages") or kwargs.get("input") or ""
+    output = kwargs.get("max_tokens") or kwargs.get("max_output_tokens") or 512
+    return len(json.dumps(prompt, default=str)) // 4 + output * kwargs.get("n", 1)
+
+
+def limited_create(limiter, resource, model, **kwargs):
+    """
+    Calls resource.create(**kwargs) after acquiring from the shared limiter,
+    then adapts the limiter to the response headers and actual usage.
+
+    Args:
+        limiter (SharedRateLimiter): The shared limiter.
+        resource: An OpenAI resource with .create, e.g. client.chat.completions.
+        model (str): The bucket to draw from.
+
+    Returns:
+        The parsed API response.
+    """
+    import openai
+
+    estimated = estimate_tokens(kwargs)
+    for attempt in range(MAX_429_RETRIES + 1):
+        limiter.acquire(model, estimated)
+        try:
+            raw = resource.with_raw_response.create(**kwargs)
+        except openai.RateLimitError as e:
+            if attempt == MAX_429_RETRIES:
+                raise
+            RETRIES.inc("openai_429")
+            time.sleep(limiter.penalize(model, e.response.headers.get("retry-after")))
+            continue
+
+        limiter.update_from_headers(model, raw.headers)
+        response = raw.parse()
+        usage = getattr(response, "usage", None)
+        if usage is not None and getattr(usage, "total_tokens", None) is not None:
+            limiter.settle(model, estimated, usage.total_tokens)
+        return response
+
+
+class _MockAPIHandler(BaseHTTPRequestHandler):
+    """
+    Local stand-in for the API: its own token buckets answer 429 when exceeded.
+    """
+
+    requests_limit = 50
+    tokens_limit = 5000
+    window = 5.0
+    lock = threading.Lock()
+    state = {}
+    stats = {"ok": 0, "429": 0}
+
+    def do_POST(self):
+        tokens = int(self.headers.get("X-Tokens", 0))
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            now = time.time()
+            requests_level, tokens_level, updated = self.state.get(
+                "buckets", (self.requests_limit, self.tokens_limit, now))
+            elapsed = now - updated
+            requests_level = min(self.requests_limit, requests_level + elapsed * self.requests_limit / self.window)
+            tokens_level = min(self.tokens_limit, tokens_level + elapsed * self.tokens_limit / self.window)
+            allowed = requests_level >= 1 and tokens_level >= tokens
+            if allowed:
+                requests_level -= 1
+                tokens_level -= tokens
+            self.state["buckets"] = (requests_level, tokens_level, now)
+            self.stats["ok" if allowed else "429"] += 1
+
+        self.send_response(200 if allowed else 429)
+        self.send_header("x-ratelimit-limit-requests", str(self.requests_limit))
+        self.send_header("x-ratelimit-remaining-requests", str(int(requests_level)))
+        self.send_header("x-ratelimit-limit-tokens", str(self.tokens_limit))
+        self.send_header("x-ratelimit-remaining-tokens", str(int(tokens_level)))
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _stress_worker(path, url, calls, window):
+    import urllib.error
+    import urllib.request
+
+    limiter = SharedRateLimiter(path, window=window, limits={"mock": (
+        _MockAPIHandler.requests_limit, _MockAPIHandler.tokens_limit)})
+    for _ in range(calls):
+        tokens = random.randint(20, 200)
+        limiter.acquire("mock", tokens)
+        request = urllib.request.Request(url, data=b"{}", headers={"X-Tokens": str(tokens)})
+        try:
+            with urllib.request.urlopen(request) as response:
+                limiter.update_from_headers("mock", response.headers)
+        except urllib.error.HTTPError as e:
+            if e.code != 429:
+                raise
+            time.sleep(limiter.penalize("mock"))
+
+
+def run_stress_test(path, processes=8, calls=40):
+    """
+    Hammers a local mock API from several processes through the shared
+    limiter and reports throughput and 429s.
+
+    Returns:
+        dict: "ok" and "429" response counts and "seconds" taken.
+    """
+    if os.path.exists(path):
+        os.remove(path)
+    _MockAPIHandler.state = {}
+    _MockAPIHandler.stats = {"ok": 0, "429": 0}
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _MockAPIHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v1"
+
+    start = time.time()
+    workers = [
+        multiprocessing.Process(target=_stress_worker, args=(path, url, calls, _MockAPIHandler.window))
+        for _ in range(processes)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.time() - start
+
+    sustainable = _MockAPIHandler.requests_limit / _MockAPIHandler.window
+    print(f"{_MockAPIHandler.stats['ok']} ok, {_MockAPIHandler.stats['429']} 429s in {elapsed:.1f}s "
+          f"({_MockAPIHandler.stats['ok'] / elapsed:.1f} req/s, request limit {sustainable:.1f} req/s)")
+    server.shutdown()
+    server.server_close()
+    return dict(_MockAPIHandler.stats, seconds=elapsed)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3 or sys.argv[1] != "stress":
+        print("usage: python rate_limit.py stress <limiter.sqlite>")
+        sys.exit(1)
+    run_stress_test(sys.argv[2])
@@ -0,0 +1,237 @@
+import fcntl
+import json
+import os
+import random
+import tempfile
+import threading
+import time
+
+from metrics import CACHE_HITS, CACHE_MISSES
+
+
+class RecipeCache:
+    """
+    Persistent cocktail recipe cache keyed by (theme, activity).
+
+    Each key holds a few recipe variants. A cached variant is reused with
+    `reuse_probability`, otherwise a fresh recipe is generated. Variants expire
+    after `ttl_seconds` and the least recently used keys are evicted once the
+    cache holds more than `max_keys`. When a run is served from a key that has
+    fewer than `max_variants` variants, or whose newest one is past half its
+    TTL, a background thread generates another variant so the cache keeps
+    getting fresh recipes over time; a full, fresh key is served without any
+    model call. There is at most one refill per key at a time.
+    """
+
+    def __init__(self, path, reuse_probability=0.8, ttl_seconds=30 * 24 * 3600, max_keys=1500, max_variants=3):
+        self.path = path
+        self.reuse_probability = reuse_probability
+        self.ttl_seconds = ttl_seconds
+        self.max_keys = max_keys
+        self.max_variants = max_variants
+
+        self.hits = 0
+        self.misses = 0
+        self.refills = 0
+        self.latency_saved = 0.0
+
+        self._lock = threading.Lock()
+        self._refill_threads = []
+        self._refilling = set()
+        self._entries = {}
+        self._avg_latency = None
+        self._load()
+
+    @staticmethod
+    def _key(theme, activity):
+        return f"{theme}|{activity}"
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self._entries = data.get("entries", {})
+        self._avg_latency = data.get("avg_latency")
+
+    def _fresh_recipes(self, key, now):
+        entry = self._entries.get(key)
+        if not entry:
+            return []
+        return [r for r in entry["recipes"] if now - r["created"] < self.ttl_seconds]
+
+    def _store(self, key, text, latency):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.setdefault(key, {"recipes": [], "last_used": now})
+            entry["recipes"] = self._fresh_recipes(key, now)
+            entry["recipes"].append({"text": text, "created": now})
+            # Keep the newest variants only
+            entry["recipes"] = entry["recipes"][-self.max_variants:]
+            entry["last_used"] = now
+
+            if self._avg_latency is None:
+                self._avg_latency = latency
+            else:
+                self._avg_latency = 0.8 * self._avg_latency + 0.2 * latency
+
+    def _refill(self, key, generate):
+        start = time.time()
+        try:
+            text = generate()
+        except Exception as e:
+            print(f"Recipe cache refill failed: {e}")
+            return
+        finally:
+            with self._lock:
+                self._refilling.discard(key)
+        if text:
+            self._store(key, text, time.time() - start)
+            with self._lock:
+                self.refills += 1
+
+    def get_recipe(self, theme, activity, generate):
+        """
+        Returns a cocktail recipe for the theme/activity, from cache if possible.
+
+        Args:
+            theme (str): The selected theme for the story.
+            activity (str): The chosen activity string.
+            generate (callable): Generates a fresh recipe, e.g. a call to the model.
+
+        Returns:
+            str: The cocktail recipe in markdown format.
+        """
+        key = self._key(theme, activity)
+        now = time.time()
+
+        with self._lock:
+            fresh = self._fresh_recipes(key, now)
+            if fresh and random.random() < self.reuse_probability:
+                self._entries[key]["last_used"] = now
+                recipe = random.choice(fresh)
+                self.hits += 1
+                CACHE_HITS.inc("recipe")
+                self.latency_saved += self._avg_latency or 0.0
+                # Top the key up in the background only while it is short of variants or going stale
+                newest = max(r["created"] for r in fresh)
+                refill = (key not in self._refilling
+                          and (len(fresh) < self.max_variants or now - newest > self.ttl_seconds / 2))
+                if refill:
+                    self._refilling.add(key)
+            else:
+                recipe = None
+                self.misses += 1
+                CACHE_MISSES.inc("recipe")
+
+        if recipe is not None:
+            if refill:
+                thread = threading.Thread(target=self._refill, args=(key, generate), daemon=True)
+                thread.start()
+                self._refill_threads.append(thread)
+            return recipe["text"]
+
+        start = time.time()
+        text = generate()
+        if text:
+            self._store(key, text, time.time() - start)
+        return text
+
+    def cached_recipe(self, theme, activity):
+        """
+        Returns a cached recipe for the theme/activity without calling the
+        model at all, neither for a miss nor to refill; for when the API is down.
+
+        Returns:
+            str: A cached recipe, or None if there is none.
+        """
+        key = self._key(theme, activity)
+        now = time.time()
+        with self._lock:
+            fresh = self._fresh_recipes(key, now)
+            if not fresh:
+                self.misses += 1
+                CACHE_MISSES.inc("recipe")
+                return None
+            self._entries[key]["last_used"] = now
+            self.hits += 1
+            CACHE_HITS.inc("recipe")
+            return random.choice(fresh)["text"]
+
+    def wait_for_refills(self, timeout=60):
+        """
+        Waits for background refills to finish, up to `timeout` seconds in total.
+        """
+        deadline = time.time() + timeout
+        for thread in self._refill_threads:
+            thread.join(max(0, deadline - time.time()))
+        self._refill_threads = [t for t in self._refill_threads if t.is_alive()]
+
+    def _merge(self, entries):
+        """
+        Folds in the entries another process saved since this cache was loaded.
+        """
+        for key, entry in entries.items():
+            mine = self._entries.get(key)
+            if mine is None:
+                self._entries[key] = entry
+                continue
+            seen = {(r["text"], r["created"]) for r in mine["recipes"]}
+            recipes = mine["recipes"] + [r for r in entry["recipes"] if (r["text"], r["created"]) not in seen]
+            recipes.sort(key=lambda r: r["created"])
+            mine["recipes"] = recipes[-self.max_variants:]
+            mine["last_used"] = max(mine["last_used"], entry["last_used"])
+
+    def save(self):
+        """
+        Merges in what other runs saved, prunes expired recipes, evicts least
+        recently used keys and writes the cache to disk.
+
+        Concurrent savers (threads, backfill workers, the edition service)
+        take turns on a lock file, so none of them loses another's recipes.
+        """
+        directory = os.path.dirname(self.path) or "."
+        os.makedirs(directory, exist_ok=True)
+        with self._lock, open(self.path + ".lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(self.path) as f:
+                    self._merge(json.load(f).get("entries", {}))
+            except (OSError, ValueError):
+                pass
+
+            now = time.time()
+            for key in list(self._entries):
+                self._entries[key]["recipes"] = self._fresh_recipes(key, now)
+                if not self._entries[key]["recipes"]:
+                    del self._entries[key]
+
+            if len(self._entries) > self.max_keys:
+                by_use = sorted(self._entries, key=lambda k: self._entries[k]["last_used"])
+                for key in by_use[:len(self._entries) - self.max_keys]:
+                    del self._entries[key]
+
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".recipe_cache-", suffix=".tmp")
+            try:
+                with os.fdopen(fd, "w") as f:
+                    json.dump({"entries": self._entries, "avg_latency": self._avg_latency}, f)
+                os.replace(tmp_path, self.path)
+            except BaseException:
+                os.unlink(tmp_path)
+                raise
+
+    def summary(self):
+        """
+        Returns:
+            dict: Hit/miss counts, hit rate and estimated latency saved this run.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "refills": self.refills,
+            "latency_saved_s": round(self.latency_saved, 2),
+            "cached_keys": len(self._entries),
+        }
@@ -0,0 +1,111 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+from metrics import ERRORS, STAGE_SECONDS
+
+
+class RunTrace:
+    """
+    Timing spans and decisions for one run, saved as a JSON line per run.
+    """
+
+    def __init__(self, run_id, profiler=None):
+        self.run_id = run_id
+        self.profiler = profiler
+        self.started = time.time()
+        self.spans = []
+        self.decisions = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage, **attrs):
+        """
+        Times a pipeline stage. Attributes can be added to the yielded dict.
+        With a profiler, the span also records its CPU and wait seconds.
+
+        Args:
+            stage (str): The stage name, e.g. "story" or "image".
+        """
+        record = {"stage": stage, "start": time.time() - self.started, **attrs}
+        start = time.perf_counter()
+        profile = self.profiler.stage(stage) if self.profiler else nullcontext({})
+        try:
+            with profile as timings:
+                yield record
+        except Exception as e:
+            record["error"] = repr(e)
+            raise
+        finally:
+            record.update(timings)
+            record["seconds"] = time.perf_counter() - start
+            STAGE_SECONDS.observe(stage, value=record["seconds"])
+            if "error" in record:
+                ERRORS.inc(stage)
+            with self._lock:
+                self.spans.append(record)
+
+    def decide(self, name, value):
+        """
+        Records a decision made during the run (settings picked, models chosen, ...).
+        """
+        with self._lock:
+            self.decisions[name] = value
+
+    def elapsed(self):
+        """
+        Returns:
+            float: Seconds since the run started.
+        """
+        return time.time() - self.started
+
+    def save(self, path):
+        """
+        Appends the trace to a JSON-lines file.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            record = {
+                "run_id": self.run_id,
+                "started": self.started,
+                "seconds": self.elapsed(),
+                "spans": self.spans,
+                "decisions": self.decisions,
+            }
+        with open(path, "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+
+def load_traces(path, limit=None):
+    """
+    Loads saved run traces, oldest first.
+
+    Args:
+        path (str): The trace file.
+        limit (int): Only return the most recent `limit` traces.
+
+    Returns:
+        list: The trace dicts.
+    """
+    traces = []
+    try:
+        with open(path) as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    traces.append(json.loads(line))
+    except OSError:
+        return []
+    if limit is not None:
+        return traces[-limit:]
+    return traces
+
+
+def stage_spans(traces, stage):
+    """
+    Returns:
+        list: Every span of `stage` across the traces.
+    """
+    return [span for trace in traces for span in trace["spans"] if span["stage"] == stage]
@@ -0,0 +1,83 @@
+import re
+
+from verse_validator import target_words, validate_story
+
+_WORD_RE = re.compile(r"[a-z']+")
+
+# Weights for the parts of a candidate's score, each part in [0, 1]
+SCORE_WEIGHTS = {
+    "format": 0.35,
+    "length": 0.2,
+    "diversity": 0.25,
+    "novelty": 0.2,
+}
+
+
+def _words(text):
+    return _WORD_RE.findall(text.lower())
+
+
+def _bigrams(words):
+    return set(zip(words, words[1:]))
+
+
+def score_candidate(story, content_style, number_verses=None, starting_verse=None, recent_bigrams=()):
+    """
+    Cheap local quality score for one story candidate.
+
+    Args:
+        story (str): The candidate story.
+        content_style (int): The selected content style (1-6).
+        number_verses (int): The number of verses asked for (style 1 only).
+        starting_verse (int): The starting verse number (style 1 only).
+        recent_bigrams (list): Word-bigram sets of recent archived stories.
+
+    Returns:
+        tuple: (total score, dict of the individual parts)
+    """
+    _, report = validate_story(story, content_style, number_verses, starting_verse)
+    format_score = 1.0 / (1 + len(report["problems"]) + 2 * report["missing"])
+
+    words = _words(story)
+    low, high = target_words(content_style, number_verses)
+    if low <= len(words) <= high:
+        length_score = 1.0
+    elif len(words) < low:
+        length_score = len(words) / low
+    else:
+        length_score = max(0.0, 1 - (len(words) - high) / high)
+
+    diversity_score = len(set(words)) / len(words) if words else 0.0
+
+    bigrams = _bigrams(words)
+    similarity = 0.0
+    for other in recent_bigrams:
+        union = bigrams | other
+        if union:
+            similarity = max(similarity, len(bigrams & other) / len(union))
+    novelty_score = 1 - similarity
+
+    parts = {
+        "format": format_score,
+        "length": length_score,
+        "diversity": diversity_score,
+        "novelty": novelty_score,
+    }
+    total = sum(SCORE_WEIGHTS[name] * value for name, value in parts.items())
+    return total, parts
+
+
+def rank_candidates(candidates, content_style, number_verses=None, starting_verse=None, recent_stories=()):
+    """
+    Ranks story candidates best first.
+
+    Returns:
+        list: (score, story, parts) tuples, best first.
+    """
+    recent_bigrams = [_bigrams(_words(s)) for s in recent_stories]
+    ranked = []
+    for story in candidates:
+        score, parts = score_candidate(story, content_style, number_verses, starting_verse, recent_bigrams)
+        ranked.append((score, story, parts))
+    ranked.sort(key=lambda r: r[0], reverse=True)
+    return ranked
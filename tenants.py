@@ -0,0 +1,321 @@
+import importlib
+import random
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+import catalog
+
+# The original book; its editions, archive records and prompts are unchanged
+DEFAULT_TENANT_ID = "john"
+
+ALL_CONTENT_STYLES = [1, 2, 3, 4, 5, 6]
+
+_TENANT_ID_RE = re.compile(r"^[a-z0-9][a-z0-9_-]*$")
+
+
+def default_tenant(img_path=None):
+    """
+    The Books of John, from catalog.py. Its destinations come from the
+    top-level Slack settings in keys.py.
+
+    Args:
+        img_path (str): Directory holding the cast portraits.
+
+    Returns:
+        dict: The tenant.
+    """
+    return {
+        "id": DEFAULT_TENANT_ID,
+        "book_title": catalog.book_title,
+        "header": f":game_die: :beer: :game_die:  {catalog.book_title}  :game_die: :beer: :game_die:",
+        "protagonist": "John",
+        "emotions": catalog.emotions,
+        "bro_dict": catalog.bro_dict,
+        "activities_list": catalog.activities_list,
+        "content_styles": ALL_CONTENT_STYLES,
+        "img_path": img_path,
+        "destinations": None,
+        "weight": 1,
+    }
+
+
+def make_tenant(config, base):
+    """
+    Builds a tenant from its keys.tenants entry.
+
+    Anything not in the entry is taken from `base` (the default tenant),
+    except the portraits and destinations, which every other book must
+    bring itself so it never posts to (or draws) another group.
+
+    Args:
+        config (dict): "id" plus any of "catalog" (a module with book_title,
+            emotions, bro_dict and activities_list, like catalog.py), those
+            four names directly, "protagonist", "header", "content_styles",
+            "img_path", "destinations" (as in keys.slack_destinations) and
+            "weight" (its share of the workers when books compete).
+        base (dict): The default tenant.
+
+    Returns:
+        dict: The tenant.
+
+    Raises:
+        ValueError: If the tenant is invalid.
+    """
+    tenant = dict(base)
+    if config.get("id") != base["id"]:
+        tenant.update(img_path=None, destinations=None)
+    if config.get("catalog"):
+        module = importlib.import_module(config["catalog"])
+        for name in ("book_title", "emotions", "bro_dict", "activities_list"):
+            if hasattr(module, name):
+                tenant[name] = getattr(module, name)
+    tenant.update({key: value for key, value in config.items() if key != "catalog"})
+    if "header" not in config and tenant["book_title"] != base["book_title"]:
+        tenant["header"] = f":books:  {tenant['book_title']}  :books:"
+
+    problems = check_tenant(tenant, is_default=tenant["id"] == base["id"])
+    if problems:
+        raise ValueError(f"Invalid tenant {tenant.get('id')!r}: " + "; ".join(problems))
+    return tenant
+
+
+def check_tenant(tenant, is_default=False):
+    """
+    Returns:
+        list: Problems with a tenant's configuration (empty if it is usable).
+    """
+    problems = []
+    if not _TENANT_ID_RE.match(str(tenant.get("id", ""))):
+        problems.append("id must be lowercase letters, digits, '-' or '_'")
+    if not tenant["emotions"]:
+        problems.append("no emotions")
+    if not tenant["activities_list"]:
+        problems.append("no activities")
+    if not tenant["content_styles"] or not set(tenant["content_styles"]) <= set(ALL_CONTENT_STYLES):
+        problems.append(f"content_styles must be a non-empty subset of {ALL_CONTENT_STYLES}")
+    if not tenant.get("weight") or tenant["weight"] <= 0:
+        problems.append("weight must be positive")
+    for activity in tenant["activities_list"]:
+        for bro in activity.get("bro_list") or []:
+            if bro not in tenant["bro_dict"]:
+                problems.append(f"{activity['chapter_title']!r} lists {bro!r}, who is not in bro_dict")
+    if not is_default:
+        if not tenant.get("img_path"):
+            problems.append("img_path (the cast portraits) is required")
+        if not tenant.get("destinations"):
+            problems.append("destinations are required")
+    return problems
+
+
+def load_tenants(configured, base):
+    """
+    Args:
+        configured (list): The keys.tenants entries.
+        base (dict): The default tenant.
+
+    Returns:
+        dict: Tenant id -> tenant, the default tenant first.
+    """
+    tenants = {base["id"]: base}
+    for config in configured or []:
+        tenant = make_tenant(config, base)
+        tenants[tenant["id"]] = tenant
+    return tenants
+
+
+class FairScheduler:
+    """
+    Per-tenant FIFO queues served in weighted fair order.
+
+    Each tenant has a virtual clock that advances by 1/weight per job it is
+    served; the next job always comes from the waiting tenant with the
+    earliest clock. A tenant that goes idle does not bank credit: when its
+    queue refills, its clock is moved up to the earliest active one. So a
+    book that submits a burst gets the workers only while nobody else is
+    waiting, and one with weight 2 gets twice the share of one with weight 1.
+    """
+
+    def __init__(self, weights=None, queue_limit=None):
+        """
+        Args:
+            weights (dict): Tenant id -> weight (default 1).
+            queue_limit (int): Jobs each tenant may have waiting, or None for no limit.
+        """
+        self.weights = weights or {}
+        self.queue_limit = queue_limit
+        self.queues = {}
+        self.clocks = {}
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def put(self, tenant_id, item):
+        """
+        Returns:
+            bool: False if the tenant's queue is full.
+        """
+        with self._cond:
+            queue = self.queues.setdefault(tenant_id, deque())
+            if self.queue_limit is not None and len(queue) >= self.queue_limit:
+                return False
+            if not queue:
+                active = [self.clocks[t] for t, q in self.queues.items() if q]
+                self.clocks[tenant_id] = max(self.clocks.get(tenant_id, 0.0), min(active, default=0.0))
+            queue.append(item)
+            self._cond.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Waits for the next job in fair order.
+
+        Returns:
+            tuple: (tenant id, item), or None on timeout or once closed and drained.
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._closed or any(self.queues.values()), timeout):
+                return None
+            waiting = [t for t, q in self.queues.items() if q]
+            if not waiting:
+                return None
+            tenant_id = min(waiting, key=lambda t: self.clocks[t])
+            item = self.queues[tenant_id].popleft()
+            self.clocks[tenant_id] += 1 / self.weights.get(tenant_id, 1)
+            return tenant_id, item
+
+    def depth(self, tenant_id=None):
+        """
+        Returns:
+            int: Jobs waiting for one tenant, or for all of them.
+        """
+        with self._cond:
+            if tenant_id is not None:
+                return len(self.queues.get(tenant_id, ()))
+            return sum(len(q) for q in self.queues.values())
+
+    def close(self):
+        """
+        Wakes every waiting get(); they return None once the queues are drained.
+        """
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+def serve(scheduler, handle, workers):
+    """
+    Runs every queued job in fair order on a pool of worker threads.
+
+    The scheduler is closed first, so the workers stop once it is drained;
+    queue all the jobs before calling this.
+
+    Args:
+        scheduler (FairScheduler): The queued jobs.
+        handle (callable): handle(tenant_id, item), run for each job.
+        workers (int): Jobs run at once.
+
+    Returns:
+        list: (tenant id, item, result, exception) per job, in the order they were served.
+    """
+    scheduler.close()
+    served = []
+    lock = threading.Lock()
+
+    def worker():
+        while True:
+            picked = scheduler.get()
+            if picked is None:
+                return
+            tenant_id, item = picked
+            with lock:
+                entry = [tenant_id, item, None, None]
+                served.append(entry)
+            try:
+                entry[2] = handle(tenant_id, item)
+            except Exception as e:
+                # One book failing doesn't hold back the others
+                entry[3] = e
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return [tuple(entry) for entry in served]
+
+
+def run_fairness_test(workers=2, job_seconds=0.05, seed=0):
+    """
+    One tenant floods the queue, two others submit a few jobs a little
+    later; compares how long the small tenants wait under fair scheduling
+    and under a single FIFO queue (what one shared queue would do).
+
+    Returns:
+        dict: "fifo" and "fair" -> tenant id -> its longest wait in seconds.
+    """
+    rng = random.Random(seed)
+    jobs = [("big", i) for i in range(40)] + [("small", i) for i in range(4)] + [("heavy", i) for i in range(4)]
+    weights = {"big": 1, "small": 1, "heavy": 2}
+
+    def simulate(fair):
+        scheduler = FairScheduler(weights) if fair else None
+        fifo = deque()
+        submitted = {}
+        waits = {}
+        lock = threading.Lock()
+
+        def worker():
+            while True:
+                if fair:
+                    picked = scheduler.get(timeout=0.5)
+                else:
+                    with lock:
+                        picked = fifo.popleft() if fifo else None
+                    if picked is None and len(waits) < len(jobs):
+                        time.sleep(0.001)
+                        continue
+                if picked is None:
+                    return
+                waits[picked] = time.perf_counter() - submitted[picked]
+                time.sleep(job_seconds * rng.uniform(0.8, 1.2))
+
+        threads = [threading.Thread(target=worker) for _ in range(workers)]
+        for job in jobs:
+            submitted[job] = time.perf_counter()
+            if fair:
+                scheduler.put(*job)
+            else:
+                with lock:
+                    fifo.append(job)
+            if job == ("big", 9):
+                for thread in threads:
+                    thread.start()
+        for thread in threads:
+            thread.join()
+        return waits
+
+    results = {}
+    for name, fair in (("fifo", False), ("fair", True)):
+        waits = simulate(fair)
+        results[name] = {
+            tenant_id: max(w for (t, _), w in waits.items() if t == tenant_id)
+            for tenant_id in weights
+        }
+    return results
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        import keys
+        tenants = load_tenants(getattr(keys, "tenants", []), default_tenant(keys.img_path))
+        for tenant in tenants.values():
+            print(f"{tenant['id']:<12} {tenant['book_title']:<30} {len(tenant['activities_list'])} chapters, "
+                  f"{len(tenant['bro_dict'])} bros, styles {tenant['content_styles']}, weight {tenant['weight']}")
+    elif len(sys.argv) > 1 and sys.argv[1] == "fairness":
+        for name, max_waits in run_fairness_test().items():
+            print(f"{name}: " + ", ".join(f"{t} max wait {w:.2f}s" for t, w in max_waits.items()))
+    else:
+        print("usage: python tenants.py check | fairness")
+        sys.exit(1)
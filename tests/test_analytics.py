@@ -0,0 +1,81 @@
+import calendar
+import math
+from contextlib import closing
+
+import pytest
+
+from analytics import bro_rates, book_editions, call_table, edition_table, monthly_cost, representation
+from usage_ledger import UsageLedger
+
+JAN = calendar.timegm((2025, 1, 10, 12, 0, 0))
+FEB = calendar.timegm((2025, 2, 10, 12, 0, 0))
+
+TENANT = {
+    "id": "test",
+    "emotions": ["glad", "sad", "mad"],
+    "bro_dict": {"a": {"name": "Al"}, "b": {"name": "Bo"}},
+    "activities_list": [
+        {"chapter_title": "Dice", "bro_list": ["a", "b"]},
+        {"chapter_title": "Solo", "bro_list": []},
+    ],
+}
+
+
+def edition(theme, chapter_number, bro=None, created=JAN, tenant="test"):
+    return {"edition_id": f"e{created}-{theme}-{bro}", "tenant": tenant, "theme": theme, "created": created,
+            "chapter_number": chapter_number, "chapter_title": TENANT["activities_list"][chapter_number - 1][
+                "chapter_title"], "content_style": 1, "bro": bro}
+
+
+@pytest.fixture
+def editions():
+    return edition_table([
+        edition("glad", 1, "Al"),
+        edition("glad", 1, "Al"),
+        edition("glad", 1, "Bo", created=FEB),
+        edition("glad", 1, "Al", created=FEB),
+        edition("sad", 2),
+        edition("sad", 2),
+        # A theme the book has since dropped
+        edition("old", 2),
+        edition("glad", 1, "Bo", tenant="john"),
+    ])
+
+
+def test_representation_against_a_uniform_draw(editions):
+    rows = representation(book_editions(editions, "test"), "theme", TENANT["emotions"])
+    assert [row[0] for row in rows] == ["old", "glad", "sad", "mad"]
+    by_label = {label: row for label, *row in rows}
+    assert by_label["old"][:2] == [1, 0.0]
+    assert math.isinf(by_label["old"][3])
+    observed, expected, ratio, z = by_label["glad"]
+    assert (observed, expected) == (4, pytest.approx(7 / 3))
+    assert ratio == pytest.approx(4 / (7 / 3))
+    assert z == pytest.approx((4 - 7 / 3) / math.sqrt(7 / 3 * (2 / 3)))
+    assert by_label["mad"][:2] == [0, pytest.approx(7 / 3)]
+
+
+def test_bro_rates_count_only_eligible_editions(editions):
+    rows = bro_rates(book_editions(editions, "test"), TENANT)
+    assert rows == [("Al", 4, 3, 0.75, 0.5), ("Bo", 4, 1, 0.25, 0.5)]
+
+
+def test_monthly_cost(tmp_path, editions):
+    ledger = UsageLedger(str(tmp_path / "usage.sqlite"))
+    with closing(ledger._connect()) as db:
+        db.executemany(
+            "INSERT INTO calls (time, day, stage, model, prompt_tokens, completion_tokens, cached_tokens, seconds) "
+            "VALUES (?, '', 'story', ?, ?, ?, 0, 1.0)",
+            [(JAN, "gpt-4.1-mini", 1_000_000, 0), (JAN, "gpt-4.1-mini", 0, 1_000_000),
+             (FEB, "gpt-4.1", 1_000_000, 0), (FEB, "mystery-model", 500, 500)])
+    calls = call_table(str(tmp_path / "usage.sqlite"))
+    assert [math.isnan(cost) for cost in calls["cost"]].count(True) == 1
+
+    jan, feb = monthly_cost(calls, editions)
+    # All editions count, whichever book they came from
+    assert jan[:5] == ("2025-01", 2, pytest.approx(2.00), 0, 6)
+    assert jan[5] == pytest.approx(2.00 / 6)
+    assert math.isnan(jan[6])
+    assert feb[:5] == ("2025-02", 2, pytest.approx(2.00), 1, 2)
+    assert feb[5] == pytest.approx(1.0)
+    assert feb[6] == pytest.approx(0.0)
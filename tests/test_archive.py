@@ -0,0 +1,20 @@
+import archive
+
+
+def test_corrupt_lines_are_skipped(tmp_path):
+    path = str(tmp_path / "editions.jsonl")
+    archive.append_edition(path, {"edition_id": "a", "story": "one"})
+    with open(path, "a") as f:
+        f.write('{"edition_id": "b", "sto\n')
+    archive.append_edition(path, {"edition_id": "c", "story": "three"})
+    assert [e["edition_id"] for e in archive.load_editions(path)] == ["a", "c"]
+
+
+def test_recent_stories_of_one_book(tmp_path):
+    path = str(tmp_path / "editions.jsonl")
+    archive.append_edition(path, {"story": "john's"})
+    archive.append_edition(path, {"story": "ringo's", "tenant": "ringo"})
+    archive.append_edition(path, {"story": "john's again", "tenant": "john"})
+    assert archive.recent_stories(path, tenant_id="john") == ["john's", "john's again"]
+    assert archive.recent_stories(path, limit=1, tenant_id="ringo") == ["ringo's"]
+    assert len(archive.recent_stories(path)) == 3
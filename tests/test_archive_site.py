@@ -0,0 +1,98 @@
+import json
+import os
+import stat
+
+import pytest
+from PIL import Image
+
+from archive_site import INDEX_NAME, STATE_NAME, build_site
+
+
+def edition(n, image=None, **changes):
+    record = {
+        "edition_id": f"2025010{n}-070000-000{n}",
+        "tenant": "john",
+        "created": 1735714800 + n * 86400,
+        "theme": "joy" if n % 2 else "grief",
+        "chapter_number": 1 + n % 2,
+        "chapter_title": "Dice" if n % 2 else "Darts",
+        "content_style": 1 + n % 3,
+        "story": f"1: John rolled {n}.",
+        "image_files": {"original": image} if image else {},
+    }
+    record.update(changes)
+    return record
+
+
+@pytest.fixture
+def site(tmp_path):
+    image = str(tmp_path / "src.png")
+    Image.new("RGB", (640, 640), (200, 120, 40)).save(image)
+    archive_path = tmp_path / "archive.jsonl"
+    archive_path.write_text("".join(json.dumps(edition(n, image)) + "\n" for n in range(1, 5)))
+    return str(archive_path), str(tmp_path / "site"), image
+
+
+def append(archive_path, record):
+    with open(archive_path, "a") as f:
+        f.write(json.dumps(record) + "\n")
+
+
+def site_files(out_dir):
+    return sorted(os.path.relpath(os.path.join(root, name), out_dir)
+                  for root, _, names in os.walk(out_dir) for name in names)
+
+
+def test_rebuild_with_nothing_new_writes_nothing(site):
+    archive_path, out_dir, _ = site
+    first = build_site(archive_path, out_dir, workers=1)
+    assert first["editions"] == 4
+    assert first["images_written"] == 8
+    mtimes = {path: os.stat(os.path.join(out_dir, path)).st_mtime_ns for path in site_files(out_dir)}
+
+    again = build_site(archive_path, out_dir, workers=1)
+    assert (again["pages_rendered"], again["images_written"], again["pages_skipped"]) == (
+        0, 0, first["pages_rendered"])
+    assert {path: os.stat(os.path.join(out_dir, path)).st_mtime_ns for path in site_files(out_dir)} == mtimes
+
+
+def test_one_append_only_renders_the_pages_it_is_on(site):
+    archive_path, out_dir, image = site
+    build_site(archive_path, out_dir, workers=1)
+    before = site_files(out_dir)
+
+    append(archive_path, edition(5, image))
+    stats = build_site(archive_path, out_dir, workers=1)
+    # Its edition page, its chapter, theme and style pages, the book page and the index
+    assert stats["pages_rendered"] == 6
+    assert stats["images_written"] == 2
+    assert sorted(set(site_files(out_dir)) - set(before)) == [
+        "images/20250105-070000-0005.png", "john/editions/20250105-070000-0005.html",
+        "thumbs/20250105-070000-0005.jpg"]
+    assert "20250105-070000-0005" in open(os.path.join(out_dir, "john", "chapter-2.html")).read()
+
+    # The incremental result is what a full build makes
+    incremental = {path: open(os.path.join(out_dir, path), "rb").read()
+                   for path in site_files(out_dir) if path.endswith(".html")}
+    full_dir = out_dir + "-full"
+    build_site(archive_path, full_dir, workers=1, full=True)
+    assert {path: open(os.path.join(full_dir, path), "rb").read()
+            for path in site_files(full_dir) if path.endswith(".html")} == incremental
+
+
+def test_pages_are_replaced_whole_and_readable(site):
+    archive_path, out_dir, _ = site
+    build_site(archive_path, out_dir, workers=1)
+    files = site_files(out_dir)
+    assert not [path for path in files if path.endswith(".tmp")]
+    assert {STATE_NAME, INDEX_NAME, "style.css", "index.html"} <= set(files)
+    for path in files:
+        mode = stat.S_IMODE(os.stat(os.path.join(out_dir, path)).st_mode)
+        assert mode & 0o044, path
+
+    # A page open in a reader keeps its old content; the rebuild swaps in a new file
+    with open(os.path.join(out_dir, "john", "index.html")) as reader:
+        append(archive_path, edition(6))
+        build_site(archive_path, out_dir, workers=1)
+        assert "20250106-070000-0006" not in reader.read()
+    assert "20250106-070000-0006" in open(os.path.join(out_dir, "john", "index.html")).read()
@@ -0,0 +1,43 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image
+
+from atlas import MANIFEST_NAME, build_atlas
+
+
+def portraits(directory, names, color=(200, 100, 50)):
+    directory.mkdir(exist_ok=True)
+    for name in names:
+        Image.new("RGB", (64, 64), color).save(directory / f"{name}.png")
+    return str(directory)
+
+
+def test_only_changed_pairings_are_recomposed(tmp_path, capsys):
+    portrait_dir = portraits(tmp_path / "portraits", ["John", "JP", "Bilinski"])
+    atlas_dir = str(tmp_path / "atlas")
+
+    sheets = build_atlas(portrait_dir, atlas_dir, ["JP", "Bilinski"])
+    assert capsys.readouterr().out.count("composing") == 2
+    with Image.open(sheets["JP"]) as sheet:
+        assert sheet.format == "PNG"
+
+    build_atlas(portrait_dir, atlas_dir, ["JP", "Bilinski"])
+    assert "composing" not in capsys.readouterr().out
+
+    Image.new("RGB", (64, 64), (0, 0, 255)).save(os.path.join(portrait_dir, "JP.png"))
+    build_atlas(portrait_dir, atlas_dir, ["JP", "Bilinski"])
+    assert capsys.readouterr().out.strip() == "composing John+JP"
+    assert not [f for f in os.listdir(atlas_dir) if f.endswith(".tmp")]
+
+
+def test_concurrent_builds_keep_every_entry(tmp_path):
+    names = ["JP", "Bilinski", "Dave", "Ringo"]
+    portrait_dir = portraits(tmp_path / "portraits", ["John"] + names)
+    atlas_dir = str(tmp_path / "atlas")
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        list(pool.map(build_atlas, [portrait_dir] * 4, [atlas_dir] * 4, [[name] for name in names]))
+
+    with open(os.path.join(atlas_dir, MANIFEST_NAME)) as f:
+        assert sorted(json.load(f)) == sorted(names)
@@ -0,0 +1,55 @@
+import json
+import os
+
+from backfill import edition_dir, is_done, plan_space, run_backfill, save_checkpoint
+
+
+def fake_edition(out_dir, activity_number, content_style):
+    # Runs in a worker process; fails the editions listed in out_dir/fail
+    with open(os.path.join(out_dir, "ran"), "a") as f:
+        f.write(f"{activity_number}-{content_style}\n")
+    with open(os.path.join(out_dir, "fail")) as f:
+        if f"{activity_number}-{content_style}" in f.read().split():
+            raise RuntimeError("image refused")
+    os.makedirs(edition_dir(out_dir, activity_number, content_style), exist_ok=True)
+    save_checkpoint(out_dir, activity_number, content_style, {"chapter_number": activity_number + 1})
+    return 0.0
+
+
+def ran(out_dir):
+    with open(os.path.join(out_dir, "ran")) as f:
+        lines = f.read().split()
+    os.remove(os.path.join(out_dir, "ran"))
+    return lines
+
+
+def test_resume_runs_only_what_is_not_checkpointed(tmp_path):
+    out_dir = str(tmp_path)
+    total = len(plan_space())
+    (tmp_path / "fail").write_text("0-1 2-3")
+
+    assert run_backfill(out_dir, workers=2, edition_runner=fake_edition) == {
+        "skipped": 0, "done": total - 2, "failed": 2}
+    assert len(ran(out_dir)) == total
+    assert not is_done(out_dir, 0, 1)
+    assert is_done(out_dir, 0, 2)
+
+    # The failures are retried, and nothing else
+    (tmp_path / "fail").write_text("")
+    assert run_backfill(out_dir, workers=2, edition_runner=fake_edition) == {
+        "skipped": total - 2, "done": 2, "failed": 0}
+    assert sorted(ran(out_dir)) == ["0-1", "2-3"]
+
+    assert run_backfill(out_dir, workers=2, edition_runner=fake_edition) == {
+        "skipped": total, "done": 0, "failed": 0}
+    assert not os.path.exists(tmp_path / "ran")
+
+
+def test_checkpoint_is_written_whole(tmp_path):
+    work_dir = edition_dir(str(tmp_path), 4, 2)
+    assert work_dir == os.path.join(str(tmp_path), "chapter-05", "style-2")
+    os.makedirs(work_dir)
+    save_checkpoint(str(tmp_path), 4, 2, {"story": "1: John won."})
+    assert os.listdir(work_dir) == ["edition.json"]
+    with open(os.path.join(work_dir, "edition.json")) as f:
+        assert json.load(f) == {"story": "1: John won."}
@@ -0,0 +1,36 @@
+import random
+
+import pytest
+
+from tenants import default_tenant
+
+# boj2 reads its settings from keys.py on import
+boj2 = pytest.importorskip("boj2", reason="boj2 needs a keys.py")
+
+
+@pytest.fixture
+def tenant():
+    # Bro keys that differ from the bros' names, and only some of the styles
+    base = default_tenant()
+    bro_dict = {f"bro-{key}": bro for key, bro in base["bro_dict"].items()}
+    activities = [dict(a, bro_list=[f"bro-{b}" for b in a["bro_list"] or []]) for a in base["activities_list"]]
+    return dict(base, id="test", bro_dict=bro_dict, activities_list=activities, content_styles=[1, 3, 5])
+
+
+def test_digest_plans_every_style_on_one_theme_activity_and_bro(tenant):
+    for seed in range(20):
+        plans = boj2.plan_digest(random.Random(seed), tenant)
+        assert sorted(plans) == [1, 3, 5]
+        shared = {(p["theme"], p["activity_number"], p["bro_key"]) for p in plans.values()}
+        assert len(shared) == 1
+        bro_key = plans[1]["bro_key"]
+        assert all(p["bro"] is (tenant["bro_dict"][bro_key] if bro_key else None) for p in plans.values())
+        assert len({p["edition_id"] for p in plans.values()}) == 3
+        assert plans[1]["number_verses"] and plans[3]["number_verses"] is None
+
+
+def test_digest_image_style(monkeypatch):
+    monkeypatch.setattr(boj2, "DIGEST_IMAGE_STYLE", 3)
+    assert boj2.digest_image_style({1: {}, 3: {}, 5: {}}) == 3
+    # A book without that style draws from its first one
+    assert boj2.digest_image_style({5: {}, 6: {}}) == 5
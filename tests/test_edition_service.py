@@ -0,0 +1,111 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from edition_service import EditionService, make_server, parse_overrides
+from tenants import default_tenant, load_tenants
+
+
+class BlockingRun:
+    """
+    A pipeline that holds every run until released.
+    """
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = []
+        self.caches = []
+
+    def __call__(self, overrides, recipe_cache=None):
+        self.started.append(overrides)
+        self.caches.append(recipe_cache)
+        self.release.wait(10)
+        return {"overrides": overrides}
+
+
+@pytest.fixture
+def service():
+    run = BlockingRun()
+    service = EditionService(run, workers=1, queue_limit=2, recipe_cache="shared cache")
+    server = make_server(service, port=0)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    service.base = f"http://127.0.0.1:{server.server_port}"
+    service.pipeline = run
+    yield service
+    run.release.set()
+    server.shutdown()
+
+
+def post(service, body):
+    request = urllib.request.Request(f"{service.base}/editions", data=json.dumps(body).encode(),
+                                     headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(request) as response:
+            return response.status, json.load(response)
+    except urllib.error.HTTPError as e:
+        return e.code, json.load(e)
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        time.sleep(0.01)
+
+
+def test_overflow_is_refused_with_429(service):
+    assert post(service, {"activity": 1})[0] == 202
+    wait_for(lambda: len(service.pipeline.started) == 1)
+
+    assert post(service, {"activity": 2})[0] == 202
+    assert post(service, {"activity": 3})[0] == 202
+    status, body = post(service, {"activity": 4})
+    assert status == 429
+    assert service.stats["rejected"] == 1
+
+    service.pipeline.release.set()
+    wait_for(lambda: len(service.pipeline.started) == 3)
+
+
+def test_duplicate_requests_are_coalesced(service):
+    status, first = post(service, {"style": 2, "theme": "joy"})
+    assert status == 202 and not first["coalesced"]
+    status, second = post(service, {"theme": "joy", "style": 2})
+    assert status == 202 and second["coalesced"]
+    assert second["id"] == first["id"]
+
+    service.pipeline.release.set()
+    wait_for(lambda: service.get(first["id"])["status"] == "done")
+    assert service.stats["runs"] == 1
+    assert len(service.pipeline.started) == 1
+
+    # Once finished, the same request starts a new run
+    status, third = post(service, {"style": 2, "theme": "joy"})
+    assert status == 202 and not third["coalesced"]
+
+
+def test_workers_share_the_service_recipe_cache(service):
+    service.pipeline.release.set()
+    post(service, {"activity": 1})
+    post(service, {"activity": 2})
+    wait_for(lambda: len(service.pipeline.caches) == 2)
+    assert service.pipeline.caches == ["shared cache", "shared cache"]
+
+
+@pytest.mark.parametrize("body", [{"activity": True}, {"style": True}, {"activity": 0}, {"style": 9},
+                                  {"style": 2.0}, {"activity": 1.0}, {"activity": "1"},
+                                  {"theme": "not a theme"}, {"tenant": "nobody"}, ["style", 1]])
+def test_invalid_overrides_are_rejected(body):
+    with pytest.raises(ValueError):
+        parse_overrides(body, load_tenants([], default_tenant()))
+
+
+@pytest.mark.parametrize("body", [{"activity": True}, {"style": 2.0}])
+def test_bad_request_gets_400(service, body):
+    status, _ = post(service, body)
+    assert status == 400
+    assert service.stats["runs"] == 0
@@ -0,0 +1,25 @@
+from image_policy import DOWNSTREAM_RESERVE, TIERS, choose_image_settings, image_latencies
+
+
+def test_default_budget_keeps_the_default_image():
+    # What a normal run has left when it gets to the image
+    settings = choose_image_settings(150, {})
+    assert (settings["size"], settings["quality"]) == ("1024x1024", "auto")
+
+
+def test_quality_degrades_with_the_budget():
+    tight = choose_image_settings(DOWNSTREAM_RESERVE + 50, {})
+    assert (tight["size"], tight["quality"]) == ("1024x1024", "medium")
+    nothing_fits = choose_image_settings(DOWNSTREAM_RESERVE + 5, {})
+    assert (nothing_fits["size"], nothing_fits["quality"]) == (TIERS[-1]["size"], TIERS[-1]["quality"])
+
+
+def test_observed_latencies_are_kept_per_size():
+    traces = [{"spans": [{"stage": "image", "quality": "auto", "size": "1536x1024", "seconds": 200.0},
+                         {"stage": "image", "quality": "auto", "seconds": 30.0}]}] * 5
+    latencies = image_latencies(traces)
+    assert latencies[("1536x1024", "auto")] == [200.0] * 5
+    assert latencies[("1024x1024", "auto")] == [30.0] * 5
+
+    settings = choose_image_settings(DOWNSTREAM_RESERVE + 35, latencies)
+    assert (settings["size"], settings["quality"]) == ("1024x1024", "auto")
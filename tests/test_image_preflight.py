@@ -0,0 +1,67 @@
+import pytest
+
+from catalog import activities_list
+from image_preflight import REWRITE_THRESHOLD, check_image_prompt, labelled_prompts, rewrite_locally, rule_score
+
+
+@pytest.mark.parametrize("activity", [a["activity"] for a in activities_list])
+def test_catalog_activities_are_never_skipped(activity):
+    result = check_image_prompt(f"John {activity} with his bro, in a watercolor style.")
+    assert not result["skip"]
+    assert result["final_score"] < REWRITE_THRESHOLD
+
+
+@pytest.mark.parametrize("text", [
+    "John at a photo shoot, buttoning his shirt",
+    "John drives to the lake and mixes a cocktail with his bro.",
+    "a blood orange margarita with a salted rim",
+    "a dirty martini, extra olives",
+    "a Bloody Mary with a celery stalk",
+    "John and his bro crack open a cold one",
+    "a killer sidecar and a round of butterscotch shooters",
+    "hot buttered rum next to the smoker",
+    "John is killing it at karaoke",
+    "a smoky mezcal negroni at the burger joint",
+])
+def test_ordinary_drink_words_pass(text):
+    score, categories = rule_score(text)
+    assert score == 0, categories
+    assert rewrite_locally(text) == text
+
+
+@pytest.mark.parametrize("text, category", [
+    ("John drinking and driving with his bro", "impaired driving"),
+    ("John drunk behind the wheel", "impaired driving"),
+    ("John smoking weed with his bro", "drugs"),
+    ("John wiping a crack in the wrong direction", "crude"),
+    ("John shooting at his bro with a rifle", "violence"),
+])
+def test_risky_prompts_are_flagged(text, category):
+    _, categories = rule_score(text)
+    assert category in categories
+
+
+def test_skip_needs_a_rewrite_attempt():
+    prompt = "John modelling lingerie with his bro"
+    unrewritten = check_image_prompt(prompt)
+    assert unrewritten["score"] >= REWRITE_THRESHOLD
+    assert unrewritten["rewrites"] == []
+    assert not unrewritten["skip"]
+
+    stubborn = check_image_prompt(prompt, rewrite=lambda text: text)
+    assert stubborn["rewrites"] == ["model"]
+    assert stubborn["skip"]
+
+
+def test_local_rewrite_fixes_the_catalog_risks():
+    result = check_image_prompt("John drinking and driving with his bro.")
+    assert result["rewrites"] == ["local"]
+    assert result["final_score"] < REWRITE_THRESHOLD
+    assert not result["skip"]
+
+
+def test_digest_image_is_labelled_once():
+    digest = [{"edition_id": f"e{i}", "digest_id": "e0", "dalle_prompt": "John at the bar",
+               "image_refused": i == 0} for i in range(6)]
+    single = {"edition_id": "e9", "dalle_prompt": "John at the track", "image_refused": False}
+    assert labelled_prompts(digest + [single]) == (["John at the bar", "John at the track"], [True, False])
@@ -0,0 +1,61 @@
+import io
+
+import numpy as np
+from PIL import Image, ImageFilter
+
+from image_scoring import hash_distance, image_hash, perceptual_hash, pick_best_image, score_image
+
+
+def scene(seed=0, size=256):
+    """A busy, sharp test image: random coloured blocks."""
+    rng = np.random.default_rng(seed)
+    blocks = rng.integers(0, 256, (16, 16, 3), dtype=np.uint8)
+    return Image.fromarray(blocks).resize((size, size), Image.NEAREST)
+
+
+def encode(image):
+    buffer = io.BytesIO()
+    image.save(buffer, "PNG")
+    return buffer.getvalue()
+
+
+def test_blank_image_scores_zero():
+    score, parts = score_image(Image.new("RGB", (128, 128), (240, 240, 240)))
+    assert score == 0.0
+    assert parts["blank"]
+
+
+def test_sharp_image_beats_blurred_copy():
+    image = scene()
+    sharp, sharp_parts = score_image(image)
+    blurred, blurred_parts = score_image(image.filter(ImageFilter.GaussianBlur(8)))
+    assert sharp_parts["sharpness"] > blurred_parts["sharpness"]
+    assert sharp > blurred
+
+
+def test_hash_survives_rescaling_but_not_a_new_scene():
+    image = scene()
+    same = perceptual_hash(image.resize((100, 100)))
+    assert hash_distance(perceptual_hash(image), same) <= 4
+    assert hash_distance(perceptual_hash(image), perceptual_hash(scene(1))) > 20
+    assert len(perceptual_hash(image)) == 16
+
+
+def test_near_duplicate_of_a_recent_image_loses_its_novelty():
+    image = scene()
+    recent = [perceptual_hash(image)]
+    _, repeat = score_image(image.resize((200, 200)), recent)
+    _, fresh = score_image(scene(1), recent)
+    assert repeat["novelty"] < 0.25
+    assert fresh["novelty"] == 1.0
+
+
+def test_pick_best_image_skips_blank_and_repeated(tmp_path):
+    image = scene()
+    image.save(tmp_path / "recent.png")
+    recent = [image_hash(tmp_path / "recent.png")]
+    candidates = [encode(Image.new("RGB", (256, 256), (0, 0, 0))), encode(image), encode(scene(2))]
+    best, scores = pick_best_image(candidates, recent)
+    assert best == 2
+    assert len(scores) == 3
+    assert all("score_ms" in parts for _, parts in scores)
@@ -0,0 +1,81 @@
+import os
+import stat
+import threading
+
+import pytest
+
+from image_store import ImageStore, ImgurPublisher, LocalHTTPPublisher, PublishError
+
+
+class CountingPublisher(LocalHTTPPublisher):
+    def __init__(self, serve_dir):
+        super().__init__(serve_dir, "http://img.local/")
+        self.uploads = []
+
+    def upload(self, path, sha):
+        self.uploads.append(sha)
+        return super().upload(path, sha)
+
+
+def image(tmp_path, name, data):
+    path = tmp_path / name
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_identical_images_are_stored_once(tmp_path):
+    store = ImageStore(str(tmp_path / "store"))
+    first = store.put(image(tmp_path, "a.png", b"same bytes"))
+    second = store.put(image(tmp_path, "b.png", b"same bytes"))
+    other = store.put(image(tmp_path, "c.png", b"other bytes"))
+    assert first == second != other
+    assert len(store.index["objects"]) == 2
+
+    store.record_edition("e1", first)
+    assert ImageStore(str(tmp_path / "store")).edition_sha("e1") == first
+    with open(store.path_for(first), "rb") as f:
+        assert f.read() == b"same bytes"
+
+
+def test_concurrent_publishes_upload_once(tmp_path):
+    root = str(tmp_path / "store")
+    sha = ImageStore(root).put(image(tmp_path, "a.png", b"bytes"))
+    publisher = CountingPublisher(str(tmp_path / "serve"))
+    barrier = threading.Barrier(4)
+    urls = []
+
+    def publish():
+        store = ImageStore(root)
+        barrier.wait()
+        urls.append(store.publish(sha, publisher))
+
+    threads = [threading.Thread(target=publish) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert publisher.uploads == [sha]
+    assert urls == [f"http://img.local/{sha}.png"] * 4
+    assert ImageStore(root).publish(sha, publisher) == urls[0]
+    assert publisher.uploads == [sha]
+
+
+def uploader(tmp_path, script):
+    path = tmp_path / "imgur-uploader"
+    path.write_text("#!/bin/sh\n" + script)
+    path.chmod(path.stat().st_mode | stat.S_IEXEC)
+    return str(path)
+
+
+def test_imgur_url_is_parsed_from_the_output(tmp_path):
+    publisher = ImgurPublisher(uploader(tmp_path, 'echo "Uploading..."\necho "Done: https://i.imgur.com/AbCd123.png"\n'))
+    assert publisher.upload("boj.png") == "https://i.imgur.com/AbCd123.png"
+
+
+def test_failed_imgur_upload_raises_a_clear_error(tmp_path):
+    publisher = ImgurPublisher(uploader(tmp_path, 'echo "rate limited" >&2\nexit 1\n'))
+    with pytest.raises(PublishError, match="rate limited"):
+        publisher.upload("boj.png")
+    with pytest.raises(PublishError):
+        ImgurPublisher(os.path.join(str(tmp_path), "missing")).upload("boj.png")
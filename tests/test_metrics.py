@@ -0,0 +1,67 @@
+import urllib.error
+import urllib.request
+
+import pytest
+
+from metrics import Counter, Gauge, Histogram, Registry, start_metrics_server
+
+
+@pytest.fixture
+def registry():
+    return Registry()
+
+
+def test_counter_and_gauge_render(registry):
+    retries = Counter("boj_retries_total", "Calls retried.", ["kind"], registry=registry)
+    depth = Gauge("boj_queue_depth", "Items waiting.", ["queue"], registry=registry)
+    retries.inc("openai")
+    retries.inc("openai", amount=2)
+    retries.inc('sl"ack')
+    depth.set("outbox", value=4)
+    depth.dec("outbox")
+    assert registry.render() == (
+        "# HELP boj_retries_total Calls retried.\n"
+        "# TYPE boj_retries_total counter\n"
+        'boj_retries_total{kind="openai"} 3\n'
+        'boj_retries_total{kind="sl\\"ack"} 1\n'
+        "# HELP boj_queue_depth Items waiting.\n"
+        "# TYPE boj_queue_depth gauge\n"
+        'boj_queue_depth{queue="outbox"} 3\n'
+    )
+
+
+def test_histogram_buckets_are_cumulative(registry):
+    seconds = Histogram("boj_stage_seconds", "Stage time.", ["stage"], buckets=(1, 5), registry=registry)
+    for value in (0.5, 2.0, 30.0):
+        seconds.observe("image", value=value)
+    lines = registry.render().splitlines()
+    assert lines[2:] == [
+        'boj_stage_seconds_bucket{stage="image",le="1"} 1',
+        'boj_stage_seconds_bucket{stage="image",le="5"} 2',
+        'boj_stage_seconds_bucket{stage="image",le="+Inf"} 3',
+        'boj_stage_seconds_sum{stage="image"} 32.5',
+        'boj_stage_seconds_count{stage="image"} 3',
+    ]
+
+
+def test_counter_rejects_bad_use(registry):
+    tokens = Counter("boj_tokens_total", "Tokens used.", ["stage", "kind"], registry=registry)
+    with pytest.raises(ValueError):
+        tokens.inc("story")
+    with pytest.raises(ValueError):
+        tokens.inc("story", "input", amount=-1)
+
+
+def test_server_serves_the_registry(registry):
+    Counter("boj_errors_total", "Stages that raised.", ["stage"], registry=registry).inc("story")
+    server = start_metrics_server(0, registry=registry)
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics", timeout=5) as response:
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+            assert response.read().decode() == registry.render()
+        with pytest.raises(urllib.error.HTTPError) as e:
+            urllib.request.urlopen(f"{base}/other", timeout=5)
+        assert e.value.code == 404
+    finally:
+        server.shutdown()
@@ -0,0 +1,58 @@
+import random
+
+from model_router import (MIN_OBSERVATIONS, STAGE_CANDIDATES, ModelRouter, choose_model, load_log,
+                          rotate_log)
+
+BUDGETS = {"story": 30.0}
+CANDIDATES = {"story": ["mini", "big", "tiny"]}
+
+
+def outcomes(seconds, cost, errors=0):
+    return [{"seconds": seconds, "cost": cost, "error": "boom" if i < errors else None}
+            for i in range(MIN_OBSERVATIONS)]
+
+
+def test_story_never_routes_to_nano():
+    assert "gpt-4.1-nano" not in STAGE_CANDIDATES["story"]
+
+
+def test_default_until_observed():
+    assert choose_model("story", {}, CANDIDATES, BUDGETS) == ("mini", "default")
+
+
+def test_cheapest_model_within_budget():
+    stats = {"mini": outcomes(10, 0.002), "big": outcomes(12, 0.01), "tiny": outcomes(40, 0.0005)}
+    assert choose_model("story", stats, CANDIDATES, BUDGETS) == ("mini", "cheapest_within_budget")
+
+
+def test_failing_model_is_skipped():
+    stats = {"mini": outcomes(10, 0.002, errors=2), "big": outcomes(12, 0.01)}
+    assert choose_model("story", stats, CANDIDATES, BUDGETS) == ("big", "cheapest_within_budget")
+
+
+def test_fastest_when_nothing_fits():
+    stats = {"mini": outcomes(50, 0.002), "big": outcomes(40, 0.01)}
+    assert choose_model("story", stats, CANDIDATES, BUDGETS) == ("big", "fastest_over_budget")
+
+
+def test_exploration_picks_the_least_observed(tmp_path):
+    router = ModelRouter(str(tmp_path / "log.jsonl"), CANDIDATES, BUDGETS, rng=random.Random(0))
+    for _ in range(MIN_OBSERVATIONS):
+        router.record("story", "mini", 10)
+        router.record("story", "big", 12)
+    router.rng.random = lambda: 0.0
+    assert router.choose("story") == "tiny"
+    router.rng.random = lambda: 1.0
+    assert router.choose("story") == "mini"
+
+
+def test_log_is_rotated_and_still_read(tmp_path):
+    path = str(tmp_path / "log.jsonl")
+    router = ModelRouter(path, CANDIDATES, BUDGETS)
+    router.record("story", "big", 12)
+    rotate_log(path, max_bytes=10)
+    assert load_log(path) == []
+    assert len(load_log(path + ".1")) == 1
+
+    router = ModelRouter(path, CANDIDATES, BUDGETS)
+    assert len(router.stats("story")["big"]) == 1
@@ -0,0 +1,24 @@
+import os
+
+from offline_story import MIN_STORIES, MarkovModel
+
+
+def editions(story, count, **extra):
+    return [dict({"content_style": 4, "story": story}, **extra) for _ in range(count)]
+
+
+def test_fallback_editions_are_not_trained_on():
+    written = editions("John poured a drink. He rolled the dice.", MIN_STORIES)
+    offline = editions("The bro ate a sandwich.", MIN_STORIES,
+                       validation={"problems": [], "missing": 0, "fallback": "story API degraded"})
+    model = MarkovModel.train(written + offline)
+    assert "dice" in model.vocab
+    assert "sandwich" not in model.vocab
+
+
+def test_saved_model_loads_back(tmp_path):
+    model = MarkovModel.train(editions("John poured a drink. He rolled the dice.", MIN_STORIES))
+    path = str(tmp_path / "markov.npz")
+    model.save(path)
+    assert MarkovModel.load(path).vocab == model.vocab
+    assert os.listdir(tmp_path) == ["markov.npz"]
@@ -0,0 +1,165 @@
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import outbox
+from outbox import Outbox, RateLimiter, RetryableError, run_fanout_benchmark, slack_webhook_send
+
+PAYLOAD = {"text": "edition", "blocks": []}
+
+
+class FlakyWebhook(BaseHTTPRequestHandler):
+    """
+    Webhook stub that fails a share of requests with 429 or 5xx.
+    """
+
+    failure_rate = 0.5
+    received = []
+    rng = random.Random(0)
+    lock = threading.Lock()
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.lock:
+            fail = self.rng.random() < self.failure_rate
+            if not fail:
+                self.received.append(json.loads(body)["text"])
+        self.send_response(self.rng.choice([429, 500, 503]) if fail else 200)
+        self.end_headers()
+        self.wfile.write(b"try again" if fail else b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def webhook():
+    FlakyWebhook.received = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FlakyWebhook)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/hook"
+    server.shutdown()
+
+
+@pytest.fixture
+def box(tmp_path):
+    return Outbox(str(tmp_path / "outbox.sqlite"))
+
+
+def message(box, key):
+    return next(m for m in box._connect().execute("SELECT * FROM messages WHERE idempotency_key = ?", (key,)))
+
+
+def failing(times, error=RetryableError):
+    calls = []
+
+    def send(destination, payload):
+        calls.append(time.time())
+        if len(calls) <= times:
+            raise error("boom")
+    send.calls = calls
+    return send
+
+
+def test_retries_back_off_exponentially(box, monkeypatch):
+    monkeypatch.setattr(outbox, "BASE_DELAY", 10.0)
+    box.enqueue("hook", PAYLOAD, "e1:a")
+    send = failing(2)
+
+    before = time.time()
+    assert box.deliver_pending(send) == [("e1:a", "pending", "boom")]
+    first = message(box, "e1:a")
+    assert first["attempts"] == 1
+    assert 8.0 <= first["next_attempt"] - before <= 12.5
+
+    # Not due yet, so nothing is tried
+    assert box.deliver_pending(send) == []
+
+    box._connect().execute("UPDATE messages SET next_attempt = 0")
+    before = time.time()
+    box.deliver_pending(send)
+    second = message(box, "e1:a")
+    assert second["attempts"] == 2
+    assert 16.0 <= second["next_attempt"] - before <= 24.5
+
+    box._connect().execute("UPDATE messages SET next_attempt = 0")
+    assert box.deliver_pending(send) == [("e1:a", "delivered", None)]
+    assert len(send.calls) == 3
+
+
+def test_expired_lease_is_retried(box, monkeypatch):
+    monkeypatch.setattr(outbox, "CLAIM_LEASE", 0.2)
+    box.enqueue("hook", PAYLOAD, "e1:a")
+
+    # A worker claims the message and dies before recording the outcome
+    assert len(box._claim(10)) == 1
+    send = failing(0)
+    assert box.deliver_pending(send) == []
+
+    time.sleep(0.25)
+    assert box.deliver_pending(send) == [("e1:a", "delivered", None)]
+
+
+def test_dead_letters_and_requeue(box, monkeypatch):
+    monkeypatch.setattr(outbox, "BASE_DELAY", 0.0)
+    monkeypatch.setattr(outbox, "MAX_ATTEMPTS", 3)
+    box.enqueue("hook", PAYLOAD, "e1:permanent")
+    box.enqueue("other", PAYLOAD, "e1:flaky")
+
+    def send(destination, payload):
+        if destination == "hook":
+            raise ValueError("invalid_blocks")
+        raise RetryableError("503")
+
+    assert sorted(box.deliver_pending(send)) == [("e1:flaky", "pending", "503"), ("e1:permanent", "dead", "invalid_blocks")]
+    box.deliver_pending(send)
+    assert box.deliver_pending(send) == [("e1:flaky", "dead", "503")]
+    assert box.pending_count() == 0
+    dead = {m["idempotency_key"]: m for m in box.dead_letters()}
+    assert dead["e1:flaky"]["attempts"] == 3
+    assert dead["e1:permanent"]["attempts"] == 1
+
+    box.requeue(dead["e1:flaky"]["id"])
+    assert box.deliver_pending(failing(0)) == [("e1:flaky", "delivered", None)]
+
+
+def test_flaky_webhook_gets_each_message_exactly_once(box, webhook, monkeypatch):
+    monkeypatch.setattr(outbox, "BASE_DELAY", 0.01)
+    monkeypatch.setattr(outbox, "MAX_ATTEMPTS", 100)
+    for i in range(20):
+        assert box.enqueue(webhook, {"text": f"message {i}", "blocks": []}, f"m{i}")
+        assert not box.enqueue(webhook, {"text": f"message {i}", "blocks": []}, f"m{i}")
+
+    # Two workers racing over the same queue
+    limiter = RateLimiter(default_rate=60000)
+    workers = [threading.Thread(target=box.run_worker,
+                                kwargs={"send": slack_webhook_send, "poll_interval": 0.01, "rate_limiter": limiter})
+               for _ in range(2)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(30)
+
+    assert sorted(FlakyWebhook.received) == sorted(f"message {i}" for i in range(20))
+    assert box.dead_letters() == []
+
+
+def test_queued_rate_limit_is_honoured_without_a_limiter(box):
+    for i in range(3):
+        box.enqueue("hook", PAYLOAD, f"e{i}:a", rate_per_minute=300)
+
+    start = time.monotonic()
+    results = box.deliver_pending(failing(0))
+    assert [status for _, status, _ in results] == ["delivered"] * 3
+    assert time.monotonic() - start >= 0.35
+
+
+def test_fanout_takes_about_one_round_trip(tmp_path):
+    # 20 destinations at 200 ms each would take 4 s one after another
+    stats = run_fanout_benchmark(str(tmp_path / "outbox.sqlite"), destinations=20)
+    assert stats["delivered"] == 20
+    assert stats["seconds"] < 5 * outbox._SlowWebhookHandler.latency
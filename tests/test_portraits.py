@@ -0,0 +1,31 @@
+import os
+
+from PIL import Image
+
+from portraits import DETAIL_SIZES, prepare_portrait
+
+
+def test_variant_is_reused_until_the_portrait_changes(tmp_path):
+    source = str(tmp_path / "John.png")
+    cache_dir = str(tmp_path / "cache")
+    Image.new("RGBA", (2048, 2048), (200, 100, 50, 255)).save(source)
+
+    variant = prepare_portrait(source, cache_dir, "low")
+    with Image.open(variant) as image:
+        assert max(image.size) == DETAIL_SIZES["low"]
+    modified = os.path.getmtime(variant)
+    assert prepare_portrait(source, cache_dir, "low") == variant
+    assert os.path.getmtime(variant) == modified
+
+    Image.new("RGBA", (2048, 2048), (0, 0, 255, 255)).save(source)
+    changed = prepare_portrait(source, cache_dir, "low")
+    assert changed != variant
+    assert os.listdir(cache_dir) == [os.path.basename(changed)]
+
+
+def test_pair_sheet_keeps_each_face_at_portrait_size(tmp_path):
+    sheet = str(tmp_path / "John+JP.png")
+    Image.new("RGB", (2048, 1088), (255, 255, 255)).save(sheet)
+    for detail, size in DETAIL_SIZES.items():
+        with Image.open(prepare_portrait(sheet, str(tmp_path / "cache"), detail, panels=2)) as image:
+            assert image.width // 2 == size
@@ -0,0 +1,51 @@
+import os
+import pstats
+import threading
+import time
+
+from profiling import RunProfiler
+
+
+def spin(seconds):
+    end = time.thread_time() + seconds
+    while time.thread_time() < end:
+        pass
+
+
+def test_stage_report_splits_cpu_from_wait(tmp_path):
+    profiler = RunProfiler(str(tmp_path / "profile"))
+    profiler.start()
+    with profiler.stage("story") as story:
+        spin(0.1)
+        # Nested stages are timed but share the outer stage's cProfile
+        with profiler.stage("repair"):
+            spin(0.02)
+
+    def render():
+        with profiler.stage("image"):
+            time.sleep(0.3)
+
+    worker = threading.Thread(target=render)
+    worker.start()
+    worker.join()
+    summary = profiler.stop({"import seconds": "0.50"})
+
+    assert story["cpu_seconds"] >= 0.1
+    assert story["wait_seconds"] < story["cpu_seconds"]
+    assert profiler.stages["story"]["calls"] == profiler.stages["repair"]["calls"] == 1
+    assert profiler.stages["image"]["wall"] >= 0.3
+    assert profiler.stages["image"]["cpu"] < 0.05
+
+    out_dir = tmp_path / "profile"
+    assert sorted(os.listdir(out_dir)) == ["memory.txt", "run.prof", "stacks.txt", "stage-image.prof",
+                                           "stage-story.prof", "summary.txt"]
+    assert "spin" in {func[2] for func in pstats.Stats(str(out_dir / "stage-story.prof")).stats}
+    assert (out_dir / "summary.txt").read_text() == summary
+
+    lines = summary.splitlines()
+    assert "import seconds: 0.50" in lines
+    # Stages are listed slowest first
+    header = lines.index("stage            calls    wall s     cpu s    wait s   peak MB")
+    assert [line.split()[0] for line in lines[header + 1:header + 4]] == ["image", "story", "repair"]
+    assert all(line.rsplit(" ", 1)[0].split(";")[0] in ("story", "repair", "image", "(no stage)")
+               for line in (out_dir / "stacks.txt").read_text().splitlines())
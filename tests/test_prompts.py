@@ -0,0 +1,47 @@
+import json
+
+import pytest
+
+from prompts import (HOUSE_STYLE_GUIDE, PROVIDER_CACHE_MIN_TOKENS, cast, stage_builders, story_messages, story_plan,
+                     style_guide_message)
+
+PLANS = [
+    {"theme": "zzqxtheme", "activity": "zzqxactivity", "bro": " with his bro Zzqxbro", "verses": 997, "start": 9931},
+    {"theme": "wwkvtheme", "activity": "wwkvactivity", "bro": "", "verses": 3, "start": 1},
+]
+
+
+@pytest.mark.parametrize("name", sorted(stage_builders()))
+def test_prefix_is_the_same_for_every_plan(name):
+    build = stage_builders()[name]
+    first, second = (build(plan) for plan in PLANS)
+    assert first[:-1] == second[:-1]
+
+
+@pytest.mark.parametrize("name", sorted(stage_builders()))
+def test_plan_values_stay_out_of_the_prefix(name):
+    prefix = json.dumps(stage_builders()[name](PLANS[0])[:-1])
+    for value in ("zzqx", "Zzqx", "997", "9931"):
+        assert value not in prefix
+
+
+def test_plan_is_the_final_message():
+    messages = story_messages(1, story_plan(1, "joy", "playing poker", " with his bro JP", 3, 12))
+    assert messages[-1]["role"] == "user"
+    assert "Theme: joy" in messages[-1]["content"]
+    assert "Starting verse: 12" in messages[-1]["content"]
+
+
+def test_other_books_swap_the_protagonist_into_the_prefix():
+    assert cast("Tell me about John.", "Dave") == "Tell me about Dave."
+    assert story_messages(2, "Plan:", "Dave")[0]["content"].count("John") == 0
+
+
+def test_every_stage_starts_with_the_style_guide():
+    for build in stage_builders().values():
+        assert build(PLANS[0])[0] == style_guide_message()
+
+
+def test_style_guide_is_long_enough_to_be_cached():
+    # Even at a conservative 5 characters a token
+    assert len(HOUSE_STYLE_GUIDE) // 5 >= PROVIDER_CACHE_MIN_TOKENS
@@ -0,0 +1,26 @@
+import sqlite3
+
+import pytest
+
+from rate_limit import SharedRateLimiter, run_stress_test
+
+
+def test_processes_sharing_the_limiter_get_no_429s(tmp_path):
+    processes, calls = 3, 25
+    stats = run_stress_test(str(tmp_path / "limiter.sqlite"), processes=processes, calls=calls)
+    assert stats["429"] == 0
+    assert stats["ok"] == processes * calls
+
+
+def test_failed_begin_keeps_its_error(tmp_path):
+    path = str(tmp_path / "limiter.sqlite")
+    limiter = SharedRateLimiter(path)
+    holder = sqlite3.connect(path, isolation_level=None)
+    holder.execute("BEGIN IMMEDIATE")
+    limiter._connect = lambda: sqlite3.connect(path, timeout=0, isolation_level=None)
+    try:
+        with pytest.raises(sqlite3.OperationalError, match="locked"):
+            limiter.acquire("gpt-4.1-mini", 10)
+    finally:
+        holder.execute("ROLLBACK")
+        holder.close()
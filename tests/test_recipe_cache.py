@@ -0,0 +1,71 @@
+import json
+import threading
+
+from recipe_cache import RecipeCache
+
+
+def test_concurrent_saves_keep_every_recipe(tmp_path):
+    path = str(tmp_path / "recipe_cache.json")
+    caches = [RecipeCache(path, reuse_probability=0) for _ in range(4)]
+    for i, cache in enumerate(caches):
+        cache.get_recipe("joy", f"activity {i}", lambda i=i: f"recipe {i}")
+
+    errors = []
+    barrier = threading.Barrier(len(caches))
+
+    def save(cache):
+        barrier.wait()
+        try:
+            cache.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save, args=(cache,)) for cache in caches]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    with open(path) as f:
+        entries = json.load(f)["entries"]
+    assert sorted(entries) == [f"joy|activity {i}" for i in range(4)]
+    assert not [p for p in tmp_path.iterdir() if p.suffix == ".tmp"]
+
+
+def test_save_merges_variants_of_the_same_key(tmp_path):
+    path = str(tmp_path / "recipe_cache.json")
+    first, second = RecipeCache(path, reuse_probability=0), RecipeCache(path, reuse_probability=0)
+    first.get_recipe("joy", "golf", lambda: "old fashioned")
+    second.get_recipe("joy", "golf", lambda: "negroni")
+    first.save()
+    second.save()
+
+    texts = [r["text"] for r in RecipeCache(path)._entries["joy|golf"]["recipes"]]
+    assert sorted(texts) == ["negroni", "old fashioned"]
+
+
+def test_cache_only_lookup(tmp_path):
+    cache = RecipeCache(str(tmp_path / "recipe_cache.json"), reuse_probability=1)
+    assert cache.cached_recipe("joy", "poker") is None
+    cache.get_recipe("joy", "poker", lambda: "Joyful Flush")
+    assert cache.cached_recipe("joy", "poker") == "Joyful Flush"
+    assert cache._refill_threads == []
+
+
+def test_full_fresh_key_is_served_without_model_calls(tmp_path):
+    cache = RecipeCache(str(tmp_path / "recipe_cache.json"), reuse_probability=1, max_variants=2)
+    calls = []
+
+    def generate():
+        calls.append(1)
+        return f"recipe {len(calls)}"
+
+    cache.get_recipe("joy", "poker", generate)      # miss
+    cache.get_recipe("joy", "poker", generate)      # hit, one variant short: refill
+    cache.wait_for_refills()
+    for _ in range(10):
+        cache.get_recipe("joy", "poker", generate)  # full and fresh
+    cache.wait_for_refills()
+    assert len(calls) == 2
+    assert (cache.hits, cache.misses, cache.refills) == (11, 1, 1)
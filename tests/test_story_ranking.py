@@ -0,0 +1,34 @@
+from story_ranking import rank_candidates, score_candidate
+from verse_validator import target_words
+
+VERSES = "1: John poured a cold drink for his bro.\n2: They rolled the dice at midnight.\n3: The house lost again."
+REPEATED = "1: John drank a drink drank a drink.\n2: John drank a drink drank a drink.\n3: John drank a drink."
+
+
+def test_well_formed_story_ranks_first():
+    broken = "John poured a drink and then he kept talking without ever stopping"
+    ranked = rank_candidates([broken, VERSES], 1, 3, 1)
+    assert [story for _, story, _ in ranked] == [VERSES, broken]
+    assert ranked[0][2]["format"] == 1.0
+
+
+def test_repetitive_story_loses_on_diversity():
+    ranked = rank_candidates([REPEATED, VERSES], 1, 3, 1)
+    assert ranked[0][1] == VERSES
+    assert ranked[1][2]["diversity"] < ranked[0][2]["diversity"]
+
+
+def test_story_close_to_a_recent_one_loses_on_novelty():
+    fresh = "1: Under the neon sign John dealt cards.\n2: His bro bet the rent.\n3: Nobody regretted it."
+    _, parts = score_candidate(VERSES, 1, 3, 1, recent_bigrams=[])
+    ranked = rank_candidates([VERSES, fresh], 1, 3, 1, recent_stories=[VERSES])
+    assert ranked[0][1] == fresh
+    assert parts["novelty"] == 1.0
+    assert ranked[1][2]["novelty"] == 0.0
+
+
+def test_target_words():
+    assert target_words(1, 4) == (48, 120)
+    # Three proverbs and their story run longer than a 150-word-capped style
+    assert target_words(3) == (120, 200)
+    assert target_words(5) == (30, 50)
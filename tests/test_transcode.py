@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from transcode import THUMBNAIL_SIZE, transcode_image
+
+
+def illustration(path, size=(1024, 768)):
+    # Smooth gradients with a little noise, like a generated illustration saved as PNG
+    y, x = np.mgrid[0:size[1], 0:size[0]]
+    rgb = np.stack([x * 255 // size[0], y * 255 // size[1], (x + y) * 255 // sum(size)], axis=-1)
+    rgb = rgb + np.random.default_rng(0).integers(0, 8, rgb.shape)
+    Image.fromarray(rgb.clip(0, 255).astype(np.uint8)).save(path, "PNG")
+    return str(path)
+
+
+def test_compact_copy_and_thumbnail(tmp_path):
+    source = illustration(tmp_path / "boj.png")
+    paths = transcode_image(source, str(tmp_path / "out"), "edition1")
+
+    assert paths["original"] == str(tmp_path / "out" / "edition1.png")
+    assert open(paths["original"], "rb").read() == open(source, "rb").read()
+
+    assert os.path.splitext(paths["compact"])[1] in (".webp", ".jpg")
+    assert os.path.getsize(paths["compact"]) < os.path.getsize(source)
+    with Image.open(paths["compact"]) as compact:
+        assert compact.format in ("WEBP", "JPEG")
+        assert compact.size == (1024, 768)
+
+    with Image.open(paths["thumbnail"]) as thumbnail:
+        assert thumbnail.format == "JPEG"
+        assert thumbnail.size == (THUMBNAIL_SIZE, THUMBNAIL_SIZE * 768 // 1024)
+
+    # Only the winning compact format is kept
+    assert sorted(os.listdir(tmp_path / "out")) == sorted(os.path.basename(p) for p in set(paths.values()))
+
+
+def test_source_is_kept_when_nothing_is_smaller(tmp_path):
+    # A 1-bit checkerboard is tiny as PNG and the worst case for lossy codecs
+    source = tmp_path / "checkers.png"
+    checkers = (np.indices((256, 256)).sum(axis=0) % 2 * 255).astype(np.uint8)
+    Image.fromarray(checkers).convert("1").save(source, "PNG", optimize=True)
+    paths = transcode_image(str(source), str(tmp_path / "out"), "checkers")
+    assert paths["compact"] == paths["original"]
+    assert not [name for name in os.listdir(tmp_path / "out") if "-compact" in name]
@@ -0,0 +1,67 @@
+import time
+
+import pytest
+
+import usage_ledger
+from usage_ledger import UsageLedger, normalize_usage
+
+DAY = 86400
+
+
+@pytest.fixture
+def ledger(tmp_path):
+    return UsageLedger(str(tmp_path / "usage.sqlite"))
+
+
+def record_at(ledger, monkeypatch, when, stage, completion_tokens, seconds, calls=6):
+    monkeypatch.setattr(usage_ledger.time, "time", lambda: when)
+    for _ in range(calls):
+        ledger.record(stage, "gpt-4.1-mini", {"prompt_tokens": 1200, "completion_tokens": completion_tokens,
+                                              "prompt_tokens_details": {"cached_tokens": 1024}}, seconds)
+    monkeypatch.undo()
+
+
+def test_normalize_usage_reads_both_apis():
+    responses = {"input_tokens": 10, "output_tokens": 3, "input_tokens_details": {"cached_tokens": 8}}
+    chat = {"prompt_tokens": 10, "completion_tokens": 3, "prompt_tokens_details": {"cached_tokens": 8}}
+    assert normalize_usage(responses) == normalize_usage(chat) == {
+        "prompt_tokens": 10, "completion_tokens": 3, "cached_tokens": 8}
+    assert normalize_usage(None) == {"prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0}
+
+
+def test_drift_report_flags_only_the_drifted_metric(ledger, monkeypatch):
+    now = time.time()
+    record_at(ledger, monkeypatch, now - 5 * DAY, "story", completion_tokens=200, seconds=4.0)
+    record_at(ledger, monkeypatch, now - 3600, "story", completion_tokens=300, seconds=4.2)
+    record_at(ledger, monkeypatch, now - 5 * DAY, "cocktail", completion_tokens=100, seconds=2.0)
+    record_at(ledger, monkeypatch, now - 3600, "cocktail", completion_tokens=100, seconds=2.0)
+
+    assert [(stage, metric) for stage, metric, *_ in ledger.drift_report()] == [("story", "completion_tokens")]
+    stage, metric, baseline, recent, ratio = ledger.drift_report()[0]
+    assert (baseline, recent) == (200, 300)
+    assert ratio == pytest.approx(1.5)
+
+
+def test_drift_needs_enough_calls_and_a_baseline_in_the_window(ledger, monkeypatch):
+    now = time.time()
+    # Too few recent calls
+    record_at(ledger, monkeypatch, now - 5 * DAY, "story", completion_tokens=200, seconds=4.0)
+    record_at(ledger, monkeypatch, now - 3600, "story", completion_tokens=900, seconds=9.0, calls=2)
+    # Baseline older than the baseline window
+    record_at(ledger, monkeypatch, now - 30 * DAY, "image_prompt", completion_tokens=50, seconds=1.0)
+    record_at(ledger, monkeypatch, now - 3600, "image_prompt", completion_tokens=500, seconds=10.0)
+    assert ledger.drift_report() == []
+
+
+def test_rollups(ledger, monkeypatch):
+    now = time.time()
+    record_at(ledger, monkeypatch, now, "story", completion_tokens=200, seconds=4.0, calls=2)
+    record_at(ledger, monkeypatch, now, "cocktail", completion_tokens=100, seconds=2.0, calls=1)
+    by_stage = {row["stage"]: row for row in ledger.rollup("stage")}
+    assert by_stage["story"]["calls"] == 2
+    assert by_stage["story"]["completion_tokens"] == 400
+    assert by_stage["cocktail"]["mean_seconds"] == 2.0
+    assert [row["calls"] for row in ledger.rollup("day")] == [3]
+    assert ledger.cache_report()[0][:3] == ("cocktail", 1, 1024 / 1200)
+    with pytest.raises(ValueError):
+        ledger.rollup("model")
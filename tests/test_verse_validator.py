@@ -0,0 +1,98 @@
+from verse_validator import parse_verses, repair_proverbs, trim_to_word_limit, validate_and_repair, validate_story
+
+
+def test_parses_numbered_verses_run_together():
+    assert parse_verses("1: John poured a drink. 2: He rolled the dice.\n3: He won.") == [
+        "John poured a drink.", "He rolled the dice.", "He won."]
+
+
+def test_unnumbered_story_is_split_into_sentences():
+    story, report = validate_story("John poured a drink. He rolled the dice. The bro laughed.", 1, 3, 12)
+    assert story == "12: John poured a drink.\n13: He rolled the dice.\n14: The bro laughed."
+    assert report["missing"] == 0
+
+
+def test_missing_verse_number():
+    story, report = validate_story("1: John poured a drink.\nHe rolled the dice.\n3: He won.", 1, 3, 1)
+    assert story == "1: John poured a drink.\n2: He rolled the dice.\n3: He won."
+    assert report == {"problems": ["renumbered verses"], "missing": 0, "failed": False}
+
+
+def test_wrapped_verse_is_continued():
+    story, _ = validate_story("1: John poured a drink for\nhis bro.\n2: He rolled the dice.", 1, 2, 1)
+    assert story == "1: John poured a drink for his bro.\n2: He rolled the dice."
+
+
+def test_duplicate_verse():
+    story, report = validate_story("1: John poured a drink.\n2: He rolled the dice.\n2: He rolled the dice.\n"
+                                   "3: He won.", 1, 3, 1)
+    assert story == "1: John poured a drink.\n2: He rolled the dice.\n3: He won."
+    assert "removed duplicate verse" in report["problems"]
+
+
+def test_wrong_start():
+    story, report = validate_story("1: John sipped.\n2: Bilinski dealt.\n3: Nobody slept.", 1, 3, 40)
+    assert story == "40: John sipped.\n41: Bilinski dealt.\n42: Nobody slept."
+    assert report == {"problems": ["renumbered verses"], "missing": 0, "failed": False}
+
+
+def test_trailing_chatty_line():
+    story, report = validate_story("Here is your story:\n\n5: John sipped.\n6: Bilinski dealt.\n\n"
+                                   "Let me know if you'd like more verses!", 1, 2, 5)
+    assert story == "5: John sipped.\n6: Bilinski dealt."
+    assert report["missing"] == 0
+
+
+def test_decimal_is_not_a_verse_number():
+    story, report = validate_story("7: John won the pot.\n8: It came to\n3.5 million chips.\n9: He bought a round.",
+                                   1, 3, 7)
+    assert story == "7: John won the pot.\n8: It came to 3.5 million chips.\n9: He bought a round."
+    assert report["missing"] == 0
+    assert parse_verses("1: The bar opened.\n3:30 came and went.") == ["The bar opened.", "3:30 came and went."]
+
+
+def test_missing_verses_are_counted():
+    story, report = validate_story("1: John sipped.", 1, 3, 1)
+    assert story == "1: John sipped."
+    assert report["missing"] == 2
+
+
+def test_proverbs_are_renumbered_and_trimmed():
+    story, problems, missing = repair_proverbs(
+        '1. "Wine forgives."\n2. "Dice remember."\n3. "Luck is a tab."\n"One too many."', 3)
+    assert story == '"Wine forgives."\n\n"Dice remember."\n\n"Luck is a tab."'
+    assert problems == ["removed proverb numbering", "trimmed extra proverb"]
+    assert missing == 0
+
+
+def test_word_limit_trims_whole_sentences():
+    story, problems = trim_to_word_limit(" ".join(["John bet the house on red."] * 40), 50, "sentence")
+    assert len(story.split()) <= 50
+    assert story.endswith("red.")
+    assert problems
+
+
+def test_word_limit_keeps_paragraph_breaks():
+    paragraph = " ".join(["John bet the house on red."] * 4)
+    story, _ = trim_to_word_limit("\n\n".join([paragraph] * 3), 50, "sentence")
+    assert story == f"{paragraph}\n\n{paragraph}"
+
+
+def test_only_rule_breaking_stories_repaired_locally_save_a_call():
+    def saved(story, style, number_verses=None, starting_verse=None, create_completion=None):
+        return validate_and_repair(create_completion, story, style, number_verses, starting_verse)[1]["calls_saved"]
+
+    # Too many verses, proverbs or words would have been regenerated
+    assert saved("1: John poured a drink.\n2: He rolled the dice.\n3: He won.\n4: Extra verse.", 1, 3, 1) == 1
+    assert saved('"Wine forgives."\n"Dice remember."\n"Luck is a tab."\n"One too many."', 3) == 1
+    assert saved(" ".join(["John bet the house on red."] * 40), 4) == 1
+    # Renumbering alone would have passed anyway
+    assert saved("1: John sipped.\n2: Bilinski dealt.", 1, 2, 40) == 0
+    # Still short, or filled in by a completion call
+    assert saved("1: John sipped.", 1, 3, 1) == 0
+
+    class Completion:
+        def __init__(self, text):
+            self.choices = [type("Choice", (), {"message": type("Message", (), {"content": text})})]
+
+    assert saved("1: John sipped.", 1, 2, 1, lambda **kwargs: Completion("Bilinski dealt.")) == 0
@@ -0,0 +1,115 @@
+import os
+import shutil
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+from PIL import Image
+
+# WebP at this quality is visually lossless for the illustrations we generate
+COMPACT_QUALITY = 90
+THUMBNAIL_SIZE = 320
+
+
+def transcode_image(image_path, out_dir, name):
+    """
+    Writes a compact copy and a thumbnail of a generated image, and archives the original.
+
+    The compact copy is WebP unless the JPEG comes out smaller; if neither
+    beats the source file, the source is used as the compact copy.
+
+    Args:
+        image_path (str): The generated image.
+        out_dir (str): Where the original, compact copy and thumbnail go.
+        name (str): Base file name, e.g. the edition id.
+
+    Returns:
+        dict: Paths of the "original", "compact" and "thumbnail" files.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    original_path = os.path.join(out_dir, name + os.path.splitext(image_path)[1])
+    shutil.copyfile(image_path, original_path)
+
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+
+        candidates = []
+        for image_format, ext in (("WEBP", ".webp"), ("JPEG", ".jpg")):
+            path = os.path.join(out_dir, f"{name}-compact{ext}")
+            image.save(path, format=image_format, quality=COMPACT_QUALITY, optimize=True)
+            candidates.append(path)
+        candidates.sort(key=os.path.getsize)
+        compact_path = candidates[0]
+        for path in candidates[1:]:
+            os.remove(path)
+        if os.path.getsize(compact_path) >= os.path.getsize(original_path):
+            os.remove(compact_path)
+            compact_path = original_path
+
+        thumbnail_path = os.path.join(out_dir, f"{name}-thumb.jpg")
+        image.thumbnail((THUMBNAIL_SIZE, THUMBNAIL_SIZE), Image.LANCZOS)
+        image.save(thumbnail_path, format="JPEG", quality=80, optimize=True)
+
+    return {
+        "original": original_path,
+        "compact": compact_path,
+        "thumbnail": thumbnail_path,
+    }
+
+
+class _MockUploadHandler(BaseHTTPRequestHandler):
+    """
+    Accepts POSTed bytes like an image host would, throttled to a fixed bandwidth.
+    """
+
+    bytes_per_second = 2_000_000
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        remaining = length
+        while remaining:
+            chunk = self.rfile.read(min(remaining, 65536))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+        time.sleep(length / self.bytes_per_second)
+        self.send_response(200)
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def benchmark_upload(image_path, out_dir):
+    """
+    Uploads the original and the compact copy to a local mock host and
+    prints bytes and time for each.
+    """
+    import requests
+
+    server = HTTPServer(("127.0.0.1", 0), _MockUploadHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    url = f"http://127.0.0.1:{server.server_port}/upload"
+
+    start = time.perf_counter()
+    paths = transcode_image(image_path, out_dir, "bench")
+    print(f"transcode: {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    for label in ("original", "compact", "thumbnail"):
+        with open(paths[label], "rb") as f:
+            data = f.read()
+        start = time.perf_counter()
+        requests.post(url, data=data)
+        print(f"{label}: {len(data)} bytes, upload {time.perf_counter() - start:.2f}s")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 3:
+        print("usage: python transcode.py <image> <out dir>")
+        sys.exit(1)
+    benchmark_upload(sys.argv[1], sys.argv[2])
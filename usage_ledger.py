@@ -0,0 +1,199 @@
+import os
+import sqlite3
+import sys
+import time
+from contextlib import closing
+
+# Days of history a stage is compared against, and the recent window compared
+BASELINE_DAYS = 14
+RECENT_DAYS = 1
+
+# A stage has drifted when its recent mean is this many times its baseline
+DRIFT_THRESHOLD = 1.25
+
+# Calls needed in both windows before a stage is judged
+MIN_CALLS = 5
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    time REAL NOT NULL,
+    day TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    model TEXT NOT NULL,
+    prompt_tokens INTEGER NOT NULL,
+    completion_tokens INTEGER NOT NULL,
+    cached_tokens INTEGER NOT NULL,
+    seconds REAL NOT NULL,
+    truncated INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS calls_time ON calls (time);
+"""
+
+
+def normalize_usage(usage):
+    """
+    Maps chat completions and responses API usage onto one set of fields.
+
+    Args:
+        usage (dict): The response's usage, e.g. from model_router.usage_dict.
+
+    Returns:
+        dict: prompt_tokens, completion_tokens and cached_tokens.
+    """
+    usage = usage or {}
+    details = usage.get("prompt_tokens_details") or usage.get("input_tokens_details") or {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens", usage.get("input_tokens")) or 0,
+        "completion_tokens": usage.get("completion_tokens", usage.get("output_tokens")) or 0,
+        "cached_tokens": details.get("cached_tokens") or 0,
+    }
+
+
+class UsageLedger:
+    """
+    Persistent SQLite record of the tokens and time every OpenAI call used.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with closing(self._connect()) as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        db.row_factory = sqlite3.Row
+        db.execute("PRAGMA journal_mode=WAL")
+        return db
+
+    def record(self, stage, model, usage, seconds, truncated=False):
+        """
+        Adds one call to the ledger.
+
+        Args:
+            stage (str): The pipeline stage, e.g. "story".
+            model (str): The model called.
+            usage (dict): The response's usage.
+            seconds (float): How long the call took.
+            truncated (bool): Whether the output hit its token budget.
+        """
+        now = time.time()
+        tokens = normalize_usage(usage)
+        with closing(self._connect()) as db:
+            db.execute(
+                "INSERT INTO calls (time, day, stage, model, prompt_tokens, completion_tokens, cached_tokens, "
+                "seconds, truncated) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (now, time.strftime("%Y-%m-%d", time.localtime(now)), stage, model, tokens["prompt_tokens"],
+                 tokens["completion_tokens"], tokens["cached_tokens"], seconds, int(truncated)),
+            )
+
+    def rollup(self, by="day", since=None):
+        """
+        Sums calls per day or per stage.
+
+        Args:
+            by (str): "day" or "stage".
+            since (float): Only calls after this timestamp.
+
+        Returns:
+            list: Row dicts with calls, tokens, truncations and mean seconds.
+        """
+        if by not in ("day", "stage"):
+            raise ValueError("Invalid rollup. Please use 'day' or 'stage'.")
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                f"SELECT {by}, COUNT(*) AS calls, SUM(prompt_tokens) AS prompt_tokens, "
+                f"SUM(completion_tokens) AS completion_tokens, SUM(cached_tokens) AS cached_tokens, "
+                f"SUM(truncated) AS truncated, AVG(seconds) AS mean_seconds "
+                f"FROM calls WHERE time >= ? GROUP BY {by} ORDER BY {by}",
+                (since or 0,),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def cache_report(self, since=None):
+        """
+        Prompt-prefix cache hit ratio per stage, and the mean latency of calls
+        that hit the cache next to those that missed it.
+
+        Returns:
+            list: (stage, calls, cached share of prompt tokens, mean seconds hit, mean seconds miss)
+        """
+        with closing(self._connect()) as db:
+            rows = db.execute(
+                "SELECT stage, COUNT(*) AS calls, SUM(prompt_tokens) AS prompt_tokens, "
+                "SUM(cached_tokens) AS cached_tokens, "
+                "AVG(CASE WHEN cached_tokens > 0 THEN seconds END) AS seconds_hit, "
+                "AVG(CASE WHEN cached_tokens = 0 THEN seconds END) AS seconds_miss "
+                "FROM calls WHERE time >= ? GROUP BY stage ORDER BY stage",
+                (since or 0,),
+            ).fetchall()
+        return [
+            (row["stage"], row["calls"], row["cached_tokens"] / row["prompt_tokens"] if row["prompt_tokens"] else 0.0,
+             row["seconds_hit"], row["seconds_miss"])
+            for row in rows
+        ]
+
+    def drift_report(self, baseline_days=BASELINE_DAYS, recent_days=RECENT_DAYS, threshold=DRIFT_THRESHOLD):
+        """
+        Flags stages whose recent completion tokens or latency run above
+        their baseline.
+
+        The baseline is the `baseline_days` before the recent window, so a
+        drift does not dilute its own baseline.
+
+        Returns:
+            list: (stage, metric, baseline mean, recent mean, ratio) for each drifted metric.
+        """
+        now = time.time()
+        recent_start = now - recent_days * 86400
+        baseline_start = recent_start - baseline_days * 86400
+        query = ("SELECT stage, COUNT(*) AS calls, AVG(completion_tokens) AS completion_tokens, "
+                 "AVG(seconds) AS seconds FROM calls WHERE time >= ? AND time < ? GROUP BY stage")
+        with closing(self._connect()) as db:
+            baseline = {row["stage"]: row for row in db.execute(query, (baseline_start, recent_start))}
+            recent = {row["stage"]: row for row in db.execute(query, (recent_start, now + 1))}
+
+        drifted = []
+        for stage, row in sorted(recent.items()):
+            base = baseline.get(stage)
+            if base is None or base["calls"] < MIN_CALLS or row["calls"] < MIN_CALLS:
+                continue
+            for metric in ("completion_tokens", "seconds"):
+                if base[metric] and row[metric] / base[metric] >= threshold:
+                    drifted.append((stage, metric, base[metric], row[metric], row[metric] / base[metric]))
+        return drifted
+
+
+def print_report(ledger):
+    """
+    Prints the daily and per-stage rollups, prompt cache hits and any drifting stages.
+    """
+    print("day         calls  prompt  completion  cached  truncated  mean s")
+    for row in ledger.rollup("day"):
+        print(f"{row['day']}  {row['calls']:5d}  {row['prompt_tokens']:6d}  {row['completion_tokens']:10d}  "
+              f"{row['cached_tokens']:6d}  {row['truncated']:9d}  {row['mean_seconds']:6.2f}")
+    print()
+    print("stage         calls  prompt  completion  cached  truncated  mean s")
+    for row in ledger.rollup("stage"):
+        print(f"{row['stage']:<12}  {row['calls']:5d}  {row['prompt_tokens']:6d}  {row['completion_tokens']:10d}  "
+              f"{row['cached_tokens']:6d}  {row['truncated']:9d}  {row['mean_seconds']:6.2f}")
+    print()
+    print("stage         calls  cache hit  mean s hit  mean s miss")
+    for stage, calls, hit_ratio, seconds_hit, seconds_miss in ledger.cache_report():
+        hit = f"{seconds_hit:10.2f}" if seconds_hit is not None else f"{'-':>10}"
+        miss = f"{seconds_miss:11.2f}" if seconds_miss is not None else f"{'-':>11}"
+        print(f"{stage:<12}  {calls:5d}  {hit_ratio:9.1%}  {hit}  {miss}")
+    print()
+    drifted = ledger.drift_report()
+    if not drifted:
+        print("no drift")
+    for stage, metric, baseline, recent, ratio in drifted:
+        print(f"DRIFT {stage} {metric}: {baseline:.1f} -> {recent:.1f} ({ratio:.2f}x baseline)")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print("usage: python usage_ledger.py <ledger.sqlite>")
+        sys.exit(1)
+    print_report(UsageLedger(sys.argv[1]))
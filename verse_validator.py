@@ -0,0 +1,331 @@
+import re
+import time
+
+# What each content style (see CONTENT_STYLES in boj2.py) promises in its prompt
+# and the (low, high) word count its story should land in, per verse for style 1
+STYLE_RULES = {
+    1: {"unit": "verse", "words": (12, 30)},                         # exactly number_verses numbered sentences
+    2: {"unit": "line", "max_words": 150, "words": (90, 150)},       # Psalm
+    3: {"unit": "proverb", "proverbs": 3, "words": (120, 200)},      # 3 quoted proverbs, two new lines apart
+    4: {"unit": "sentence", "max_words": 150, "words": (90, 150)},   # Parable
+    5: {"unit": "line", "max_words": 50, "words": (30, 50)},         # Poem
+    6: {"unit": "sentence", "max_words": 150, "words": (90, 150)},   # Jests
+}
+
+_SENTENCE_SPLIT_RE = re.compile(r'(?<=[.!?])\s+|(?<=[.!?]["”’)])\s+')
+# The number must not run on into more digits, so "3.5 million" or "3:30" doesn't start verse 3
+_NUMBERED_LINE_RE = re.compile(r'^\s*\**\s*(\d+)\s*\**\s*[:.)-](?!\d)\s*\**\s*(.*?)\s*$')
+_INLINE_NUMBER_RE = re.compile(r'(?<=[.!?])[ \t]+(\d+:\s)')
+_QUOTE_RE = re.compile(r'["“]([^"”\n]+)["”]')
+_LIST_PREFIX_RE = re.compile(r'^\s*(?:\d+\s*[:.)-]|[-*•])\s*')
+# The model talking to the reader instead of writing, e.g. "Here is your story:" or "Let me know if..."
+_CHATTER_RE = re.compile(
+    r"^\s*(here('s| is| are)\b.*:|(let me know|i hope|hope you|feel free|would you like|want me to)\b.*"
+    r"|enjoy\b.*!|-{3,}|\*{3,})\s*$", re.I)
+_VERSE_END = ('.', '!', '?', '"', '”', '’', ')')
+# Repairs that only tidy the layout; a story needing nothing else would have passed as it was
+_COSMETIC_PROBLEMS = ("renumbered verses", "removed proverb numbering", "fixed proverb line breaks")
+
+
+def split_sentences(text):
+    """
+    Splits text into sentences on terminal punctuation.
+
+    Args:
+        text (str): The text to split.
+
+    Returns:
+        list: The non-empty sentences.
+    """
+    return [s.strip() for s in _SENTENCE_SPLIT_RE.split(text.strip()) if s.strip()]
+
+
+def target_words(content_style, number_verses=None):
+    """
+    Args:
+        content_style (int): The selected content style (1-6).
+        number_verses (int): The number of verses asked for (style 1 only).
+
+    Returns:
+        tuple: (low, high) word counts a story in the style should land in.
+    """
+    low, high = STYLE_RULES[content_style]["words"]
+    if STYLE_RULES[content_style]["unit"] == "verse":
+        return low * (number_verses or 3), high * (number_verses or 3)
+    return low, high
+
+
+def parse_verses(story):
+    """
+    Parses a style 1 story into its verses, with or without numbering.
+
+    Numbered lines each start a verse. An unnumbered line continues the
+    verse before it if that verse is unfinished, and is a verse of its own
+    (one the model forgot to number) if not. Lines addressed to the reader
+    are dropped. A story without any numbering is split into sentences
+    instead.
+
+    Args:
+        story (str): The generated story.
+
+    Returns:
+        list: The verse texts, without their numbers.
+    """
+    verses = []
+    numbered = False
+    # Put verses the model ran together ("1: ... 2: ...") back on their own lines
+    story = _INLINE_NUMBER_RE.sub(r"\n\1", story)
+    for line in story.splitlines():
+        if not line.strip() or _CHATTER_RE.match(line):
+            continue
+        match = _NUMBERED_LINE_RE.match(line)
+        if match and match.group(2):
+            numbered = True
+            verses.append(match.group(2))
+        elif verses and numbered and not verses[-1].endswith(_VERSE_END):
+            verses[-1] = f"{verses[-1]} {line.strip()}"
+        else:
+            verses.append(line.strip())
+
+    if not numbered:
+        return split_sentences(" ".join(verses))
+    return verses
+
+
+def format_verses(verses, starting_verse):
+    return "\n".join(f"{starting_verse + i}: {verse}" for i, verse in enumerate(verses))
+
+
+def repair_verses(story, number_verses, starting_verse):
+    """
+    Renumbers, re-breaks and trims a style 1 story.
+
+    Returns:
+        tuple: (repaired story, list of problems found, number of missing verses)
+    """
+    problems = []
+    verses = []
+    for verse in parse_verses(story):
+        if verse.lower() in (v.lower() for v in verses):
+            problems.append("removed duplicate verse")
+            continue
+        verses.append(verse)
+
+    if len(verses) > number_verses:
+        problems.append(f"trimmed {len(verses) - number_verses} extra verses")
+        verses = verses[:number_verses]
+    missing = max(0, number_verses - len(verses))
+    if missing:
+        problems.append(f"missing {missing} verses")
+
+    repaired = format_verses(verses, starting_verse)
+    if repaired != story.strip() and not problems:
+        problems.append("renumbered verses")
+    return repaired, problems, missing
+
+
+def repair_proverbs(story, count):
+    """
+    Normalizes a style 3 story to `count` quoted proverbs separated by blank lines.
+
+    Returns:
+        tuple: (repaired story, list of problems found, number of missing proverbs)
+    """
+    problems = []
+    paragraphs = []
+    for line in story.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        stripped = _LIST_PREFIX_RE.sub("", line)
+        if stripped != line and _QUOTE_RE.search(stripped) and "removed proverb numbering" not in problems:
+            problems.append("removed proverb numbering")
+        paragraphs.append(stripped if _QUOTE_RE.search(stripped) else line)
+
+    # A paragraph that is nothing but a quote is a proverb; drop any beyond `count`
+    kept = []
+    proverbs = 0
+    for paragraph in paragraphs:
+        is_proverb = _QUOTE_RE.fullmatch(paragraph.rstrip(".")) is not None
+        quotes = len(_QUOTE_RE.findall(paragraph))
+        if is_proverb and proverbs >= count:
+            problems.append("trimmed extra proverb")
+            continue
+        proverbs += quotes
+        kept.append(paragraph)
+
+    repaired = "\n\n".join(kept)
+    if repaired != story.strip() and not problems:
+        problems.append("fixed proverb line breaks")
+    missing = max(0, count - proverbs)
+    if missing:
+        problems.append(f"missing {missing} proverbs")
+    return repaired, problems, missing
+
+
+def trim_to_word_limit(story, max_words, unit):
+    """
+    Drops whole trailing lines or sentences until the story fits `max_words`.
+
+    The story is cut at a line or sentence boundary, so the line and
+    paragraph breaks it keeps are left as they were.
+
+    Returns:
+        tuple: (repaired story, list of problems found)
+    """
+    if len(story.split()) <= max_words:
+        return story, []
+
+    text = story.strip()
+    boundaries = re.finditer(r"\n", text) if unit == "line" else _SENTENCE_SPLIT_RE.finditer(text)
+    ends = [match.start() for match in boundaries] + [len(text)]
+
+    cut = None
+    words = 0
+    start = 0
+    for end in ends:
+        piece_words = len(text[start:end].split())
+        if cut is not None and words + piece_words > max_words:
+            break
+        cut = end
+        words += piece_words
+        start = end
+
+    # Don't leave a dangling blank line at the end of a verse/stanza
+    repaired = text[:cut].rstrip()
+    return repaired, [f"trimmed to {words} words (limit {max_words})"]
+
+
+def validate_story(story, content_style, number_verses=None, starting_verse=None):
+    """
+    Checks a generated story against its content style and repairs it locally.
+
+    Args:
+        story (str): The generated story.
+        content_style (int): The selected content style (1-6).
+        number_verses (int): The number of verses asked for (style 1 only).
+        starting_verse (int): The starting verse number (style 1 only).
+
+    Returns:
+        tuple: (repaired story, report dict with "problems", "missing" and
+            "failed", whether the story as written broke the style's rules)
+    """
+    rules = STYLE_RULES.get(content_style)
+    if rules is None:
+        raise ValueError("Invalid content style.")
+
+    missing = 0
+    if rules["unit"] == "verse":
+        story, problems, missing = repair_verses(story, number_verses, starting_verse)
+    elif rules["unit"] == "proverb":
+        story, problems, missing = repair_proverbs(story, rules["proverbs"])
+    else:
+        story, problems = trim_to_word_limit(story, rules["max_words"], rules["unit"])
+
+    failed = any(not problem.startswith(_COSMETIC_PROBLEMS) for problem in problems)
+    return story, {"problems": problems, "missing": missing, "failed": failed}
+
+
+def complete_missing(create_completion, story, content_style, missing):
+    """
+    Asks a cheap model for only the verses or proverbs that are missing.
+
+    Args:
+        create_completion (callable): Creates a chat completion and picks its model, e.g.
+            boj2.repair_completion, so the call is routed, rate limited and accounted for.
+        story (str): The story so far.
+        content_style (int): The selected content style (1 or 3).
+        missing (int): How many verses or proverbs to add.
+
+    Returns:
+        list: The new verses or proverbs, at most `missing` of them.
+    """
+    if content_style == 1:
+        request = (f"Continue this story with exactly {missing} more sentences. "
+                   f"Reply with only the new sentences, one per line, without numbers.")
+    else:
+        request = (f"Write {missing} more short, insightful proverbs in the same voice. "
+                   f"Each proverb should be a single sentence, in quotes. "
+                   f"Reply with only the proverbs, one per line.")
+
+    response = create_completion(
+        messages=[
+            {"role": "assistant", "content": story},
+            {"role": "user", "content": request},
+        ],
+        temperature=1,
+        max_tokens=60 * missing,
+    )
+    text = response.choices[0].message.content
+
+    if content_style == 1:
+        return parse_verses(text)[:missing]
+    return [f"\"{quote}\"" for quote in _QUOTE_RE.findall(text)][:missing]
+
+
+def validate_and_repair(create_completion, story, content_style, number_verses=None, starting_verse=None):
+    """
+    Validation stage run after generate_gpt_story.
+
+    Repairs the story locally where it can and makes a single targeted
+    completion call for anything that is still missing, instead of
+    regenerating the whole edition.
+
+    Returns:
+        tuple: (story, report dict)
+    """
+    start = time.perf_counter()
+    repaired, report = validate_story(story, content_style, number_verses, starting_verse)
+    report["parse_ms"] = round((time.perf_counter() - start) * 1000, 3)
+    report["completion_calls"] = 0
+
+    if report["missing"] and create_completion is not None:
+        try:
+            additions = complete_missing(create_completion, repaired, content_style, report["missing"])
+        except Exception as e:
+            print(f"Targeted completion failed: {e}")
+            additions = []
+        report["completion_calls"] = 1
+
+        if content_style == 1:
+            verses = parse_verses(repaired) + additions
+            repaired = format_verses(verses, starting_verse)
+        else:
+            repaired = "\n\n".join([repaired] + additions)
+        report["missing"] -= len(additions)
+
+    # A story that broke its rules and was put right without any model call would otherwise have been regenerated
+    report["calls_saved"] = int(report["failed"] and not report["missing"] and not report["completion_calls"])
+    return repaired, report
+
+
+def run_benchmark(iterations=2000):
+    """
+    Times local parse/repair over a set of malformed samples and counts the
+    model calls that repairing them locally avoids.
+    """
+    samples = [
+        (1, "1: John poured a drink. 2: He rolled the dice.\n3: He won.\n4: Extra verse.", 3, 400),
+        (1, "John poured a drink. He rolled the dice. The bro laughed.", 3, 12),
+        (1, "**12.** John sipped.\n**13.** Bilinski dealt.\n\n**14.** Nobody slept.", 3, 12),
+        (3, '1. "Wine forgives."\n2. "Dice remember."\n3. "Luck is a tab."\nAnd so it was.', 3, None),
+        (3, '"Wine forgives."\n"Dice remember."\n"Luck is a tab."\n"One too many."', 3, None),
+        (4, " ".join(["John bet the house on red."] * 40), None, None),
+        (5, "\n".join(["the glass is empty and so am i"] * 10), None, None),
+    ]
+
+    calls_saved = 0
+    start = time.perf_counter()
+    for _ in range(iterations):
+        for style, story, number_verses, starting_verse in samples:
+            _, report = validate_and_repair(None, story, style, number_verses, starting_verse)
+            calls_saved += report["calls_saved"]
+    elapsed = time.perf_counter() - start
+
+    runs = iterations * len(samples)
+    print(f"validated {runs} stories in {elapsed:.3f}s ({elapsed / runs * 1e6:.1f} us/story)")
+    print(f"model calls saved per pass: {calls_saved // iterations} of {len(samples)} samples")
+
+
+if __name__ == "__main__":
+    run_benchmark()